@@ -0,0 +1,131 @@
+from __future__ import annotations
+
+from typing import Any, AsyncIterator, Awaitable, Callable, List
+
+import asyncpg
+import contextlib
+import statistics
+import sys
+import time
+
+# Run from the repository root: `python -m benchmarks.<name> [dsn]`, the dsn defaults to `config.DATABASE`.
+# Benchmarks that don't touch the database don't take a dsn.
+
+# Same tables as after migration 0005, plus the users.pokemons array dropped by 0004 when `with_array` is set
+SCHEMA = '''
+CREATE EXTENSION IF NOT EXISTS "uuid-ossp";
+CREATE TABLE users (
+    id BIGINT PRIMARY KEY,
+    credits BIGINT NOT NULL DEFAULT 100,
+    catch_id BIGINT DEFAULT 1,
+    selected BIGINT DEFAULT 1,
+    {array}
+    detailed_pokemon_view BOOLEAN DEFAULT FALSE,
+    redeems INT DEFAULT 0
+);
+CREATE TABLE pokemons (
+    id UUID PRIMARY KEY DEFAULT uuid_generate_v4(),
+    catch_id BIGINT NOT NULL,
+    dex_id BIGINT NOT NULL,
+    owner_id BIGINT NOT NULL,
+    nickname TEXT,
+    level INT DEFAULT 1,
+    exp INT DEFAULT 0,
+    ivs INT[6] NOT NULL,
+    evs INT[6] NOT NULL,
+    moves TEXT[4] NOT NULL,
+    nature TEXT,
+    is_shiny BOOLEAN DEFAULT FALSE,
+    is_starter BOOLEAN DEFAULT FALSE,
+    is_favourite BOOLEAN DEFAULT FALSE,
+    is_listed BOOLEAN DEFAULT FALSE
+);
+CREATE INDEX ON pokemons (owner_id, dex_id);
+CREATE INDEX ON pokemons (dex_id);
+CREATE INDEX ON pokemons (owner_id, catch_id);
+'''
+
+INSERT_POKEMON = (
+    'INSERT INTO pokemons(catch_id, dex_id, owner_id, nickname, ivs, evs, moves, nature) '
+    "VALUES($1, $2, $3, 'Bulbasaur', '{1,2,3,4,5,6}', '{0,0,0,0,0,0}', '{tackle,NULL,NULL,NULL}', 'Hardy') "
+    'RETURNING id'
+)
+
+def get_dsn() -> str:
+    if len(sys.argv) > 1:
+        return sys.argv[1]
+
+    import config # type: ignore
+    return config.DATABASE
+
+async def describe(conn: asyncpg.Connection) -> str:
+    # Printed above the results, numbers are meaningless without knowing what they were measured against
+    version = await conn.fetchval('SHOW server_version')
+    return f'PostgreSQL {version}, asyncpg {asyncpg.__version__}, Python {sys.version.split()[0]}'
+
+@contextlib.asynccontextmanager
+async def scratch_schema(conn: asyncpg.Connection, name: str, *, with_array: bool) -> AsyncIterator[None]:
+    # Everything lives in its own schema, which gets dropped afterwards
+    await conn.execute(f'DROP SCHEMA IF EXISTS {name} CASCADE')
+    await conn.execute(f'CREATE SCHEMA {name}')
+    await conn.execute(f'SET search_path TO {name}, public')
+
+    try:
+        await conn.execute(SCHEMA.format(array='pokemons UUID[],' if with_array else ''))
+        yield
+    finally:
+        await conn.execute('SET search_path TO DEFAULT')
+        await conn.execute(f'DROP SCHEMA IF EXISTS {name} CASCADE')
+
+async def add_user(conn: asyncpg.Connection, user_id: int, count: int, *, with_array: bool) -> None:
+    await conn.execute('INSERT INTO users(id, catch_id) VALUES($1, $2)', user_id, count)
+    await conn.execute(
+        'INSERT INTO pokemons(catch_id, dex_id, owner_id, nickname, ivs, evs, moves, nature) '
+        "SELECT i, 1 + i % 800, $1, 'Bulbasaur', '{1,2,3,4,5,6}', '{0,0,0,0,0,0}', '{tackle,NULL,NULL,NULL}', 'Hardy' "
+        'FROM generate_series(1, $2) AS i',
+        user_id, count
+    )
+
+    if with_array:
+        await conn.execute(
+            'UPDATE users SET pokemons = ARRAY(SELECT id FROM pokemons WHERE owner_id = $1 ORDER BY catch_id) '
+            'WHERE id = $1',
+            user_id
+        )
+
+    await conn.execute('VACUUM ANALYZE users')
+    await conn.execute('VACUUM ANALYZE pokemons')
+
+async def measure(runs: int, func: Callable[[int], Awaitable[Any]]) -> List[float]:
+    timings: List[float] = []
+    for run in range(runs):
+        start = time.perf_counter()
+        await func(run)
+        timings.append(time.perf_counter() - start)
+
+    return timings
+
+def measure_sync(runs: int, func: Callable[[int], Any]) -> List[float]:
+    # Same as `measure` for the benchmarks that don't need a database
+    timings: List[float] = []
+    for run in range(runs):
+        start = time.perf_counter()
+        func(run)
+        timings.append(time.perf_counter() - start)
+
+    return timings
+
+def format_duration(seconds: float) -> str:
+    if seconds < 0.001:
+        return f'{seconds * 1_000_000:.2f}us'
+
+    return f'{seconds * 1000:.2f}ms'
+
+def summarize(name: str, timings: List[float]) -> str:
+    ordered = sorted(timings)
+    p95 = ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))]
+
+    return (
+        f'{name}: median {format_duration(statistics.median(ordered))}, p95 {format_duration(p95)}, '
+        f'max {format_duration(ordered[-1])} over {len(ordered)} runs'
+    )
@@ -0,0 +1,54 @@
+from __future__ import annotations
+
+import asyncio
+import asyncpg
+
+from benchmarks._common import INSERT_POKEMON, add_user, describe, get_dsn, measure, scratch_schema, summarize
+from src.database.statements import QUERIES
+
+# Catch latency of a user that already owns USER_SIZE pokemons, with and without the users.pokemons array (0004)
+USER_SIZE = 50000
+RUNS = 200
+USER_ID = 1
+
+# What `UserPokemon.save` ran on every catch before 0004
+BEFORE = 'UPDATE users SET pokemons = ARRAY_APPEND(users.pokemons, CAST($1 as UUID)), catch_id = $2 WHERE id = $3'
+AFTER = QUERIES['users.set_catch_id']
+
+async def run(conn: asyncpg.Connection, *, with_array: bool) -> str:
+    async with scratch_schema(conn, 'bench_catch', with_array=with_array):
+        await add_user(conn, USER_ID, USER_SIZE, with_array=with_array)
+
+        async def catch(run: int) -> None:
+            catch_id = USER_SIZE + run + 1
+            pokemon_id = await conn.fetchval(INSERT_POKEMON, catch_id, 1, USER_ID)
+
+            if with_array:
+                await conn.execute(BEFORE, str(pokemon_id), catch_id, USER_ID)
+            else:
+                await conn.execute(AFTER, catch_id, USER_ID)
+
+        timings = await measure(RUNS, catch)
+
+        # Both paths must have left the user in the same state
+        catch_id = await conn.fetchval('SELECT catch_id FROM users WHERE id = $1', USER_ID)
+        owned = await conn.fetchval('SELECT COUNT(*) FROM pokemons WHERE owner_id = $1', USER_ID)
+        assert catch_id == owned == USER_SIZE + RUNS, (catch_id, owned)
+        if with_array:
+            size = await conn.fetchval('SELECT CARDINALITY(pokemons) FROM users WHERE id = $1', USER_ID)
+            assert size == owned, (size, owned)
+
+        return summarize('before (users.pokemons array)' if with_array else 'after (owner_id only)', timings)
+
+async def main() -> None:
+    conn = await asyncpg.connect(get_dsn())
+    try:
+        print(await describe(conn))
+        print(f'Catch latency for a user with {USER_SIZE} pokemons, {RUNS} catches each:')
+        print(await run(conn, with_array=True))
+        print(await run(conn, with_array=False))
+    finally:
+        await conn.close()
+
+if __name__ == '__main__':
+    asyncio.run(main())
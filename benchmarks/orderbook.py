@@ -0,0 +1,92 @@
+from __future__ import annotations
+
+from typing import List, Tuple
+
+import random
+import sys
+
+from benchmarks._common import measure_sync, summarize
+from src.utils.orderbook import OrderBook
+
+# Order book operations on a single species with BOOK_SIZE listings, against sorting every listing (what
+# `market search --sort price` did before the order book)
+BOOK_SIZE = 100_000
+# add and remove are timed in batches, a single call is too close to the timer's resolution
+BATCH = 1000
+RUNS = 200
+MAX_PRICE = 1_000_000
+
+def make_listings(rng: random.Random) -> List[Tuple[int, int]]:
+    # (id, price)
+    return [(id, rng.randint(1, MAX_PRICE)) for id in range(BOOK_SIZE)]
+
+def make_book(listings: List[Tuple[int, int]]) -> OrderBook:
+    book = OrderBook()
+    for id, price in listings:
+        book.add(id, price)
+
+    return book
+
+def bench_add(listings: List[Tuple[int, int]]) -> str:
+    book = OrderBook()
+
+    def add(run: int) -> None:
+        for id, price in listings[run * BATCH:(run + 1) * BATCH]:
+            book.add(id, price)
+
+    timings = measure_sync(BOOK_SIZE // BATCH, add)
+    assert len(book) == BOOK_SIZE
+
+    return summarize(f'add, per listing (batches of {BATCH})', [timing / BATCH for timing in timings])
+
+def bench_remove(listings: List[Tuple[int, int]], rng: random.Random) -> Tuple[str, OrderBook, List[int]]:
+    # Removes half of the book, which is also what the stale entry runs below start from
+    book = make_book(listings)
+    ids = [id for id, _ in listings]
+    rng.shuffle(ids)
+
+    removed, kept = ids[:BOOK_SIZE // 2], ids[BOOK_SIZE // 2:]
+
+    def remove(run: int) -> None:
+        for id in removed[run * BATCH:(run + 1) * BATCH]:
+            book.remove(id)
+
+    timings = measure_sync(len(removed) // BATCH, remove)
+    assert len(book) == len(kept)
+
+    return summarize(f'remove, per listing (batches of {BATCH})', [timing / BATCH for timing in timings]), book, kept
+
+def bench_cheapest(name: str, book: OrderBook, expected: List[Tuple[int, int]], amount: int) -> str:
+    assert book.cheapest(amount) == expected[:amount]
+    return summarize(name, measure_sync(RUNS, lambda run: book.cheapest(amount)))
+
+def bench_sorted(listings: List[Tuple[int, int]], amount: int) -> str:
+    def top(run: int) -> List[Tuple[int, int]]:
+        return sorted((price, id) for id, price in listings)[:amount]
+
+    return summarize(f'sorted() + top {amount} (before)', measure_sync(20, top))
+
+def main() -> None:
+    rng = random.Random(1)
+    listings = make_listings(rng)
+    expected = sorted((price, id) for id, price in listings)
+
+    print(f'Python {sys.version.split()[0]}')
+    print(f'Order book with {BOOK_SIZE} listings:')
+    print(bench_add(listings))
+
+    book = make_book(listings)
+    print(bench_cheapest('cheapest(1)', book, expected, 1))
+    print(bench_cheapest('cheapest(20)', book, expected, 20))
+    print(bench_sorted(listings, 20))
+
+    line, book, kept = bench_remove(listings, rng)
+    print(line)
+
+    # Half of the heap is now made of removed entries that haven't been pruned yet
+    prices = dict(listings)
+    live = sorted((prices[id], id) for id in kept)
+    print(bench_cheapest('cheapest(20) with 50% stale entries', book, live, 20))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,125 @@
+from __future__ import annotations
+
+from typing import Any, Dict, List, Tuple
+
+import random
+import sys
+import types
+import uuid
+
+import numpy as np
+
+from benchmarks._common import measure_sync, summarize
+from src.cogs.pokemons import PokemonFlags, Pokemons
+from src.database.columns import PokemonColumns
+from src.database.user import User, UserPokemon
+from src.utils import QueryPlan, StatEngine
+from src.utils.pokedex import Pokedex, PokedexEntry, PokemonNames, PokemonRarity, PokemonTypes
+
+# `p!pokemons` over a user owning USER_SIZE pokemons of SPECIES species: the per-pokemon loop
+# (`Pokemons.filter_pokemons`) against NumPy columns (`Pokemons.query_columns`)
+USER_SIZE = 100_000
+SPECIES = 905
+RUNS = 5
+USER_ID = 1
+
+CASES = (
+    '',
+    '--legendary',
+    '--shiny --level 50',
+    '--iv >80',
+    '--sort iv',
+    '--legendary --sort level --order d',
+    '--mythical --sort attack',
+)
+
+def make_pokedex(rng: random.Random) -> Pokedex:
+    # The pokedex data isn't part of the repository, so this is a synthetic one with a realistic share of rarities
+    pokedex = Pokedex.__new__(Pokedex)
+    pokedex.pokemons = {}
+
+    for id in range(1, SPECIES + 1):
+        pokedex.pokemons[id] = PokedexEntry(
+            id=id,
+            dex=id,
+            names=PokemonNames(f'Pokemon {id}', None, None, None, None, None),
+            types=PokemonTypes('Normal', None),
+            region='kanto',
+            rarity=PokemonRarity(id % 50 == 1, id % 25 == 0, id % 60 == 7, False),
+            stats=tuple(rng.randint(20, 150) for _ in range(6)),
+            is_form=False,
+            enabled=True,
+            catchable=True,
+            spawn_weight=1.0
+        )
+
+    return pokedex
+
+def make_record(rng: random.Random, catch_id: int) -> Dict[str, Any]:
+    return {
+        'id': uuid.uuid4(),
+        'catch_id': catch_id,
+        'dex_id': rng.randint(1, SPECIES),
+        'owner_id': USER_ID,
+        'nickname': None,
+        'level': rng.randint(1, 100),
+        'exp': 0,
+        'ivs': [rng.randint(0, 31) for _ in range(6)],
+        'evs': [0, 0, 0, 0, 0, 0],
+        'moves': ['tackle', None, None, None],
+        'nature': 'Hardy',
+        'is_shiny': rng.random() < 0.01,
+        'is_starter': False,
+        'is_favourite': rng.random() < 0.05,
+        'is_listed': False,
+    }
+
+def make_user(rng: random.Random, pokedex: Pokedex) -> User:
+    stats = StatEngine(
+        get_base=lambda dex_id: pokedex.pokemons[dex_id].stats, # type: ignore
+        get_nature=lambda name: (1.0, 1.0, 1.0, 1.0, 1.0)
+    )
+    pool = types.SimpleNamespace(bot=types.SimpleNamespace(pokedex=pokedex, stats=stats))
+
+    record = {
+        'id': USER_ID, 'credits': 0, 'catch_id': USER_SIZE, 'selected': 1, 'detailed_pokemon_view': False, 'redeems': 0
+    }
+    records = [make_record(rng, catch_id) for catch_id in range(1, USER_SIZE + 1)]
+
+    return User(record, records, pool) # type: ignore
+
+def bench_case(
+    cog: Pokemons, user: User, columns: PokemonColumns, pokedex: Pokedex, args: str
+) -> Tuple[str, str]:
+    flags = PokemonFlags.parse(args)
+    plan = QueryPlan.from_flags(flags, pokedex, UserPokemon.QUERY_FIELDS, name_field='nickname')
+
+    expected = [pokemon.catch_id for pokemon in cog.filter_pokemons(user, plan, flags)]
+    actual = [pokemon.catch_id for pokemon in cog.query_columns(user, columns, plan, flags)]
+    assert actual == expected, args
+
+    loop = measure_sync(RUNS, lambda run: cog.filter_pokemons(user, plan, flags))
+    vectorized = measure_sync(RUNS, lambda run: cog.query_columns(user, columns, plan, flags))
+
+    name = args or 'no filters'
+    return summarize(f'{name} ({len(expected)} results), loop', loop), summarize(f'{name}, columns', vectorized)
+
+def main() -> None:
+    rng = random.Random(1)
+    pokedex = make_pokedex(rng)
+    user = make_user(rng, pokedex)
+    cog = Pokemons(user.bot)
+
+    print(f'Python {sys.version.split()[0]}, NumPy {np.__version__}')
+    print(f'p!pokemons over {USER_SIZE} pokemons of {SPECIES} species:')
+
+    pokemons: List[UserPokemon] = list(user.pokemons.values())
+    print(summarize('build columns (once per change)', measure_sync(RUNS, lambda run: PokemonColumns(pokemons))))
+
+    columns = PokemonColumns(pokemons)
+    for args in CASES:
+        for line in bench_case(cog, user, columns, pokedex, args):
+            print(line)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,154 @@
+from __future__ import annotations
+
+from typing import Dict, List, Tuple
+
+import asyncio
+import asyncpg
+import random
+import time
+import uuid
+
+from benchmarks._common import add_user, describe, get_dsn, scratch_schema, summarize
+from src.database.statements import QUERIES
+
+# Settlement latency of trades moving TRADE_SIZES pokemons each way between two users owning USER_SIZE pokemons
+USER_SIZE = 1000
+TRADE_SIZES = (1, 20, 50, 100)
+RUNS = 50
+USERS = (1, 2)
+SCHEMA = 'bench_trade'
+
+# (id, catch_id) of every pokemon a user owns, ordered by catch id
+Collection = List[Tuple[uuid.UUID, int]]
+
+async def get_collections(pool: asyncpg.Pool) -> Dict[int, Collection]:
+    collections: Dict[int, Collection] = {}
+    for user_id in USERS:
+        records = await pool.fetch('SELECT id, catch_id FROM pokemons WHERE owner_id = $1 ORDER BY catch_id', user_id)
+        collections[user_id] = [(record['id'], record['catch_id']) for record in records]
+
+    return collections
+
+async def settle_before(pool: asyncpg.Pool, traded: Dict[int, Collection], collections: Dict[int, Collection]) -> None:
+    # The statements the old `Trade.finish` sent: a ledger update per side, three updates per pokemon on their own
+    # pool acquisition (`UserPokemon.transfer`), then `User.reindex` for both users
+    for user_id in USERS:
+        await pool.execute('UPDATE users SET credits = credits - $1 WHERE id = $2', 10, user_id)
+        await pool.execute('UPDATE users SET credits = credits + $1 WHERE id = $2', 10, 3 - user_id)
+
+    catch_ids = {user_id: collections[user_id][-1][1] for user_id in USERS}
+    for user_id in USERS:
+        other = 3 - user_id
+        for pokemon_id, _ in traded[user_id]:
+            await pool.execute(
+                'UPDATE users SET pokemons = ARRAY_REMOVE(users.pokemons, $1), selected = $2 WHERE id = $3',
+                pokemon_id, 1, user_id
+            )
+            await pool.execute('UPDATE pokemons SET owner_id = $1 WHERE id = $2', other, pokemon_id)
+
+            catch_ids[other] += 1
+            await pool.execute(
+                'UPDATE users SET pokemons = ARRAY_APPEND(users.pokemons, CAST($1 as UUID)), catch_id = $2 WHERE id = $3',
+                str(pokemon_id), catch_ids[other], other
+            )
+
+    for user_id in USERS:
+        records = await pool.fetch('SELECT id FROM pokemons WHERE owner_id = $1 ORDER BY catch_id', user_id)
+        data = [(index, record['id']) for index, record in enumerate(records, start=1)]
+
+        await pool.execute('UPDATE users SET selected = $1, catch_id = $2 WHERE id = $3', 1, len(data), user_id)
+        await pool.executemany('UPDATE pokemons SET catch_id = $1 WHERE id = $2', data)
+        await pool.fetch('SELECT * FROM pokemons WHERE owner_id = $1 AND is_listed = FALSE', user_id)
+
+async def settle_after(pool: asyncpg.Pool, traded: Dict[int, Collection], collections: Dict[int, Collection]) -> None:
+    # The plan `UserTrade.settle` builds (including compaction), applied like `Trade.finish` does: both set-based
+    # statements on one connection in one transaction
+    moves: List[Tuple[uuid.UUID, int, int, int]] = []
+    sizes: List[int] = []
+
+    for user_id in USERS:
+        other = 3 - user_id
+        outgoing = {pokemon_id for pokemon_id, _ in traded[user_id]}
+
+        owned = [
+            (pokemon_id, catch_id, user_id) for pokemon_id, catch_id in collections[user_id]
+            if pokemon_id not in outgoing
+        ]
+        owned.extend((pokemon_id, catch_id, other) for pokemon_id, catch_id in traded[other])
+
+        moves.extend(
+            (pokemon_id, owner_id, user_id, index)
+            for index, (pokemon_id, catch_id, owner_id) in enumerate(owned, start=1)
+            if catch_id != index or owner_id != user_id
+        )
+        sizes.append(len(owned))
+
+    async with pool.acquire() as conn:
+        async with conn.transaction():
+            await conn.execute(QUERIES['users.settle_trade'], list(USERS), [-10, 10], [0, 0], [1, 1], sizes)
+            await conn.execute(
+                QUERIES['pokemons.settle_trade'],
+                [move[0] for move in moves], [move[1] for move in moves], [move[2] for move in moves],
+                [move[3] for move in moves]
+            )
+
+async def check(pool: asyncpg.Pool) -> None:
+    # Both paths must leave each user with USER_SIZE pokemons numbered 1..USER_SIZE and a matching catch id
+    for user_id in USERS:
+        record = await pool.fetchrow(
+            'SELECT COUNT(*) AS owned, COUNT(DISTINCT catch_id) AS numbered, MIN(catch_id) AS first, '
+            'MAX(catch_id) AS last, (SELECT catch_id FROM users WHERE id = $1) AS catch_id '
+            'FROM pokemons WHERE owner_id = $1',
+            user_id
+        )
+        expected = (USER_SIZE, USER_SIZE, 1, USER_SIZE, USER_SIZE)
+        assert tuple(record) == expected, (user_id, tuple(record))
+
+async def run(conn: asyncpg.Connection, pool: asyncpg.Pool, *, with_array: bool) -> List[str]:
+    # `conn` owns the scratch schema, the settlements themselves go through `pool`
+    settle = settle_before if with_array else settle_after
+    label = 'before' if with_array else 'after'
+    results: List[str] = []
+
+    async with scratch_schema(conn, SCHEMA, with_array=with_array):
+        for user_id in USERS:
+            await add_user(conn, user_id, USER_SIZE, with_array=with_array)
+            await conn.execute('UPDATE users SET credits = 1000000 WHERE id = $1', user_id)
+
+        for size in TRADE_SIZES:
+            timings: List[float] = []
+            for _ in range(RUNS):
+                collections = await get_collections(pool)
+                traded = {user_id: random.sample(collections[user_id], size) for user_id in USERS}
+
+                start = time.perf_counter()
+                await settle(pool, traded, collections)
+                timings.append(time.perf_counter() - start)
+
+            await check(pool)
+            results.append(summarize(f'{label}, {size} pokemons each way', timings))
+
+    return results
+
+async def main() -> None:
+    dsn = get_dsn()
+    conn = await asyncpg.connect(dsn)
+    # Pooled connections get reset on release, setting `search_path` at startup makes the scratch tables survive that.
+    # Each run gets a fresh pool, so no connection keeps statements prepared against the previous run's tables.
+    try:
+        print(await describe(conn))
+        print(f'Trade settlement latency, users owning {USER_SIZE} pokemons, {RUNS} trades per size:')
+        for with_array in (True, False):
+            pool = await asyncpg.create_pool(
+                dsn, min_size=1, max_size=2, server_settings={'search_path': f'{SCHEMA}, public'}
+            )
+            try:
+                for line in await run(conn, pool, with_array=with_array):
+                    print(line)
+            finally:
+                await pool.close()
+    finally:
+        await conn.close()
+
+if __name__ == '__main__':
+    asyncio.run(main())
@@ -0,0 +1,83 @@
+from __future__ import annotations
+
+from typing import Any, Callable, Dict, Generic, Tuple, TypeVar
+
+import datetime
+import sys
+
+from benchmarks._common import measure_sync, summarize
+from src.utils.ttldict import TTLDict
+
+K = TypeVar('K')
+V = TypeVar('V')
+
+# One set plus one get per op, mirroring `Context.send` followed by `get_previous_message`, on dicts holding
+# SIZES live entries
+SIZES = (100, 1000, 10000)
+EXPIRY = datetime.timedelta(seconds=60)
+# Ops are timed in batches, a single one is too close to the timer's resolution
+BATCH = 50
+RUNS = 20
+
+class OldTTLDict(Generic[K, V]):
+    # The TTLDict used before entries expired through a deadline heap, trimmed down to what the benchmark calls.
+    # Every get and set copies the storage and scans all of it for expired entries.
+    def __init__(self, expiry: datetime.timedelta) -> None:
+        self.__expiry = expiry
+        self.__storage: Dict[K, Tuple[V, datetime.datetime]] = {}
+
+    @property
+    def expiry(self) -> datetime.timedelta:
+        return self.__expiry
+
+    @property
+    def storage(self) -> Dict[K, Tuple[V, datetime.datetime]]:
+        return self.__storage.copy()
+
+    def _purge(self) -> None:
+        for key, (_, time) in self.storage.items():
+            if (time + self.expiry) <= datetime.datetime.utcnow():
+                self.__storage.pop(key)
+
+    def __getitem__(self, key: K) -> V:
+        self._purge()
+        if key not in self.__storage:
+            raise KeyError(key)
+
+        return self.__storage[key][0]
+
+    def __setitem__(self, key: K, value: V) -> None:
+        self._purge()
+        self.__storage[key] = (value, datetime.datetime.utcnow())
+
+    def get(self, key: K, default: Any = None) -> Any:
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+def bench(name: str, factory: Callable[[], Any], size: int) -> str:
+    cache = factory()
+    for index in range(size):
+        cache[f'key{index}'] = index
+
+    def send(run: int) -> None:
+        for index in range(run * BATCH, (run + 1) * BATCH):
+            cache[f'other{index % size}'] = index
+            cache.get(f'key{index % size}')
+
+    timings = measure_sync(RUNS, send)
+    assert cache.get('key0') == 0
+
+    return summarize(f'{size} live entries, {name}, per op', [timing / (2 * BATCH) for timing in timings])
+
+def main() -> None:
+    print(f'Python {sys.version.split()[0]}')
+    print(f'TTLDict set + get, batches of {BATCH}:')
+
+    for size in SIZES:
+        print(bench('before', lambda: OldTTLDict(EXPIRY), size))
+        print(bench('after', lambda: TTLDict(EXPIRY), size))
+
+if __name__ == '__main__':
+    main()
@@ -73,11 +73,6 @@ async def main():
         version = await conn.fetchval('SELECT version()')
         logger.info('PostgreSQL version: %s', version)
 
-        with open('src/database/schema.sql', 'r') as f:
-            await conn.execute(f.read())
-
-        logger.info('Database schema created.')
-
     now = datetime.datetime.now()
     logger.info('Starting bot at %s%s%s.', Colors.blue.value, now, Colors.reset.value)
     
@@ -1,6 +1,6 @@
 from __future__ import annotations
 
-from typing import ClassVar, Dict, List, NamedTuple
+from typing import ClassVar, Dict, List, NamedTuple, Optional, Tuple
 from discord.ext import commands, tasks
 import json
 import aiohttp
@@ -13,9 +13,11 @@ import random
 import functools
 import datetime
 import logging
+import time
 
-from .utils import Pokedex, Context, ContextPool, TTLDict
+from .utils import Pokedex, Context, ContextPool, TTLDict, StatEngine
 from .consts import DATA
+from .database.statements import StatementStats
 from . import database
 
 class SpawnRates(enum.IntEnum):
@@ -43,6 +45,7 @@ class Pokecord(commands.Bot):
     CHANNEL_SPAWN_TIMEOUT: ClassVar[float] = 60.0
     TRADE_TIMEOUT: ClassVar[float] = 75.0
     REDEEM_CREDIT_AMOUNT: ClassVar[int] = 30000
+    MESSAGE_CACHE_SIZE: ClassVar[int] = 10000
 
     pool: database.Pool
     session: aiohttp.ClientSession
@@ -52,10 +55,19 @@ class Pokecord(commands.Bot):
         super().__init__(command_prefix='p!', intents=discord.Intents.all())
         
         self.logger = logger
-        self.messages: TTLDict[str, discord.Message] = TTLDict(expiry=datetime.timedelta(seconds=60))
+        self.messages: TTLDict[str, discord.Message] = TTLDict(
+            expiry=datetime.timedelta(seconds=60), maxsize=self.MESSAGE_CACHE_SIZE
+        )
         self.ignored_commands = ('starter',)
 
         self._is_day = False
+        self.processed_messages = 0
+
+        # Time spent in command bodies, to compare against `Pool.hydration_stats`
+        self.command_stats = StatementStats()
+
+        self.before_invoke(self.start_command)
+        self.after_invoke(self.end_command)
 
         self.load_data()
         self.add_check(self.starter_check, call_once=True)
@@ -78,9 +90,60 @@ class Pokecord(commands.Bot):
         now = datetime.datetime.utcnow()
         self._is_day = 23 > now.hour > 7
 
+    @tasks.loop(minutes=10)
+    async def log_query_stats(self) -> None:
+        self.logger.info(
+            'Sent %s queries for %s processed messages (%.2f per message).',
+            self.pool.queries, self.processed_messages, self.get_queries_per_message()
+        )
+
+        for name, cache in (('User', self.pool.users), ('Guild', self.pool.guilds)):
+            stats = cache.stats
+            self.logger.info(
+                '%s cache: %s entries (~%.2fMB), %.2f%% hit rate, %s evictions.',
+                name, stats.size, stats.bytes / 1024 / 1024, stats.hit_rate * 100, stats.evictions
+            )
+
+        ttls = (
+            ('Message', self.messages),
+            ('Free pokemon', self.pool.free),
+            ('Missing user', self.pool.missing_users),
+            ('Missing guild', self.pool.missing_guilds)
+        )
+        for name, ttl in ttls:
+            stats = ttl.stats
+            self.logger.info(
+                '%s cache: %s entries, %.2f%% hit rate, %s expirations, %s evictions.',
+                name, stats.size, stats.hit_rate * 100, stats.expirations, stats.evictions
+            )
+
+        loads = self.pool.loads.stats
+        self.logger.info(
+            'Database loads: %s started, %s shared with a concurrent load (%.2f%% deduplicated).',
+            loads.loads, loads.shared, loads.saved_rate * 100
+        )
+
+        index = self.pool.guild_index.stats
+        self.logger.info(
+            'Spawn/exp pre-filter: %.2f%% of %s messages handled without awaiting, %s guilds indexed.',
+            index.fast_rate * 100, index.fast + index.slow, index.guilds
+        )
+
+        hydration = self.pool.hydration_stats['total']
+        self.logger.info(
+            'Context hydration: %.2fms average, %.2fms max. Command bodies: %.2fms average, %.2fms max.',
+            hydration.average * 1000, hydration.max * 1000, self.command_stats.average * 1000, self.command_stats.max * 1000
+        )
+
     def is_daytime(self) -> bool:
         return self._is_day
 
+    def get_queries_per_message(self) -> float:
+        if not self.processed_messages:
+            return 0.0
+
+        return self.pool.queries / self.processed_messages
+
     def add_message(self, key: str, message: discord.Message) -> None:
         self.messages[key] = message
 
@@ -96,7 +159,12 @@ class Pokecord(commands.Bot):
 
         assert self.user
 
-        guild = await self.pool.add_guild(message.guild.id)
+        # Guilds get registered on READY and on join, so this is a plain dict lookup for pretty much every message.
+        # `Guild.set_prefix` updates the cached guild in place so there's nothing else to invalidate.
+        guild = self.pool.guilds.get(message.guild.id)
+        if guild is None:
+            guild = await self.pool.add_guild(message.guild.id)
+
         return guild.prefix, self.user.mention
 
     def load_data(self):
@@ -119,6 +187,15 @@ class Pokecord(commands.Bot):
         self.pokedex = Pokedex()
         self.logger.info('Loaded pokedex data.')
 
+        self.stats = StatEngine(get_base=self.get_base_stats, get_nature=self.get_nature_multipliers)
+
+    def get_base_stats(self, dex_id: int) -> Tuple[int, ...]:
+        return self.pokedex.get_pokemon(dex_id).stats # type: ignore
+
+    def get_nature_multipliers(self, name: str) -> Tuple[float, ...]:
+        nature = self.natures[name]
+        return nature.atk, nature.defense, nature.spatk, nature.spdef, nature.speed
+
     def get_needed_exp(self, level: int) -> int:
         return self.levels[level].needed
 
@@ -127,11 +204,11 @@ class Pokecord(commands.Bot):
         if ctx.command.name == 'set':
             return True
 
-        guild = await self.pool.add_guild(ctx.guild.id)
         if ctx.command.name in self.ignored_commands:
+            await self.pool.add_guild(ctx.guild.id)
             return True
 
-        user = await self.pool.get_user(ctx.author.id)
+        guild, user = await self.pool.hydrate(ctx.guild.id, ctx.author.id)
         if not user:
             await ctx.send(
                 f'This command requires you to have a pokémon. Please start by invoking `{guild.prefix}starter`.'
@@ -141,6 +218,24 @@ class Pokecord(commands.Bot):
         ctx.pool = ContextPool(user, guild)
         return True
 
+    async def start_command(self, ctx: Context):
+        ctx.started_at = time.perf_counter()
+
+        # The context user must outlive the whole command, some commands wait on a `ConfirmationView` for a while and
+        # an eviction in the meantime would leave them working on a copy that's no longer cached.
+        # After-invoke hooks run even if the command fails, so the pin can't leak.
+        pool: Optional[ContextPool] = getattr(ctx, 'pool', None)
+        if pool is not None:
+            ctx.pinned_user = pool.user.id
+            self.pool.users.pin(pool.user.id)
+
+    async def end_command(self, ctx: Context):
+        self.command_stats.record(time.perf_counter() - ctx.started_at)
+
+        if ctx.pinned_user is not None:
+            self.pool.users.unpin(ctx.pinned_user)
+            ctx.pinned_user = None
+
     def load_module(self, module: str):
         return importlib.import_module(module)
 
@@ -153,6 +248,14 @@ class Pokecord(commands.Bot):
         return importlib.reload(mod)
 
     async def close(self) -> None:
+        self.log_query_stats.cancel()
+        self.messages.stop_reaper()
+        self.pool.free.stop_reaper()
+        self.pool.missing_users.stop_reaper()
+        self.pool.missing_guilds.stop_reaper()
+        self.pool.exp.stop()
+        await self.pool.exp.flush()
+
         await self.pool.close()
         await self.session.close()
 
@@ -160,6 +263,12 @@ class Pokecord(commands.Bot):
 
     async def start(self, token: str, *, reconnect: bool = True) -> None:
         self.update_time.start()
+        self.log_query_stats.start()
+        self.messages.start_reaper()
+        self.pool.free.start_reaper()
+        self.pool.missing_users.start_reaper()
+        self.pool.missing_guilds.start_reaper()
+        self.pool.exp.start()
         return await super().start(token, reconnect=reconnect)
 
     async def get_context(self, message: discord.Message):
@@ -174,6 +283,24 @@ class Pokecord(commands.Bot):
 
         raise getattr(exception, 'original', exception)
     
+    async def on_ready(self):
+        guilds = await self.pool.add_guilds(guild.id for guild in self.guilds)
+        self.logger.info('Registered %s guilds.', len(guilds))
+
+        # Every guild the bot is in went through `Guild`, so guilds missing from the index have no spawn/exp channels
+        self.pool.guild_index.complete = True
+
+    async def on_guild_join(self, guild: discord.Guild):
+        await self.pool.add_guild(guild.id)
+
+    async def on_guild_remove(self, guild: discord.Guild):
+        self.pool.guilds.pop(guild.id)
+        self.pool.guild_index.remove(guild.id)
+
+    async def on_message(self, message: discord.Message):
+        self.processed_messages += 1
+        await self.process_commands(message)
+
     async def on_message_edit(self, before: discord.Message, after: discord.Message):
         await self.process_commands(after)
     
\ No newline at end of file
@@ -3,9 +3,14 @@ from typing import Optional
 from src.utils import flags
 
 class CommonPokemonFlags(flags.FlagParser):
-    level: Optional[int]
+    # `level` and `iv` also take ranges like `>50` or `<20`, see `QueryPlan.from_flags`
+    level: Optional[str]
+    iv: Optional[str]
     name: Optional[str] = flags.flag(aliases=['n'])
+    type: Optional[str] = flags.flag(aliases=['t'])
+    region: Optional[str]
+    nature: Optional[str]
     mythical: bool = flags.flag(aliases=['myth'])
     legendary: bool = flags.flag(aliases=['leg'])
     ultra_beast: bool = flags.flag(name='ultra-beast', aliases=['ub'])
-    shiny: bool = flags.flag(aliases=['sh'])
\ No newline at end of file
+    shiny: bool = flags.flag(aliases=['sh'])
@@ -6,12 +6,11 @@ import discord
 from ._common import CommonPokemonFlags
 
 from src.bot import Pokecord
-from src.utils import menus, flags, parse_integer_ordering
-from src.utils import Context, ConfirmationView
+from src.utils import menus, flags
+from src.utils import Context, ConfirmationView, QueryPlan
 from src.utils.pokedex import PokedexEntry
 from src.database.user import UserPokemon
-from src.database.market import MarketListing
-from src.database.pokemons import Pokemon
+from src.database.market import MarketListing, MarketPokemon
 from src.utils.menus.views import ViewMenuPages
 
 class MarketSearchFlags(CommonPokemonFlags):
@@ -20,12 +19,15 @@ class MarketSearchFlags(CommonPokemonFlags):
     order: Optional[str] = flags.flag(choices=['a', 'ascending', 'd', 'descending'])
     mine: bool = flags.flag(aliases=['me'])
 
-class MarketListingsSource(menus.ListPageSource[Tuple[Pokemon, MarketListing]]):
-    def __init__(self, bot: Pokecord, entries: List[Tuple[Pokemon, MarketListing]]):
+class MarketBuyCheapestFlags(flags.FlagParser):
+    max_price: Optional[int] = flags.flag(name='max-price', aliases=['max'])
+
+class MarketListingsSource(menus.ListPageSource[Tuple[MarketPokemon, MarketListing]]):
+    def __init__(self, bot: Pokecord, entries: List[Tuple[MarketPokemon, MarketListing]]):
         self.bot = bot
         super().__init__(entries, per_page=20)
 
-    async def format_page(self, menu: menus.MenuPages, entries: List[Tuple[Pokemon, MarketListing]]):
+    async def format_page(self, menu: menus.MenuPages, entries: List[Tuple[MarketPokemon, MarketListing]]):
         embed = discord.Embed(color=0x36E3DD)
 
         description = []
@@ -36,9 +38,9 @@ class MarketListingsSource(menus.ListPageSource[Tuple[Pokemon, MarketListing]]):
             if pokemon.is_shiny:
                 ret += '✨ '
 
-            ret += f'**{name}** | Level {pokemon.level} | IV: {pokemon.ivs.round()}% | Price: {entry.price} credits'
+            ret += f'**{name}** | Level {pokemon.level} | IV: {pokemon.iv_percentage}% | Price: {entry.price} credits'
 
-            name = f'Level {pokemon.level} {pokemon.ivs.round()}% IV '
+            name = f'Level {pokemon.level} {pokemon.iv_percentage}% IV '
             if pokemon.is_shiny:
                 name += '✨ '
 
@@ -82,7 +84,7 @@ class Market(commands.Cog):
                 'Listing price must be between 0 and 9,223,372,036,854,775,807 credits.'
             )
 
-        name = f'Level {pokemon.level} {pokemon.ivs.round()}% IV '
+        name = f'Level {pokemon.level} {pokemon.iv_percentage}% IV '
         if pokemon.is_shiny():
             name += '✨ '
 
@@ -98,7 +100,10 @@ class Market(commands.Cog):
             return await ctx.send('Aborted.')
 
         market = await self.bot.pool.get_market()
-        await market.add_listing(price, pokemon)
+        try:
+            await market.add_listing(price, pokemon)
+        except ValueError as e:
+            return await ctx.send(f'{e}.')
 
         await ctx.send('Successfully added your pokémon to the market.')
 
@@ -111,7 +116,7 @@ class Market(commands.Cog):
             return await ctx.send('Listing not found.')
 
         data = await listing.fetch_pokemon_data()
-        entry = UserPokemon(ctx.pool.user, data) # Provide a fake user to the pokemon since it won't matter either way
+        entry = UserPokemon.from_dict(ctx.pool.user, data) # Provide a fake user to the pokemon since it won't matter either way
 
         embed, file = entry.build_discord_embed_for(
             ctx.pool.user, show_favourite=False, show_nickname=False, add_footer=False
@@ -125,43 +130,29 @@ class Market(commands.Cog):
     @market.command(aliases=['s'])
     async def search(self, ctx: Context, *, flags: MarketSearchFlags = MarketSearchFlags.default()):
         market = await self.bot.pool.get_market()
-        listings = list(market.listings.values())
-
-        entries: List[Tuple[Pokemon, MarketListing]] = []
-
-        for listing in listings:
-            pokemon = await listing.fetch_pokemon()
-            entry: PokedexEntry = self.bot.pokedex.get_pokemon(pokemon.dex_id) # type: ignore
-
-            if flags.price is not None:
-                try:
-                    ret = parse_integer_ordering(flags.price, listing.price)
-                except ValueError:
-                    return await ctx.send('Invalid price argument.')
-
-                if not ret: continue
-            if flags.name is not None:
-                if pokemon.nickname.casefold() != flags.name.casefold(): continue
-            if flags.legendary:
-                if not entry.rarity.legendary: continue
-            if flags.mythical:
-                if not entry.rarity.mythical: continue
-            if flags.ultra_beast:
-                if not entry.rarity.ultra_beast: continue
-            if flags.shiny:
-                if not pokemon.is_shiny: continue
-            if flags.mine:
-                if listing.owner_id != ctx.author.id: continue
-            
-            entries.append((pokemon, listing))
+
+        try:
+            plan = QueryPlan.from_flags(flags, self.bot.pokedex, MarketListing.QUERY_FIELDS)
+        except ValueError as e:
+            return await ctx.send(f'{e}.')
+
+        # Species, shininess and ownership are answered by the market's indexes, the plan only checks the rest
+        listings = market.search(
+            dex_ids=plan.dex_ids,
+            shiny=flags.shiny,
+            owner_id=ctx.author.id if flags.mine else None,
+            order_by_price=flags.sort == 'price'
+        )
+
+        entries: List[Tuple[MarketPokemon, MarketListing]] = [
+            (listing.pokemon, listing) for listing in plan.without('dex_id', 'shiny').filter(listings)
+        ]
 
         if flags.sort is not None:
             if flags.sort == 'iv':
-                entries.sort(key=lambda entry: entry[0].ivs.round())
+                entries.sort(key=lambda entry: entry[0].iv_percentage)
             elif flags.sort == 'level':
                 entries.sort(key=lambda entry: entry[0].level)
-            else:
-                entries.sort(key=lambda entry: entry[1].price)
 
         if flags.order is not None:
             if flags.order in ('d', 'descending'):
@@ -186,25 +177,22 @@ class Market(commands.Cog):
         if listing.owner_id != ctx.author.id:
             return await ctx.send('You do not own that listing.')
 
-        await listing.cancel()
-        await ctx.send('Successfully removed that listing from the market.')
+        try:
+            await listing.cancel()
+        except ValueError as e:
+            return await ctx.send(f'{e}.')
 
-    @market.command(aliases=['b'])
-    async def buy(self, ctx: Context, id: int):
-        market = await self.bot.pool.get_market()
-        listing = await market.get_listing(id)
-
-        if not listing:
-            return await ctx.send('Listing not found.')
+        await ctx.send('Successfully removed that listing from the market.')
 
+    async def buy_listing(self, ctx: Context, listing: MarketListing):
         if listing.price > ctx.pool.user.credits:
             return await ctx.send('You do not have enough credits.')
 
         if listing.owner_id == ctx.pool.user.id:
             return await ctx.send('You cannot buy your own listing.')
 
-        pokemon = await listing.fetch_pokemon()
-        name = f'Level {pokemon.level} {pokemon.ivs.round()}% IV '
+        pokemon = listing.pokemon
+        name = f'Level {pokemon.level} {pokemon.iv_percentage}% IV '
         if pokemon.is_shiny:
             name += '✨ '
 
@@ -221,8 +209,34 @@ class Market(commands.Cog):
         if not view.value:
             return await ctx.send('Aborted.')
 
-        await listing.buy(ctx.pool.user)
+        try:
+            await listing.buy(ctx.pool.user)
+        except ValueError as e:
+            return await ctx.send(f'{e}.')
+
         await ctx.send('Successfully bought that market listing.')
 
+    @market.group(invoke_without_command=True, aliases=['b'])
+    async def buy(self, ctx: Context, id: int):
+        market = await self.bot.pool.get_market()
+        listing = await market.get_listing(id)
+
+        if not listing:
+            return await ctx.send('Listing not found.')
+
+        await self.buy_listing(ctx, listing)
+
+    @buy.command(aliases=['c'])
+    async def cheapest(
+        self, ctx: Context, pokemon: PokedexEntry, *, flags: MarketBuyCheapestFlags = MarketBuyCheapestFlags.default()
+    ):
+        market = await self.bot.pool.get_market()
+        listings = market.get_cheapest(pokemon.id, max_price=flags.max_price, exclude_owner=ctx.author.id)
+
+        if not listings:
+            return await ctx.send(f'No {pokemon.default_name} listings found.')
+
+        await self.buy_listing(ctx, listings[0])
+
 async def setup(bot: Pokecord):
     await bot.add_cog(Market(bot))
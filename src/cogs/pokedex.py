@@ -12,7 +12,7 @@ from src.bot import Pokecord
 class PokedexSource(ListPageSource[PokedexEntry]):
     def __init__(self, user: User, entries: List[PokedexEntry]):
         self.user = user
-        self.uniques = len(user.get_unique_pokemons())
+        self.uniques = user.get_caught_species_count()
 
         super().__init__(entries, per_page=20)
 
@@ -22,7 +22,7 @@ class PokedexSource(ListPageSource[PokedexEntry]):
         embed.description = f'You have caught {self.uniques} out of {len(self.entries)} pokémons.'
 
         for i, entry in enumerate(entries, start=offset):
-            count = await self.user.get_catch_count_for(entry.id)
+            count = self.user.get_catch_count_for(entry.id)
             if count == 0:
                 value = '❌ Not caught yet.'
             else:
@@ -114,7 +114,7 @@ class Pokedex(commands.Cog):
 
         embed.set_image(url='attachment://pokemon.png')
 
-        count = await ctx.pool.user.get_catch_count_for(entry.id)
+        count = ctx.pool.user.get_catch_count_for(entry.id)
         if not count:
             embed.set_footer(text='You haven\'t caught this pokémon yet.')
         else:
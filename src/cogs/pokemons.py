@@ -1,52 +1,59 @@
-from typing import Iterable, Optional, List
+from __future__ import annotations
+
+from typing import AsyncIterator, Iterable, Optional, List, Union
 
 from discord.ext import commands
 import discord
 
 from ._common import CommonPokemonFlags
 
-from src.utils import Context, chunk, find, ConfirmationView
+from src.utils import Context, chunk, find, ConfirmationView, QueryPlan
 from src.utils import menus, flags
 from src.database.user import UserPokemon, User
+from src.database.columns import PokemonColumns
 from src.bot import Pokecord
 
 class PokemonFlags(CommonPokemonFlags):
     nickname: Optional[str] = flags.flag(aliases=['nick'])
-    sort: Optional[str] = flags.flag(choices=['iv', 'level'])
+    sort: Optional[str] = flags.flag(choices=['iv', 'level', 'hp', 'attack', 'defense', 'spatk', 'spdef', 'speed'])
     order: Optional[str] = flags.flag(choices=['a', 'ascending', 'd', 'descending'])
     favourite: bool = flags.flag(aliases=['fav'])
 
-class PokemonsSource(menus.ListPageSource[UserPokemon]):
-    def __init__(self, user: User, entries: List[UserPokemon]):
-        self.user = user
-        super().__init__(entries, per_page=20)
+def format_pokemons(user: User, entries: List[UserPokemon]) -> discord.Embed:
+    embed = discord.Embed(color=0x36E3DD)
 
-    async def format_page(self, menu: menus.MenuPages, entries: List[UserPokemon]):
-        embed = discord.Embed(color=0x36E3DD)
+    description = []
+    for entry in entries:
+        ret = f'{entry.catch_id}. '
+        if entry.is_shiny():
+            ret += '✨ '
 
-        description = []
-        for entry in entries:
-            ret = f'{entry.catch_id}. '
-            if entry.is_shiny():
-                ret += '✨ '
+        if entry.has_nickname():
+            ret += f'**{entry.dex.default_name} "{entry.nickname}"** '
+        else:
+            ret += f'**{entry.dex.default_name}** '
 
-            if entry.has_nickname():
-                ret += f'**{entry.dex.default_name} "{entry.nickname}"** '
-            else:
-                ret += f'**{entry.dex.default_name}** '
+        if entry.is_favourite():
+            ret += ' ❤️ | '
+        else:
+            ret += '| '
 
-            if entry.is_favourite():
-                ret += ' ❤️ | '
-            else:
-                ret += '| '
+        ret += f'Level: {entry.level}'
+        if user.has_detailed_pokemon_view():
+            ret +=  f' | IV: {entry.iv_percentage}%'
 
-            ret += f'Level: {entry.level}'
-            if self.user.has_detailed_pokemon_view():
-                ret +=  f' | IV: {entry.ivs.round()}%'
+        description.append(ret)
 
-            description.append(ret)
+    embed.description = '\n'.join(description)
+    return embed
+
+class PokemonsSource(menus.ListPageSource[UserPokemon]):
+    def __init__(self, user: User, entries: List[UserPokemon]):
+        self.user = user
+        super().__init__(entries, per_page=20)
 
-        embed.description = '\n'.join(description)
+    async def format_page(self, menu: menus.MenuPages, entries: List[UserPokemon]):
+        embed = format_pokemons(self.user, entries)
 
         end = (1 if menu.current_page == 0 else menu.current_page) * self.per_page
         if end > len(self.entries):
@@ -60,47 +67,138 @@ class PokemonsSource(menus.ListPageSource[UserPokemon]):
 
         return embed
 
+class PokemonsStreamSource(menus.AsyncIteratorPageSource[UserPokemon]):
+    # Pages through the pokemons as the menu goes, without needing all of them up front
+    def __init__(self, user: User, iterator: AsyncIterator[UserPokemon], *, total: Optional[int] = None):
+        self.user = user
+        self.total = total
+        super().__init__(iterator, per_page=20)
+
+    async def format_page(self, menu: menus.MenuPages, entries: List[UserPokemon]):
+        embed = format_pokemons(self.user, entries)
+
+        start = menu.current_page * self.per_page + 1
+        end = start + len(entries) - 1
+
+        if self.total is not None:
+            embed.set_footer(text=f'Showing {start}-{end} entries out of {self.total}.')
+        else:
+            embed.set_footer(text=f'Showing {start}-{end} entries.')
+
+        return embed
+
+class PokemonsMenu(menus.MenuPages):
+    # Keeps the user pinned in the user cache for as long as the menu is running
+    def __init__(self, source: Union[PokemonsSource, PokemonsStreamSource]) -> None:
+        super().__init__(source)
+        self.user = source.user
+        self.pinned = False
+
+    def unpin(self) -> None:
+        if self.pinned:
+            self.user.pool.users.unpin(self.user.id)
+            self.pinned = False
+
+    async def start(self, ctx: Context, *, channel: Optional[discord.abc.MessageableChannel] = None, wait: bool = False):
+        self.user.pool.users.pin(self.user.id)
+        self.pinned = True
+
+        try:
+            await super().start(ctx, channel=channel, wait=wait)
+        except BaseException:
+            self.unpin()
+            raise
+
+        # Without reactions there is no menu loop, which means `finalize` never gets called
+        if not self.should_add_reactions():
+            self.unpin()
+
+    async def finalize(self, timed_out: bool):
+        self.unpin()
+
 class Pokemons(commands.Cog):
     def __init__(self, bot: Pokecord) -> None:
         self.bot = bot
 
-    @commands.command(aliases=['p'])
-    async def pokemons(self, ctx: Context, *, flags: PokemonFlags = PokemonFlags.default()):
-        user = ctx.pool.user
-        entries: List[UserPokemon] = []
-        for entry in user.pokemons.values():
-            if flags.level is not None:
-                if entry.level != flags.level: continue
-            if flags.name is not None:
-                if entry.nickname.casefold() != flags.name.casefold(): continue
-            if flags.nickname is not None:
-                if entry.nickname != flags.nickname: continue
-            if flags.shiny:
-                if not entry.is_shiny(): continue
-            if flags.legendary:
-                if not entry.dex.rarity.legendary: continue
-            if flags.ultra_beast:
-                if not entry.dex.rarity.ultra_beast: continue
-            if flags.favourite:
-                if not entry.is_favourite(): continue
-
-            entries.append(entry)
+    def filter_pokemons(self, user: User, plan: QueryPlan, flags: PokemonFlags) -> List[UserPokemon]:
+        # Plain Python version of `query_columns`, for when NumPy isn't available
+        entries = plan.filter(user.pokemons.values())
 
         if flags.sort is not None:
             if flags.sort == 'iv':
-                entries.sort(key=lambda pokemon: pokemon.ivs.round(), reverse=True)
+                entries.sort(key=lambda pokemon: pokemon.iv_percentage, reverse=True)
             elif flags.sort == 'level':
                 entries.sort(key=lambda pokemon: pokemon.level, reverse=True)
+            else:
+                field = 'health' if flags.sort == 'hp' else flags.sort
+                stats = user.get_stats(entries)
+
+                pairs = sorted(zip(stats, entries), key=lambda pair: getattr(pair[0], field), reverse=True)
+                entries = [entry for _, entry in pairs]
 
         if flags.order is not None:
             if flags.order in ('d', 'descending'):
                 entries.reverse()
 
+        return entries
+
+    def query_columns(
+        self, user: User, columns: PokemonColumns, plan: QueryPlan, flags: PokemonFlags
+    ) -> List[UserPokemon]:
+        indexes = columns.filter(plan)
+
+        if flags.sort is not None:
+            if flags.sort == 'iv':
+                indexes = columns.sort(indexes, 'iv_total')
+            elif flags.sort == 'level':
+                indexes = columns.sort(indexes, 'level')
+            else:
+                field = 'health' if flags.sort == 'hp' else flags.sort
+                indexes = columns.sort_by(
+                    indexes, lambda pokemons: [getattr(stats, field) for stats in user.get_stats(pokemons)]
+                )
+
+        if flags.order is not None:
+            if flags.order in ('d', 'descending'):
+                indexes = indexes[::-1]
+
+        return columns.get(indexes)
+
+    @commands.command(aliases=['p'])
+    async def pokemons(self, ctx: Context, *, flags: PokemonFlags = PokemonFlags.default()):
+        user = ctx.pool.user
+
+        try:
+            plan = QueryPlan.from_flags(flags, self.bot.pokedex, UserPokemon.QUERY_FIELDS, name_field='nickname')
+        except ValueError as e:
+            return await ctx.send(f'{e}.')
+
+        if flags.sort is None and flags.order is None and not user.pokemons.complete:
+            # Nothing needs every entry at once, so the pokemons get paged in as the menu is scrolled through
+            iterator = (entry async for entry in user.pokemons.iterate() if plan.matches(entry))
+
+            stream = PokemonsStreamSource(user, iterator, total=None if plan else len(user.pokemons))
+            try:
+                await stream.get_page(0)
+            except IndexError:
+                return await ctx.send('No results found.')
+
+            return await PokemonsMenu(stream).start(ctx)
+
+        await user.pokemons.load()
+
+        # Without filters or a sort the loop is just a copy of the collection, which beats going through the columns
+        columns = user.pokemons.get_columns() if plan or flags.sort is not None else None
+        if columns is not None:
+            entries = self.query_columns(user, columns, plan, flags)
+        else:
+            entries = self.filter_pokemons(user, plan, flags)
+
         if not entries:
             return await ctx.send('No results found.')
 
         source = PokemonsSource(ctx.pool.user, entries)
-        pages = menus.MenuPages(source)
+        pages = PokemonsMenu(source)
 
         await pages.start(ctx)
     
@@ -142,11 +240,12 @@ class Pokemons(commands.Cog):
         if not view.value:
             return await ctx.send('Aborted.')
 
+        after = min(pokemon.catch_id for pokemon in pokemons) - 1
         for pokemon in pokemons:
             await pokemon.release()
 
         await ctx.send(f'Successfully released {len(pokemons)} pokémons')
-        await ctx.pool.user.reindex()
+        await ctx.pool.user.reindex(after=after)
 
     @commands.command(aliases=['nick'])
     async def nickname(
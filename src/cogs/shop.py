@@ -37,7 +37,7 @@ class Shop(commands.Cog):
             return await ctx.send(f'You need to have either {name1} or {name2} selected.')
 
         search = dex1 if selected.dex.id == dex2 else dex2
-        pokemons = ctx.pool.user.get_pokemons(search)
+        pokemons = await ctx.pool.user.fetch_pokemons(search)
         if not pokemons:
             return await ctx.send(f'You need to have both {name1} and {name2}.')
 
@@ -1,4 +1,4 @@
-from typing import Callable, Dict, Tuple
+from typing import Callable, Dict, Optional, Tuple
 import discord
 from discord.ext import commands
 import asyncio
@@ -51,7 +51,7 @@ class Spawns(commands.Cog):
             level = random.randint(1, 50)
 
             fmt = f'Congratulations! You caught a level {level} {pokemon.default_name}. '
-            count = await ctx.pool.user.get_catch_count_for(pokemon.id)
+            count = ctx.pool.user.get_catch_count_for(pokemon.id)
         
             amount, func = CATCH_REWARDS.get(count, (0, lambda _: ''))
             fmt += func(pokemon)
@@ -91,24 +91,16 @@ class Spawns(commands.Cog):
 
         await self.wait(ctx.channel.id, pokemon, is_shiny)
 
-    async def should_spawn(self, message: discord.Message):
-        if not message.guild:
-            return False
+    def prefilter(self, message: discord.Message) -> Optional[Tuple[bool, bool]]:
+        # Whether a message spawns a pokemon and whether it could give exp, decided from `GuildIndex` without awaiting
+        # anything. Returns None while the index doesn't know about every guild yet.
+        assert message.guild
+        index = self.bot.pool.guild_index
+        if not index.complete:
+            return None
 
-        if message.author.bot:
-            return False
-
-        guild = await self.bot.pool.get_guild(message.guild.id)
-        if not guild:
-            return False
-
-        if not guild.spawn_channel_ids:
-            return False
-
-        if not chance(SpawnRates.Global):
-            return False
-        
-        return True
+        spawn = index.has_spawn_channels(message.guild.id) and chance(SpawnRates.Global)
+        return spawn, index.gives_exp(message.guild.id, message.channel.id)
 
     def generate_rarity(self) -> Tuple[Rarity, bool]:
         if chance(SpawnRates.UltraBeast):
@@ -146,15 +138,32 @@ class Spawns(commands.Cog):
 
     @commands.Cog.listener()
     async def on_message(self, message: discord.Message):
-        if message.guild is None:
+        if message.guild is None or message.author.bot:
+            return
+
+        index = self.bot.pool.guild_index
+        result = self.prefilter(message)
+        if result is not None and not any(result):
+            index.fast += 1
             return
 
+        index.slow += 1
+
         guild = await self.bot.pool.get_guild(message.guild.id)
-        if await self.should_spawn(message):
+        if not guild:
+            return
+
+        if result is None:
+            spawn = bool(guild.spawn_channel_ids) and chance(SpawnRates.Global)
+            result = spawn, message.channel.id in guild.exp_channel_ids
+
+        spawn, gives_exp = result
+        if spawn and guild.spawn_channel_ids:
             rarity, is_shiny = self.generate_rarity()
 
-            pokemon = self.bot.pokedex.random(rarity=rarity)
-            if not pokemon.enabled:
+            # Only enabled, catchable pokemons make it into the spawn tables
+            pokemon = self.bot.pokedex.spawns.sample(rarity)
+            if pokemon is None:
                 return
 
             embed = discord.Embed(title='Use p!catch <pokémon name> to catch the following pokémon.', color=0x36E3DD)
@@ -162,7 +171,6 @@ class Spawns(commands.Cog):
             embed.set_image(url='attachment://pokemon.png')
             file = discord.File(pokemon.images.default, filename='pokemon.png')
 
-            assert guild
             channel_id = random.choice(guild.spawn_channel_ids)
 
             channel = message.guild.get_channel(channel_id)
@@ -171,12 +179,11 @@ class Spawns(commands.Cog):
             await channel.send(embed=embed, file=file)
             return await self.wait(channel.id, pokemon, is_shiny)
 
-        user = await self.bot.pool.get_user(message.author.id)
-        if not user:
+        if not gives_exp:
             return
 
-        assert guild
-        if message.channel.id not in guild.exp_channel_ids:
+        user = await self.bot.pool.get_user(message.author.id)
+        if not user:
             return
 
         selected = user.get_selected()
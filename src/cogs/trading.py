@@ -1,9 +1,10 @@
 from __future__ import annotations
 
-from typing import Dict, List, NamedTuple
+from typing import Dict, List, NamedTuple, Tuple
 
 import discord
 import asyncio
+import time
 from discord.ext import commands
 
 from src.bot import Pokecord
@@ -11,6 +12,21 @@ from src.database import User
 from src.utils import Context, ConfirmationView
 from src.database.user import UserPokemon
 
+def _get_affected_rows(status: str) -> int:
+    # asyncpg returns the command tag, e.g. `UPDATE 2`
+    return int(status.rsplit(' ', 1)[-1])
+
+class TradeSettlement(NamedTuple):
+    user: User
+    credits: int
+    redeems: int
+    selected: int
+    catch_id: int
+    # Every pokemon the user ends up with, ordered by their new catch ids
+    pokemons: List[UserPokemon]
+    # (pokemon, new catch id) for every pokemon that either changes owner or gets renumbered
+    moves: List[Tuple[UserPokemon, int]]
+
 class UserTrade:
     def __init__(self, user: User) -> None:
         self.user = user
@@ -24,14 +40,46 @@ class UserTrade:
     def empty(self) -> bool:
         return self.credits == 0 and len(self.pokemons) == 0 and self.redeems == 0
     
-    async def finish(self) -> List[UserPokemon]:
-        if self.credits:
-            await self.user.remove_credits(self.credits)
+    def settle(self, other: UserTrade) -> TradeSettlement:
+        user = self.user
+        if self.credits > user.credits:
+            raise ValueError(f'User {user.id} does not have enough credits')
+
+        if self.redeems > user.redeems:
+            raise ValueError(f'User {user.id} does not have enough redeems')
+
+        for pokemon in self.pokemons:
+            if user.pokemons.get(pokemon.catch_id) is not pokemon:
+                raise ValueError(f'Pokemon {pokemon.nickname!r} is no longer owned by user {user.id}')
+
+        # Catch ids get compacted as part of the settlement, so neither user needs to be reindexed afterwards
+        outgoing = {pokemon.id for pokemon in self.pokemons}
+        pokemons = sorted(
+            (pokemon for pokemon in user.pokemons.values() if pokemon.id not in outgoing),
+            key=lambda pokemon: pokemon.catch_id
+        )
+        pokemons.extend(other.pokemons)
 
-        if self.redeems:
-            await self.user.remove_redeems(self.redeems)
+        moves = [
+            (pokemon, index) for index, pokemon in enumerate(pokemons, start=1)
+            if pokemon.catch_id != index or pokemon.user is not user
+        ]
 
-        return self.pokemons
+        selected = user.get_selected()
+        if selected is None or selected.id in outgoing:
+            selected_id = 1
+        else:
+            selected_id = next((index for pokemon, index in moves if pokemon is selected), selected.catch_id)
+
+        return TradeSettlement(
+            user=user,
+            credits=other.credits - self.credits,
+            redeems=other.redeems - self.redeems,
+            selected=selected_id,
+            catch_id=len(pokemons),
+            pokemons=pokemons,
+            moves=moves
+        )
 
     def add_credits(self, amount: int) -> None:
         self.credits += amount
@@ -83,24 +131,77 @@ class Trade:
         else:
             self.p2.confirmed = True
 
-    async def finish(self) -> None:
-        traded1 = await self.p1.finish()
-        if self.p1.credits:
-            await self.user2.add_credits(self.p1.credits)
-        if self.p1.redeems:
-            await self.user2.add_redeems(self.p1.redeems)
-
-        traded2 = await self.p2.finish()
-        if self.p2.credits:
-            await self.user1.add_credits(self.p2.credits)
-        if self.p2.redeems:
-            await self.user1.add_redeems(self.p2.redeems)
-
-        for trade in traded1:
-            await trade.transfer(self.user2)
+    async def finish(self) -> float:
+        # Settling renumbers every pokemon of both users, so their whole collections are needed
+        for user in (self.user1, self.user2):
+            await user.pokemons.load()
+
+        settlements = (self.p1.settle(self.p2), self.p2.settle(self.p1))
+        moves = [
+            (pokemon, settlement.user, catch_id) for settlement in settlements for pokemon, catch_id in settlement.moves
+        ]
+
+        pool = self.user1.pool
+        start = time.perf_counter()
+
+        # Both ledgers and every pokemon move in one transaction, so a failure leaves nothing half-applied
+        async with pool.acquire() as conn:
+            async with conn.transaction():
+                status = await pool.statements.execute(
+                    'users.settle_trade',
+                    [settlement.user.id for settlement in settlements],
+                    [settlement.credits for settlement in settlements],
+                    [settlement.redeems for settlement in settlements],
+                    [settlement.selected for settlement in settlements],
+                    [settlement.catch_id for settlement in settlements],
+                    connection=conn
+                )
+
+                if _get_affected_rows(status) != len(settlements):
+                    raise ValueError('One of the users does not have enough credits or redeems')
+
+                if moves:
+                    status = await pool.statements.execute(
+                        'pokemons.settle_trade',
+                        [str(pokemon.id) for pokemon, _, _ in moves],
+                        [pokemon.user.id for pokemon, _, _ in moves],
+                        [user.id for _, user, _ in moves],
+                        [catch_id for _, _, catch_id in moves],
+                        connection=conn
+                    )
+
+                    if _get_affected_rows(status) != len(moves):
+                        raise ValueError('Some of the traded pokemons changed owner during the trade')
+
+        elapsed = time.perf_counter() - start
+
+        # Nothing in memory is touched until the transaction has been committed
+        for trade, other in ((self.p1, self.p2), (self.p2, self.p1)):
+            for pokemon in trade.pokemons:
+                trade.user.count_pokemon(pokemon.entry.dex_id, pokemon.entry.is_shiny, -1)
+                other.user.count_pokemon(pokemon.entry.dex_id, pokemon.entry.is_shiny)
+
+        for pokemon, user, catch_id in moves:
+            pokemon.user = user
+            pokemon.entry.owner_id = user.id
+            pokemon.entry.catch_id = catch_id
+            pokemon.entry.mark_clean('owner_id', 'catch_id')
+
+        for settlement in settlements:
+            user = settlement.user
+
+            user.pokemons.reset(settlement.pokemons)
+            user.data['credits'] += settlement.credits
+            user.data['redeems'] += settlement.redeems
+            user.data['selected'] = settlement.selected
+            user.data['catch_id'] = settlement.catch_id
+
+        pool.bot.logger.info(
+            'Settled trade between %s and %s (%s pokemons moved) in %.2fms.',
+            self.user1.id, self.user2.id, len(moves), elapsed * 1000
+        )
 
-        for trade in traded2:
-            await trade.transfer(self.user1)
+        return elapsed
 
 class StoredTrade(NamedTuple):
     trade: Trade
@@ -200,29 +301,31 @@ class Trades(commands.Cog):
 
         trade = StoredTrade(Trade(ctx.pool.user, user1), message, ctx.author, user, lock, future)
 
-        self.trades[user.id] = trade
-        self.trades[ctx.author.id] = trade
-
-        await asyncio.sleep(1)
-        await self.refresh(trade)
+        # Both users have to stay cached for the whole trade since it holds on to their pokemons
+        with self.bot.pool.users.pinned(ctx.author.id, user.id):
+            self.trades[user.id] = trade
+            self.trades[ctx.author.id] = trade
 
-        try:
-            await asyncio.wait_for(future, timeout=Pokecord.TRADE_TIMEOUT)
-        except asyncio.TimeoutError:
-            return await ctx.send('Trade timeout.')
+            await asyncio.sleep(1)
+            await self.refresh(trade)
 
-        self.trades.pop(ctx.author.id); self.trades.pop(user.id)
+            try:
+                await asyncio.wait_for(future, timeout=Pokecord.TRADE_TIMEOUT)
+            except asyncio.TimeoutError:
+                return await ctx.send('Trade timeout.')
 
-        result = future.result()
-        if not result:
-            return await ctx.send('Aborted.')
+            self.trades.pop(ctx.author.id); self.trades.pop(user.id)
 
-        await trade.trade.finish()
+            result = future.result()
+            if not result:
+                return await ctx.send('Aborted.')
 
-        await ctx.pool.user.reindex()
-        await user1.reindex()
+            try:
+                await trade.trade.finish()
+            except ValueError as e:
+                return await ctx.send(f'Could not complete the trade: {e}.')
 
-        await ctx.send(f'Successfully traded with {user}.')
+            await ctx.send(f'Successfully traded with {user}.')
 
     @trade.command(aliases=['c'])
     async def confirm(self, ctx: Context):
@@ -0,0 +1,203 @@
+from __future__ import annotations
+
+from typing import Any, Callable, Counter, Dict, Generic, Iterator, List, NamedTuple, Optional, Tuple, TypeVar
+
+import collections
+import contextlib
+
+K = TypeVar('K')
+V = TypeVar('V')
+
+__all__ = ('CacheStats', 'Cache')
+
+_MISSING: Any = object()
+
+class CacheStats(NamedTuple):
+    size: int
+    bytes: int
+    hits: int
+    misses: int
+    evictions: int
+
+    @property
+    def hit_rate(self) -> float:
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+class Cache(Generic[K, V]):
+    # An LRU cache bounded by an entry count and/or an estimated byte size.
+    # Pinned entries, and entries rejected by `can_evict`, are skipped when evicting, so the cache can temporarily
+    # grow past its limits if everything else is in use.
+    def __init__(
+        self,
+        *,
+        max_size: Optional[int] = None,
+        max_bytes: Optional[int] = None,
+        sizeof: Optional[Callable[[V], int]] = None,
+        can_evict: Optional[Callable[[K, V], bool]] = None
+    ) -> None:
+        self.max_size = max_size
+        self.max_bytes = max_bytes
+
+        self._sizeof = sizeof
+        self._can_evict = can_evict
+
+        # { key: (value, estimated size) }, ordered from least to most recently used
+        self._entries: collections.OrderedDict[K, Tuple[V, int]] = collections.OrderedDict()
+        self._pins: Counter[K] = collections.Counter()
+
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __repr__(self) -> str:
+        return f'<Cache size={len(self)} bytes={self.bytes} max_size={self.max_size} max_bytes={self.max_bytes}>'
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def __iter__(self) -> Iterator[K]:
+        return iter(self._entries)
+
+    def __contains__(self, key: K) -> bool:
+        return key in self._entries
+
+    def __getitem__(self, key: K) -> V:
+        value = self.get(key, _MISSING)
+        if value is _MISSING:
+            raise KeyError(key)
+
+        return value
+
+    def __setitem__(self, key: K, value: V) -> None:
+        self._store(key, value)
+        self._evict(keep=key)
+
+    def __delitem__(self, key: K) -> None:
+        _, size = self._entries.pop(key)
+        self.bytes -= size
+
+    @property
+    def stats(self) -> CacheStats:
+        return CacheStats(
+            size=len(self._entries), bytes=self.bytes, hits=self.hits, misses=self.misses, evictions=self.evictions
+        )
+
+    def _get_size(self, value: V) -> int:
+        return self._sizeof(value) if self._sizeof is not None else 0
+
+    def _store(self, key: K, value: V) -> None:
+        size = self._get_size(value)
+        if key in self._entries:
+            self.bytes -= self._entries[key][1]
+
+        self._entries[key] = (value, size)
+        self._entries.move_to_end(key)
+
+        self.bytes += size
+
+    def _is_full(self) -> bool:
+        if self.max_size is not None and len(self._entries) > self.max_size:
+            return True
+
+        return self.max_bytes is not None and self.bytes > self.max_bytes
+
+    def _evict(self, keep: Any = _MISSING) -> None:
+        if not self._is_full():
+            return
+
+        # Entries that can't be evicted right now get moved to the back, which bounds this loop to one pass.
+        # `keep` is the entry that was just stored, evicting it right away would make storing it pointless.
+        for _ in range(len(self._entries)):
+            key, (value, size) = next(iter(self._entries.items()))
+            if (
+                key == keep
+                or self._pins[key]
+                or (self._can_evict is not None and not self._can_evict(key, value))
+            ):
+                self._entries.move_to_end(key)
+            else:
+                del self._entries[key]
+                self.bytes -= size
+                self.evictions += 1
+
+            if not self._is_full():
+                break
+
+    def get(self, key: K, default: Any = None) -> Any:
+        entry = self._entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return default
+
+        self.hits += 1
+
+        # Entries like users grow over time, so their size is re-estimated whenever they're used
+        value, size = entry
+        new = self._get_size(value)
+        if new != size:
+            self._entries[key] = (value, new)
+            self.bytes += new - size
+
+        self._entries.move_to_end(key)
+        return value
+
+    def peek(self, key: K, default: Any = None) -> Any:
+        # Same as `get` without counting as a use of the entry
+        entry = self._entries.get(key)
+        return entry[0] if entry is not None else default
+
+    def pop(self, key: K, default: Any = None) -> Any:
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return default
+
+        self.bytes -= entry[1]
+        return entry[0]
+
+    def setdefault(self, key: K, value: V) -> V:
+        existing = self.get(key, _MISSING)
+        if existing is not _MISSING:
+            return existing
+
+        self[key] = value
+        return value
+
+    def keys(self) -> List[K]:
+        return list(self._entries.keys())
+
+    def values(self) -> List[V]:
+        return [value for value, _ in self._entries.values()]
+
+    def items(self) -> List[Tuple[K, V]]:
+        return [(key, value) for key, (value, _) in self._entries.items()]
+
+    def clear(self) -> None:
+        self._entries.clear()
+        self.bytes = 0
+
+    def pin(self, key: K) -> None:
+        self._pins[key] += 1
+
+    def unpin(self, key: K) -> None:
+        self._pins[key] -= 1
+        if self._pins[key] <= 0:
+            del self._pins[key]
+
+        # Anything that was kept around because of this pin can go now
+        self._evict()
+
+    def is_pinned(self, key: K) -> bool:
+        return self._pins[key] > 0
+
+    @contextlib.contextmanager
+    def pinned(self, *keys: K) -> Iterator[None]:
+        for key in keys:
+            self.pin(key)
+
+        try:
+            yield
+        finally:
+            for key in keys:
+                self.unpin(key)
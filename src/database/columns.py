@@ -0,0 +1,111 @@
+from __future__ import annotations
+
+from typing import TYPE_CHECKING, Any, Callable, Dict, List, Sequence
+
+try:
+    import numpy as np
+except ImportError: # NumPy is optional, callers fall back to plain Python when it's missing
+    np = None
+
+if TYPE_CHECKING:
+    from src.utils import QueryPlan
+    from .user import UserPokemon
+
+__all__ = ('PokemonColumns',)
+
+if np is not None:
+    # How a `Predicate` operator is evaluated against a whole column at once
+    _OPERATORS: Dict[str, Callable[[Any, Any], Any]] = {
+        'eq': np.equal,
+        'gt': np.greater,
+        'lt': np.less,
+        'is': np.equal,
+        'in': lambda column, values: np.isin(column, np.fromiter(values, column.dtype, len(values))),
+        'range': lambda column, bounds: (column >= bounds[0]) & (column < bounds[1]),
+    }
+
+    # IV percentages only have 187 possible values, computing them through `IVs.round` keeps the rounding identical
+    _IV_PERCENTAGES = np.array([round((total / 186) * 100, 2) for total in range(187)], np.float64)
+
+class PokemonColumns:
+    # A columnar snapshot of a user's pokemons, one NumPy array per field that can be filtered or sorted on, so that
+    # queries over huge collections become boolean masks and argsorts instead of Python loops over `UserPokemon`s.
+    # Row `i` of every array describes `pokemons[i]`, which are in catch id order.
+    def __init__(self, pokemons: Sequence[UserPokemon]) -> None:
+        if np is None:
+            raise RuntimeError('NumPy is required to use PokemonColumns')
+
+        self.pokemons: List[UserPokemon] = list(pokemons)
+        entries = [pokemon.entry for pokemon in self.pokemons]
+        count = len(entries)
+
+        self.catch_id = np.fromiter((entry.catch_id for entry in entries), np.int64, count)
+        self.dex_id = np.fromiter((entry.dex_id for entry in entries), np.int32, count)
+        self.level = np.fromiter((entry.level for entry in entries), np.int16, count)
+        # Sorting on the IV total is the same as sorting on the rounded IV percentage
+        self.iv_total = np.fromiter((sum(entry.ivs) for entry in entries), np.int16, count)
+        self.iv_percentage = _IV_PERCENTAGES[self.iv_total]
+        self.shiny = np.fromiter((entry.is_shiny for entry in entries), np.bool_, count)
+        self.favourite = np.fromiter((entry.is_favourite for entry in entries), np.bool_, count)
+
+        # { query field: column }, see `UserPokemon.QUERY_FIELDS`
+        self.columns: Dict[str, Any] = {
+            'dex_id': self.dex_id,
+            'level': self.level,
+            'iv': self.iv_percentage,
+            'shiny': self.shiny,
+            'favourite': self.favourite,
+        }
+
+    def __repr__(self) -> str:
+        return f'<PokemonColumns size={len(self)}>'
+
+    def __len__(self) -> int:
+        return len(self.pokemons)
+
+    @staticmethod
+    def available() -> bool:
+        return np is not None
+
+    def filter(self, plan: QueryPlan) -> Any:
+        # Returns the (ascending) indexes of the rows matching the plan. Predicates on a column are evaluated as
+        # boolean masks, the rest of the plan (nicknames, natures) is only checked for the rows that are left.
+        mask = np.ones(len(self), np.bool_)
+        handled: List[str] = []
+
+        for predicate in plan.predicates:
+            column = self.columns.get(predicate.field)
+            if column is None or predicate.op not in _OPERATORS:
+                continue
+
+            mask &= _OPERATORS[predicate.op](column, predicate.value)
+            handled.append(predicate.field)
+
+        indexes = np.flatnonzero(mask)
+
+        rest = plan.without(*handled)
+        if rest:
+            pokemons = self.pokemons
+            indexes = np.fromiter(
+                (index for index in indexes.tolist() if rest.matches(pokemons[index])), np.int64
+            )
+
+        return indexes
+
+    def sort(self, indexes: Any, key: str, *, descending: bool = True) -> Any:
+        # Stable, so pokemons with the same value stay in catch id order just like with `list.sort`
+        values = getattr(self, key)[indexes]
+        order = np.argsort(-values.astype(np.int64) if descending else values, kind='stable')
+
+        return indexes[order]
+
+    def sort_by(self, indexes: Any, key: Callable[[List[UserPokemon]], Sequence[int]], *, descending: bool = True) -> Any:
+        # Same as `sort` for values that aren't stored as a column, `key` is called once with every selected pokemon
+        values = np.asarray(key(self.get(indexes)), np.int64)
+        order = np.argsort(-values if descending else values, kind='stable')
+
+        return indexes[order]
+
+    def get(self, indexes: Any) -> List[UserPokemon]:
+        pokemons = self.pokemons
+        return [pokemons[index] for index in indexes.tolist()]
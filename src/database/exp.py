@@ -0,0 +1,169 @@
+from __future__ import annotations
+
+from typing import TYPE_CHECKING, ClassVar, Dict, List, NamedTuple, Optional, Set
+
+from discord.ext import tasks
+import asyncio
+import time
+import uuid
+
+if TYPE_CHECKING:
+    from .user import UserPokemon
+    from .pool import Pool
+
+__all__ = ('ExpBufferStats', 'ExpBuffer')
+
+class ExpBufferStats(NamedTuple):
+    pending: int
+    flushes: int
+    written: int
+    last_batch_size: int
+    max_batch_size: int
+    last_flush_lag: float
+    max_flush_lag: float
+
+class ExpBuffer:
+    FLUSH_INTERVAL: ClassVar[float] = 30.0
+    MAX_PENDING: ClassVar[int] = 500
+
+    def __init__(self, pool: Pool) -> None:
+        self.pool = pool
+
+        # { pokemon_id: exp }
+        # We only keep the latest exp value of every pokemon since `UserPokemon.data` is the source of truth,
+        # which means that flushing the same batch twice is harmless.
+        self.pending: Dict[uuid.UUID, int] = {}
+        # { user_id: count }
+        # Users owning a pending or in-flight pokemon, these can't be evicted from the user cache until their exp has
+        # been committed, otherwise a reload would read stale exp from the database.
+        self.owners: Dict[int, int] = {}
+        self.lock = asyncio.Lock()
+
+        # { pokemon_id: user_id } for every pokemon counted in `owners`
+        self._owned: Dict[uuid.UUID, int] = {}
+        # Ids of the batch currently being written
+        self._inflight: Set[uuid.UUID] = set()
+
+        self._oldest: Optional[float] = None
+
+        self.flushes = 0
+        self.written = 0
+        self.last_batch_size = 0
+        self.max_batch_size = 0
+        self.last_flush_lag = 0.0
+        self.max_flush_lag = 0.0
+
+    def __len__(self) -> int:
+        return len(self.pending)
+
+    @property
+    def stats(self) -> ExpBufferStats:
+        return ExpBufferStats(
+            pending=len(self.pending),
+            flushes=self.flushes,
+            written=self.written,
+            last_batch_size=self.last_batch_size,
+            max_batch_size=self.max_batch_size,
+            last_flush_lag=self.last_flush_lag,
+            max_flush_lag=self.max_flush_lag
+        )
+
+    def start(self) -> None:
+        if not self.loop.is_running():
+            self.loop.change_interval(seconds=self.FLUSH_INTERVAL)
+            self.loop.start()
+
+    def stop(self) -> None:
+        self.loop.cancel()
+
+    @tasks.loop(seconds=30)
+    async def loop(self) -> None:
+        try:
+            await self.flush()
+        except Exception:
+            self.pool.bot.logger.exception('Failed to flush %s buffered exp updates.', len(self.pending))
+
+    async def add(self, pokemon: UserPokemon) -> None:
+        if self._oldest is None:
+            self._oldest = time.monotonic()
+
+        self.pending[pokemon.id] = pokemon.exp
+        self._retain(pokemon.id, pokemon.user.id)
+
+        if len(self.pending) >= self.MAX_PENDING:
+            await self.flush()
+
+    def discard(self, pokemon: UserPokemon) -> None:
+        self.pending.pop(pokemon.id, None)
+
+        # An in-flight pokemon stays retained until its batch has been written
+        if pokemon.id not in self._inflight:
+            self._release(pokemon.id)
+
+    def _retain(self, pokemon_id: uuid.UUID, user_id: int) -> None:
+        owner = self._owned.get(pokemon_id)
+        if owner == user_id:
+            return
+
+        # The pokemon changed hands since it was buffered, its previous owner no longer needs to stay cached for it
+        if owner is not None:
+            self._release(pokemon_id)
+
+        self._owned[pokemon_id] = user_id
+        self.owners[user_id] = self.owners.get(user_id, 0) + 1
+
+    def _release(self, pokemon_id: uuid.UUID) -> None:
+        owner = self._owned.pop(pokemon_id, None)
+        if owner is None:
+            return
+
+        count = self.owners[owner] - 1
+        if count:
+            self.owners[owner] = count
+        else:
+            del self.owners[owner]
+
+    async def flush(self) -> int:
+        async with self.lock:
+            if not self.pending:
+                return 0
+
+            pending, self.pending = self.pending, {}
+            oldest, self._oldest = self._oldest, None
+            # Owners are only released once the write has committed
+            self._inflight = set(pending)
+
+            ids: List[str] = [str(id) for id in pending.keys()]
+            exps: List[int] = list(pending.values())
+
+            try:
+                await self.pool.statements.execute('pokemons.flush_exp', ids, exps)
+            except BaseException:
+                # Also when cancelled (e.g. `stop` during shutdown), otherwise the batch would be lost before the
+                # final flush. Anything that got buffered while we were writing is newer than what we tried to write.
+                # The owners were never released, so they stay retained along with the batch.
+                for id, exp in pending.items():
+                    self.pending.setdefault(id, exp)
+
+                if oldest is not None:
+                    self._oldest = oldest if self._oldest is None else min(oldest, self._oldest)
+
+                raise
+            finally:
+                self._inflight = set()
+
+            # Pokemons buffered again while we were writing still have a pending update, so their owners stay retained
+            for id in pending:
+                if id not in self.pending:
+                    self._release(id)
+
+            lag = time.monotonic() - oldest if oldest is not None else 0.0
+
+            self.flushes += 1
+            self.written += len(pending)
+            self.last_batch_size = len(pending)
+            self.max_batch_size = max(self.max_batch_size, len(pending))
+            self.last_flush_lag = lag
+            self.max_flush_lag = max(self.max_flush_lag, lag)
+
+            return len(pending)
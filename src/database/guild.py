@@ -1,6 +1,6 @@
 from __future__ import annotations
 
-from typing import TYPE_CHECKING, Any, List, Optional, Dict, Any
+from typing import TYPE_CHECKING, Any, FrozenSet, List, NamedTuple, Optional, Dict, Any, Set
 
 import asyncpg
 import discord
@@ -8,11 +8,71 @@ import discord
 if TYPE_CHECKING:
     from .pool import Pool
 
+__all__ = ('GuildIndexStats', 'GuildIndex', 'Guild')
+
+class GuildIndexStats(NamedTuple):
+    guilds: int
+    fast: int
+    slow: int
+
+    @property
+    def fast_rate(self) -> float:
+        total = self.fast + self.slow
+        return self.fast / total if total else 0.0
+
+class GuildIndex:
+    # Which guilds have spawn channels and which channels give exp, kept up to date by every `Guild` so that
+    # `Spawns.on_message` can throw away messages that can neither spawn nor give exp without awaiting anything.
+    # Guilds without any of those channels aren't stored at all, which is only correct once every guild the bot is in
+    # has been loaded, hence `complete`. Until then every message has to go through the cache/database.
+    def __init__(self) -> None:
+        self.spawns: Set[int] = set()
+        # { guild_id: exp channel ids }
+        self.exp_channels: Dict[int, FrozenSet[int]] = {}
+        self.complete = False
+
+        # Messages handled from the index alone, and messages that needed the actual guild
+        self.fast = 0
+        self.slow = 0
+
+    def __repr__(self) -> str:
+        return f'<GuildIndex spawns={len(self.spawns)} exp={len(self.exp_channels)} complete={self.complete}>'
+
+    @property
+    def stats(self) -> GuildIndexStats:
+        return GuildIndexStats(
+            guilds=len(self.spawns | self.exp_channels.keys()), fast=self.fast, slow=self.slow
+        )
+
+    def update(self, guild: Guild) -> None:
+        if guild.spawn_channel_ids:
+            self.spawns.add(guild.id)
+        else:
+            self.spawns.discard(guild.id)
+
+        if guild.exp_channel_ids:
+            self.exp_channels[guild.id] = frozenset(guild.exp_channel_ids)
+        else:
+            self.exp_channels.pop(guild.id, None)
+
+    def remove(self, guild_id: int) -> None:
+        self.spawns.discard(guild_id)
+        self.exp_channels.pop(guild_id, None)
+
+    def has_spawn_channels(self, guild_id: int) -> bool:
+        return guild_id in self.spawns
+
+    def gives_exp(self, guild_id: int, channel_id: int) -> bool:
+        channels = self.exp_channels.get(guild_id)
+        return channels is not None and channel_id in channels
+
 class Guild:
     def __init__(self, record: asyncpg.Record, pool: Pool) -> None:
         self.data: Dict[str, Any] = dict(record)
         self.pool = pool
 
+        pool.guild_index.update(self)
+
     @property
     def id(self) -> int:
         return self.data['id']
@@ -30,13 +90,15 @@ class Guild:
         return self.data['prefix']
 
     async def set_spawn_channels(self, channel_ids: List[int]):
-        await self.pool.execute('UPDATE guilds SET spawn_channels = $1 WHERE id = $2', channel_ids, self.id)
+        await self.pool.statements.execute('guilds.set_spawn_channels', channel_ids, self.id)
         self.data['spawn_channels'] = channel_ids
+        self.pool.guild_index.update(self)
 
     async def set_prefix(self, prefix: str):
-        await self.pool.execute('UPDATE guilds SET prefix = $1 WHERE id = $2', prefix, self.id)
+        await self.pool.statements.execute('guilds.set_prefix', prefix, self.id)
         self.data['prefix'] = prefix
 
     async def set_exp_channels(self, channel_ids: List[int]):
-        await self.pool.execute('UPDATE guilds SET exp_channels = $1 WHERE id = $2', channel_ids, self.id)
+        await self.pool.statements.execute('guilds.set_exp_channels', channel_ids, self.id)
         self.data['exp_channels'] = channel_ids
+        self.pool.guild_index.update(self)
\ No newline at end of file
@@ -1,6 +1,6 @@
 from __future__ import annotations
 
-from typing import TYPE_CHECKING, Any, List, Optional, Tuple
+from typing import TYPE_CHECKING, Optional
 import dataclasses
 
 from enum import IntEnum
@@ -56,24 +56,13 @@ class ShopItem:
         kind: Optional[ShopItemKind] = None,
         price: Optional[int] = None
     ) -> None:
-        names: List[str] = []
-        values: List[Any] = []
-
         if name is not None:
-            names.append('name'); values.append(name); self.name = name
+            self.name = name
         if description is not None:
-            names.append('description'); values.append(description); self.description = description
+            self.description = description
         if kind is not None:
-            names.append('kind'); values.append(kind); self.kind = kind
+            self.kind = kind
         if price is not None:
-            names.append('price'); values.append(price); self.price = price
-
-        query = 'UPDATE items SET '
-        query += ', '.join([f'{k} = ${i}' for i, k in enumerate(names, start=1)]) + ' '
-
-        query += 'VALUES('
-        query += ', '.join([f'${i}' for i in range(1, len(names) + 1)])
-
-        query += ')'
+            self.price = price
 
-        await self.pool.execute(query, *values)
+        await self.pool.statements.execute('items.edit', name, description, kind, price, self.id)
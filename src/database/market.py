@@ -1,28 +1,73 @@
 from __future__ import annotations
 
-from typing import Dict, TYPE_CHECKING, Any, List, Optional
+from typing import (
+    AbstractSet, Callable, ClassVar, DefaultDict, Dict, TYPE_CHECKING, Any, Iterable, List, NamedTuple, Optional, Set
+)
 
+import collections
+import heapq
 import uuid
 import asyncpg
 
+from src.utils import OrderBook
+from src.utils.pokedex import Rarity
+from .pokemons import IVs
 from .user import Pokemon, User, UserPokemon
 
 if TYPE_CHECKING:
     from .pool import Pool
 
+class MarketPokemon(NamedTuple):
+    dex_id: int
+    level: int
+    iv_percentage: float
+    is_shiny: bool
+    nickname: str
+    nature: str
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> MarketPokemon:
+        return cls(
+            dex_id=data['dex_id'],
+            level=data['level'],
+            iv_percentage=IVs.from_dict(data['ivs']).round(),
+            is_shiny=data['is_shiny'],
+            nickname=data['nickname'],
+            nature=data['nature']
+        )
+
 class MarketListing:
-    def __init__(self, market: Market, data: Dict[str, Any]) -> None:
+    # Fields a `QueryPlan` can filter listings on
+    QUERY_FIELDS: ClassVar[Dict[str, Callable[[MarketListing], Any]]] = {
+        'dex_id': lambda listing: listing.pokemon.dex_id,
+        'level': lambda listing: listing.pokemon.level,
+        'iv': lambda listing: listing.pokemon.iv_percentage,
+        'shiny': lambda listing: listing.pokemon.is_shiny,
+        'nature': lambda listing: listing.pokemon.nature,
+        'price': lambda listing: listing.data['price'],
+    }
+
+    def __init__(self, market: Market, data: Dict[str, Any], pokemon: MarketPokemon) -> None:
         self.data = data
         self.market = market
         self.pool = market.pool
 
+        # A snapshot of the listed pokemon so searching the market doesn't need to fetch every single one of them,
+        # listed pokemons can't be edited which means it can never go stale.
+        self.pokemon = pokemon
+
     def __repr__(self) -> str:
         return f'<MarketListing id={self.id} price={self.price} owner_id={self.owner_id} pokemon_id={str(self.pokemon_id)!r}>'
 
     @classmethod
-    def create(cls, market: Market, id: int, price: int, owner_id: int, pokemon_id: uuid.UUID):
+    def create(cls, market: Market, id: int, price: int, owner_id: int, pokemon_id: uuid.UUID, pokemon: MarketPokemon):
         data = {'id': id, 'price': price, 'owner_id': owner_id, 'pokemon_id': pokemon_id}
-        return cls(market, data)
+        return cls(market, data, pokemon)
+
+    @classmethod
+    def from_record(cls, market: Market, record: asyncpg.Record) -> MarketListing:
+        data = {key: record[key] for key in ('id', 'price', 'owner_id', 'pokemon_id')}
+        return cls(market, data, MarketPokemon.from_dict(record))
 
     @property
     def id(self) -> int:
@@ -41,7 +86,7 @@ class MarketListing:
         return self.data['pokemon_id']
 
     async def fetch_pokemon_data(self) -> Dict[str, Any]:
-        record = await self.pool.fetchrow('SELECT * FROM pokemons WHERE id = $1', str(self.pokemon_id))
+        record = await self.pool.statements.fetchrow('pokemons.get', str(self.pokemon_id))
         assert record
 
         return dict(record)
@@ -54,80 +99,224 @@ class MarketListing:
         return await self.pool.get_user(self.owner_id) # type: ignore
 
     async def buy(self, user: User) -> None:
-        owner = await self.fetch_owner()
+        async with self.pool.acquire() as conn:
+            async with conn.transaction():
+                record = await self.pool.statements.fetchrow('market.buy', self.id, user.id, connection=conn)
+                if record is None:
+                    # Either someone else bought it first, it got removed, or the buyer can't afford it anymore
+                    raise ValueError('That listing is no longer available')
 
-        # Assuming checks have been done before to ensure the buyer has enough credits
-        await owner.add_credits(self.price)
-        await user.remove_credits(self.price)
-    
-        catch_id = user.catch_id + 1
-        await self.pool.execute(
-            'UPDATE pokemons SET owner_id = $1, catch_id = $2, is_listed = FALSE WHERE id = $3', 
-            user.id, catch_id, self.pokemon_id
-        )
+        self.market.remove_listing(self.id)
 
-        data = await self.fetch_pokemon_data()
-        user.pokemons[catch_id] = UserPokemon(user, data)
+        pokemon = UserPokemon.from_dict(user, record)
+        user.pokemons[pokemon.catch_id] = pokemon
 
-        await self.pool.execute('UPDATE users SET pokemons = ARRAY_APPEND(users.pokemons, $1) WHERE id = $2', self.pokemon_id, user.id)
-        await self.delete()
+        user.data['credits'] -= self.price
+        user.data['catch_id'] = pokemon.catch_id
+        user.count_pokemon(pokemon.entry.dex_id, pokemon.entry.is_shiny)
 
-        self.market.listings.pop(self.id)
+        owner = self.pool.users.peek(self.owner_id)
+        if owner is not None:
+            owner.data['credits'] += self.price
+            owner.count_pokemon(pokemon.entry.dex_id, pokemon.entry.is_shiny, -1)
 
     async def cancel(self) -> None:
-        self.market.listings.pop(self.id)
-        await self.delete()
-
-        user = await self.pool.get_user(self.owner_id)
-        assert user
-
-        await self.pool.execute('UPDATE users SET pokemons = ARRAY_APPEND(users.pokemons, $1) WHERE id = $2', self.pokemon_id, self.owner_id)
-        record = await self.pool.fetchrow('SELECT * FROM pokemons WHERE id = $1', self.pokemon_id)
-        assert record
-
-        catch_id = user.catch_id + 1
-        await self.pool.execute('UPDATE pokemons SET catch_id = $1 WHERE id = $2', catch_id, self.pokemon_id)
+        async with self.pool.acquire() as conn:
+            async with conn.transaction():
+                record = await self.pool.statements.fetchrow('market.cancel', self.id, self.owner_id, connection=conn)
+                if record is None:
+                    raise ValueError('That listing is no longer available')
 
+        self.market.remove_listing(self.id)
 
-        user.pokemons[catch_id] = UserPokemon(user, dict(record))
+        user = self.pool.users.peek(self.owner_id)
+        if user is not None:
+            pokemon = UserPokemon.from_dict(user, record)
 
-        user.data['catch_id'] = catch_id
+            user.pokemons[pokemon.catch_id] = pokemon
+            user.data['catch_id'] = pokemon.catch_id
 
     async def delete(self) -> None:
-        await self.pool.execute('DELETE FROM market WHERE id = $1', self.id)
+        await self.pool.statements.execute('market.delete', self.id)
 
 class Market:
     def __init__(self, records: List[asyncpg.Record], pool: Pool) -> None:
         self.pool = pool
-        self.listings: Dict[int, MarketListing] = {
-            record['id']: MarketListing(self, dict(record)) for record in records
-        }
+        self.listings: Dict[int, MarketListing] = {}
+
+        # Secondary indexes used by `search`, all of them map to listing ids
+        self.by_species: DefaultDict[int, Set[int]] = collections.defaultdict(set)
+        self.by_rarity: DefaultDict[Rarity, Set[int]] = collections.defaultdict(set)
+        self.by_owner: DefaultDict[int, Set[int]] = collections.defaultdict(set)
+        self.shiny: Set[int] = set()
+
+        # { dex_id: order book of (price, listing id) }
+        self.books: Dict[int, OrderBook] = {}
+
+        for record in records:
+            self._add_listing(MarketListing.from_record(self, record))
 
     @classmethod
     async def fetch(cls, pool: Pool) -> Market:
-        records = await pool.fetch('SELECT * FROM market')
+        records = await pool.statements.fetch('market.all')
         return cls(records, pool)
 
-    async def add_listing(self, price: int, pokemon: UserPokemon) -> MarketListing:
-        id: int = await self.pool.fetchval(
-            'INSERT INTO market(price, owner_id, pokemon_id) VALUES($1, $2, $3) RETURNING id',
-            price, pokemon.user.id, str(pokemon.id)
-        )
+    def _get_rarities(self, dex_id: int) -> List[Rarity]:
+        entry = self.pool.bot.pokedex.get_pokemon(dex_id)
+        if entry is None:
+            return []
 
-        selected = pokemon.get_new_catch_id()
-        pokemon.user.pokemons.pop(pokemon.catch_id)
+        rarities = [
+            rarity for rarity, value in (
+                (Rarity.Legendary, entry.rarity.legendary),
+                (Rarity.Mythical, entry.rarity.mythical),
+                (Rarity.UltraBeast, entry.rarity.ultra_beast)
+            ) if value
+        ]
 
-        await self.pool.execute(
-            'UPDATE users SET pokemons = ARRAY_REMOVE(users.pokemons, $1), selected = $2 WHERE id = $3',
-            str(pokemon.id), selected, pokemon.user.id
-        )
+        return rarities or [Rarity.Common]
+
+    def _get_indexes(self, listing: MarketListing) -> List[Set[int]]:
+        pokemon = listing.pokemon
+        indexes = [self.by_species[pokemon.dex_id], self.by_owner[listing.owner_id]]
+        indexes.extend(self.by_rarity[rarity] for rarity in self._get_rarities(pokemon.dex_id))
+
+        if pokemon.is_shiny:
+            indexes.append(self.shiny)
+
+        return indexes
+
+    def _add_listing(self, listing: MarketListing) -> None:
+        self.listings[listing.id] = listing
+        for index in self._get_indexes(listing):
+            index.add(listing.id)
+
+        book = self.books.get(listing.pokemon.dex_id)
+        if book is None:
+            book = self.books[listing.pokemon.dex_id] = OrderBook()
+
+        book.add(listing.id, listing.price)
+
+    def remove_listing(self, id: int) -> Optional[MarketListing]:
+        listing = self.listings.pop(id, None)
+        if listing is None:
+            return None
+
+        for index in self._get_indexes(listing):
+            index.discard(listing.id)
 
-        await self.pool.execute(
-            'UPDATE pokemons SET nickname = $1, is_favourite = FALSE, is_listed = TRUE WHERE id = $2', pokemon.dex.default_name, str(pokemon.id)
+        for mapping, key in ((self.by_species, listing.pokemon.dex_id), (self.by_owner, listing.owner_id)):
+            if not mapping[key]:
+                del mapping[key]
+
+        book = self.books[listing.pokemon.dex_id]
+        book.remove(listing.id)
+
+        if not book:
+            del self.books[listing.pokemon.dex_id]
+
+        return listing
+
+    def iter_by_price(
+        self, dex_ids: Optional[Iterable[int]] = None, *, max_price: Optional[int] = None
+    ) -> Iterable[MarketListing]:
+        if dex_ids is None:
+            dex_ids = self.books.keys()
+
+        books = [self.books[dex_id] for dex_id in dex_ids if dex_id in self.books]
+        for _, id in heapq.merge(*(book.iter(max_price=max_price) for book in books)):
+            yield self.listings[id]
+
+    def get_cheapest(
+        self, dex_id: int, amount: int = 1, *, max_price: Optional[int] = None, exclude_owner: Optional[int] = None
+    ) -> List[MarketListing]:
+        listings: List[MarketListing] = []
+        if amount <= 0:
+            return listings
+
+        for listing in self.iter_by_price((dex_id,), max_price=max_price):
+            if listing.owner_id == exclude_owner:
+                continue
+
+            listings.append(listing)
+            if len(listings) >= amount:
+                break
+
+        return listings
+
+    def search(
+        self,
+        *,
+        dex_ids: Optional[AbstractSet[int]] = None,
+        legendary: bool = False,
+        mythical: bool = False,
+        ultra_beast: bool = False,
+        shiny: bool = False,
+        owner_id: Optional[int] = None,
+        order_by_price: bool = False
+    ) -> List[MarketListing]:
+        candidates: List[Set[int]] = []
+
+        if dex_ids is not None:
+            candidates.append(set().union(*(self.by_species.get(dex_id, ()) for dex_id in dex_ids)))
+        if legendary:
+            candidates.append(self.by_rarity.get(Rarity.Legendary, set()))
+        if mythical:
+            candidates.append(self.by_rarity.get(Rarity.Mythical, set()))
+        if ultra_beast:
+            candidates.append(self.by_rarity.get(Rarity.UltraBeast, set()))
+        if shiny:
+            candidates.append(self.shiny)
+        if owner_id is not None:
+            candidates.append(self.by_owner.get(owner_id, set()))
+
+        if candidates:
+            # Intersecting from the smallest set keeps this proportional to the most selective filter
+            candidates.sort(key=len)
+            ids = candidates[0].intersection(*candidates[1:])
+        else:
+            ids = self.listings.keys()
+
+        if order_by_price and (dex_ids is not None or not candidates):
+            # Merging the already ordered books of the matching species is cheaper than sorting all of the matches
+            listings = [listing for listing in self.iter_by_price(dex_ids) if listing.id in ids]
+        elif order_by_price:
+            listings = sorted((self.listings[id] for id in ids), key=lambda listing: (listing.price, listing.id))
+        else:
+            listings = [self.listings[id] for id in sorted(ids)]
+
+        return listings
+
+    async def add_listing(self, price: int, pokemon: UserPokemon) -> MarketListing:
+        user = pokemon.user
+        selected = pokemon.get_new_catch_id()
+
+        async with self.pool.acquire() as conn:
+            async with conn.transaction():
+                id: Optional[int] = await self.pool.statements.fetchval(
+                    'market.insert', price, user.id, str(pokemon.id), pokemon.dex.default_name, selected, connection=conn
+                )
+
+                if id is None:
+                    raise ValueError('That pokémon is already listed or no longer owned by you')
+
+        # The pokemon stays in the owner's catch counts, it's still theirs until someone buys it
+        user.pokemons.pop(pokemon.catch_id, None)
+        user.data['selected'] = selected
+
+        await user.pokemons.fetch(selected)
+
+        snapshot = MarketPokemon(
+            dex_id=pokemon.entry.dex_id,
+            level=pokemon.level,
+            iv_percentage=pokemon.iv_percentage,
+            is_shiny=pokemon.is_shiny(),
+            nickname=pokemon.dex.default_name,
+            nature=pokemon.entry.nature
         )
 
-        listing = MarketListing.create(self, id, price, pokemon.user.id, pokemon.id)
-        self.listings[id] = listing
+        listing = MarketListing.create(self, id, price, user.id, pokemon.id, snapshot)
+        self._add_listing(listing)
 
         return listing
 
@@ -136,11 +325,11 @@ class Market:
             return self.listings[id]
 
         async with self.pool.acquire() as conn:
-            record = await conn.fetchrow('SELECT * FROM market WHERE id = $1', id)
+            record = await self.pool.statements.fetchrow('market.get', id, connection=conn)
             if not record:
                 return None
 
-            listing = MarketListing(self, dict(record))
-            self.listings[id] = listing
+            listing = MarketListing.from_record(self, record)
+            self._add_listing(listing)
 
             return listing
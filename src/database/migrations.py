@@ -0,0 +1,131 @@
+from __future__ import annotations
+
+from typing import TYPE_CHECKING, Dict, List, NamedTuple, Optional
+
+import hashlib
+import pathlib
+import re
+
+import asyncpg
+
+if TYPE_CHECKING:
+    import logging
+
+__all__ = ('Migration', 'get_migrations', 'migrate')
+
+MIGRATIONS = pathlib.Path(__file__).parent / 'schema'
+NO_TRANSACTION = '-- migrate: no-transaction'
+
+_FILENAME = re.compile(r'^(?P<version>\d+)_(?P<name>\w+)\.sql$')
+
+class Migration(NamedTuple):
+    version: int
+    name: str
+    sql: str
+    checksum: str
+
+    @property
+    def transactional(self) -> bool:
+        # Things like `CREATE INDEX CONCURRENTLY` cannot run inside a transaction block
+        return not self.sql.lstrip().startswith(NO_TRANSACTION)
+
+    def statements(self) -> List[str]:
+        statements: List[str] = []
+        current: List[str] = []
+        quoted = False
+
+        for line in self.sql.splitlines():
+            stripped = line.strip()
+            if not current and (not stripped or stripped.startswith('--')):
+                continue
+
+            current.append(line)
+            if line.count('$$') % 2:
+                quoted = not quoted
+
+            if not quoted and stripped.endswith(';'):
+                statements.append('\n'.join(current))
+                current = []
+
+        if current:
+            statements.append('\n'.join(current))
+
+        return statements
+
+def get_migrations(path: pathlib.Path = MIGRATIONS) -> List[Migration]:
+    migrations: Dict[int, Migration] = {}
+
+    for file in path.glob('*.sql'):
+        match = _FILENAME.match(file.name)
+        if not match:
+            raise RuntimeError(f'Invalid migration filename {file.name!r}')
+
+        version = int(match['version'])
+        if version in migrations:
+            raise RuntimeError(f'Duplicate migration version {version}')
+
+        # Normalize line endings so a checkout with CRLFs does not look like an edited migration
+        sql = file.read_text(encoding='utf-8').replace('\r\n', '\n')
+        checksum = hashlib.sha256(sql.encode('utf-8')).hexdigest()
+
+        migrations[version] = Migration(version, match['name'], sql, checksum)
+
+    return [migrations[version] for version in sorted(migrations)]
+
+async def get_applied_migrations(conn: asyncpg.Connection) -> Optional[Dict[int, str]]:
+    exists = await conn.fetchval("SELECT to_regclass('schema_migrations') IS NOT NULL")
+    if not exists:
+        return None
+
+    records = await conn.fetch('SELECT version, checksum FROM schema_migrations')
+    return {record['version']: record['checksum'] for record in records}
+
+async def apply_migration(conn: asyncpg.Connection, migration: Migration) -> None:
+    query = 'INSERT INTO schema_migrations(version, name, checksum) VALUES($1, $2, $3)'
+
+    if migration.transactional:
+        async with conn.transaction():
+            await conn.execute(migration.sql)
+            await conn.execute(query, migration.version, migration.name, migration.checksum)
+
+        return
+
+    # Non-transactional migrations must be idempotent, a failure halfway through gets retried on the next boot
+    for statement in migration.statements():
+        await conn.execute(statement)
+
+    await conn.execute(query, migration.version, migration.name, migration.checksum)
+
+async def migrate(conn: asyncpg.Connection, *, logger: Optional[logging.Logger] = None) -> List[Migration]:
+    migrations = get_migrations()
+    applied = await get_applied_migrations(conn)
+
+    if applied is None:
+        await conn.execute(
+            '''
+            CREATE TABLE IF NOT EXISTS schema_migrations (
+                version INT PRIMARY KEY,
+                name TEXT NOT NULL,
+                checksum TEXT NOT NULL,
+                applied_at TIMESTAMP NOT NULL DEFAULT (NOW() AT TIME ZONE 'utc')
+            )
+            '''
+        )
+
+        applied = {}
+
+    for migration in migrations:
+        checksum = applied.get(migration.version)
+        if checksum is not None and checksum != migration.checksum:
+            raise RuntimeError(
+                f'Migration {migration.version} ({migration.name}) was modified after being applied'
+            )
+
+    pending = [migration for migration in migrations if migration.version not in applied]
+    for migration in pending:
+        if logger is not None:
+            logger.info('Applying migration %s (%s).', migration.version, migration.name)
+
+        await apply_migration(conn, migration)
+
+    return pending
@@ -1,12 +1,14 @@
 from __future__ import annotations
 
-from typing import TYPE_CHECKING, List, Optional, Dict, Any, NamedTuple, Tuple
+from typing import TYPE_CHECKING, AbstractSet, FrozenSet, Iterable, List, Optional, Dict, Any, NamedTuple, Tuple
 import dataclasses
+import functools
 import uuid
 import discord
 
 from src.utils import sequence
 from src.utils.pokedex import PokedexEntry
+from .statements import register
 
 if TYPE_CHECKING:
     from src.bot import Pokecord
@@ -72,8 +74,15 @@ class EVs(NamedTuple):
     def max(cls) -> EVs:
         return cls(hp=255, atk=255, defense=255, spatk=255, spdef=255, speed=255)
 
+_CLEAN: FrozenSet[str] = frozenset()
+
 @dataclasses.dataclass
 class Pokemon:
+    __slots__ = (
+        'id', 'dex_id', 'owner_id', 'nickname', 'level', 'exp', 'ivs', 'evs', 'moves', 'nature', 'catch_id',
+        'is_shiny', 'is_starter', 'is_favourite', '_dirty', '_iv_percentage'
+    )
+
     id: uuid.UUID
     dex_id: int
     owner_id: int
@@ -89,6 +98,52 @@ class Pokemon:
     is_starter: bool
     is_favourite: bool
 
+    def __post_init__(self) -> None:
+        # Most pokemons are never edited, so they all share the same empty frozenset until they are
+        self._dirty: AbstractSet[str] = _CLEAN
+        self._iv_percentage: Optional[float] = None
+
+    def __setattr__(self, name: str, value: Any) -> None:
+        dirty: Optional[AbstractSet[str]] = getattr(self, '_dirty', None)
+        if dirty is not None and name in self.__dataclass_fields__:
+            if dirty is _CLEAN:
+                self._dirty = {name}
+            else:
+                dirty.add(name) # type: ignore
+
+            if name == 'ivs':
+                self._iv_percentage = None
+
+        object.__setattr__(self, name, value)
+
+    @property
+    def dirty(self) -> AbstractSet[str]:
+        return self._dirty
+
+    def mark_clean(self, *keys: str) -> None:
+        if not keys:
+            self._dirty = _CLEAN
+        elif self._dirty is not _CLEAN:
+            self._dirty.difference_update(keys) # type: ignore
+            if not self._dirty:
+                self._dirty = _CLEAN
+
+    def mark_dirty(self, *keys: str) -> None:
+        if not keys:
+            return
+
+        if self._dirty is _CLEAN:
+            self._dirty = set(keys)
+        else:
+            self._dirty.update(keys) # type: ignore
+
+    @property
+    def iv_percentage(self) -> float:
+        if self._iv_percentage is None:
+            self._iv_percentage = self.ivs.round()
+
+        return self._iv_percentage
+
     @classmethod
     def from_dict(cls, data: Dict[str, Any]) -> Pokemon:
         return cls(
@@ -129,42 +184,62 @@ class Pokemon:
 
     async def create(self, pool: Pool) -> None:
         data: List[Any] = []
-        keys = self.__dataclass_fields__.keys()
-
-        for key in keys:
+        for key in POKEMON_COLUMNS:
             value = getattr(self, key)
             if isinstance(value, uuid.UUID):
                 data.append(str(value))
             else:
                 data.append(value)
 
-        query = 'INSERT INTO pokemons('
+        await pool.statements.execute('pokemons.insert', *data)
+        self.mark_clean()
 
-        query += ', '.join(keys)
-        query += ') VALUES('
+    async def update(self, pool: Pool, *, columns: Optional[Iterable[str]] = None) -> None:
+        if columns is None:
+            columns = self._dirty
 
-        query += ', '.join([f'${i}' for i in range(1, len(data) + 1)])
-        query += ')'
+        keys = tuple(key for key in POKEMON_COLUMNS if key in columns and key != 'id')
+        if not keys:
+            return
 
-        await pool.execute(query, *data)
+        data: List[Any] = [getattr(self, key) for key in keys]
+        data.append(str(self.id))
 
-    async def update(self, pool: Pool) -> None:
-        data: List[Any] = []
+        # Cleared before writing, so that anything changed while the write is in flight stays dirty for the next one
+        self.mark_clean(*keys)
 
-        keys = list(self.__dataclass_fields__.keys())
-        keys.remove('id')
+        try:
+            await pool.statements.execute(get_update_statement(keys), *data)
+        except BaseException:
+            # Also when cancelled, the values we tried to write were never persisted
+            self.mark_dirty(*keys)
+            raise
 
-        for key in keys:
-            value = getattr(self, key)
-            data.append(value)
+    def to_dict(self) -> Dict[str, Any]:
+        return {key: getattr(self, key) for key in POKEMON_COLUMNS}
 
-        query = 'UPDATE pokemons SET '
+POKEMON_COLUMNS: Tuple[str, ...] = tuple(Pokemon.__dataclass_fields__.keys())
 
-        query += ', '.join([f'{key} = ${i}' for i, key in enumerate(keys, start=1)])
-        query += f' WHERE id = ${len(keys) + 1}'
+@functools.lru_cache(maxsize=None)
+def get_update_statement(keys: Tuple[str, ...]) -> str:
+    name = 'pokemons.update[' + ','.join(keys) + ']'
 
-        data.append(str(self.id))        
-        await pool.execute(query, *data)
+    values = ', '.join([f'{key} = ${i}' for i, key in enumerate(keys, start=1)])
+    register(name, f'UPDATE pokemons SET {values} WHERE id = ${len(keys) + 1}')
 
-    def to_dict(self) -> Dict[str, Any]:
-        return dataclasses.asdict(self)
\ No newline at end of file
+    return name
+
+def get_insert_statement() -> str:
+    columns = ', '.join(POKEMON_COLUMNS)
+    values = ', '.join([f'${i}' for i in range(1, len(POKEMON_COLUMNS) + 1)])
+
+    register('pokemons.insert', f'INSERT INTO pokemons({columns}) VALUES({values})')
+    return 'pokemons.insert'
+
+get_insert_statement()
+
+# Preregister the full row update as well as the ones used on every exp tick and level up
+get_update_statement(tuple(key for key in POKEMON_COLUMNS if key != 'id'))
+get_update_statement(('exp',))
+get_update_statement(('level', 'exp'))
+get_update_statement(('dex_id', 'nickname', 'level', 'exp'))
\ No newline at end of file
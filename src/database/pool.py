@@ -1,37 +1,81 @@
 from __future__ import annotations
 
-from typing import Any, Dict, Iterable, List, Optional, TYPE_CHECKING, Sequence, Tuple
+from typing import Any, ClassVar, DefaultDict, Dict, Iterable, List, Optional, TYPE_CHECKING, Sequence, Tuple
 
 import asyncpg
+import collections
 import json
 import datetime
-import functools
+import time
 
 from .user import User, UserPokemon
-from .guild import Guild
+from .guild import Guild, GuildIndex
 from .pokemons import Pokemon
 from .items import ShopItem, ShopItemKind
 from .market import Market
-from src.utils import chance, TTLDict
+from .exp import ExpBuffer
+from .cache import Cache
+from .statements import StatementStats, Statements, get_statement_cache_size
+from .migrations import migrate
+from src.utils import chance, SingleFlight, TTLDict
 
 if TYPE_CHECKING:
     from src.bot import Pokecord
 
 class Pool:
+    USER_CACHE_SIZE: ClassVar[Optional[int]] = 50000
+    USER_CACHE_BYTES: ClassVar[Optional[int]] = 1024 * 1024 * 1024
+    GUILD_CACHE_SIZE: ClassVar[Optional[int]] = 100000
+    MISSING_CACHE_SIZE: ClassVar[int] = 100000
+    MISSING_CACHE_EXPIRY: ClassVar[datetime.timedelta] = datetime.timedelta(minutes=10)
+    GUILD_LIST_TTL: ClassVar[float] = 60.0
+
     free: TTLDict[int, Tuple[List[UserPokemon], List[UserPokemon]]]
+    missing_users: TTLDict[int, bool]
+    missing_guilds: TTLDict[int, bool]
 
     def __init__(self, pool: asyncpg.Pool[asyncpg.Record], bot: Pokecord) -> None:
         self.wrapped = pool
         self.bot = bot
 
-        self.users: Dict[int, User] = {}
-        self.guilds: Dict[int, Guild] = {}
+        self.users: Cache[int, User] = Cache(
+            max_size=self.USER_CACHE_SIZE,
+            max_bytes=self.USER_CACHE_BYTES,
+            sizeof=User.get_estimated_size,
+            can_evict=self.can_evict_user
+        )
+        self.guilds: Cache[int, Guild] = Cache(max_size=self.GUILD_CACHE_SIZE)
+        # Outlives the guild cache, see `GuildIndex`
+        self.guild_index = GuildIndex()
+
+        # Total amount of queries sent to the database, see `Pokecord.get_queries_per_message`
+        self.queries = 0
+        # { stage: stats }, time spent resolving the guild and user of a command, see `hydrate`
+        self.hydration_stats: DefaultDict[str, StatementStats] = collections.defaultdict(StatementStats)
 
         self.market: Optional[Market] = None
+        self.exp = ExpBuffer(self)
+        self.statements = Statements(self)
 
         # { dex_id: ( [non-shiny pokemons...], [shiny pokemons...] ) }
         self.free = TTLDict(expiry=datetime.timedelta(minutes=60))
 
+        # Ids the database had no row for, so non-players chatting in exp channels or trying commands don't query the
+        # database on every message. Entries are removed by `add_user`/`add_guild` and expire in case a row gets
+        # created some other way.
+        self.missing_users = TTLDict(expiry=self.MISSING_CACHE_EXPIRY, maxsize=self.MISSING_CACHE_SIZE)
+        self.missing_guilds = TTLDict(expiry=self.MISSING_CACHE_EXPIRY, maxsize=self.MISSING_CACHE_SIZE)
+
+        # Loads that are in flight, keyed by ('user', id), ('guild', id), ('guild.upsert', id) and ('market',), so
+        # concurrent cache misses for the same thing (e.g. right after a restart) share a single query
+        self.loads: SingleFlight[Tuple[Any, ...], Any] = SingleFlight()
+        self.guild_list: SingleFlight[None, List[Guild]] = SingleFlight(ttl=self.GUILD_LIST_TTL)
+
+    def can_evict_user(self, user_id: int, user: User) -> bool:
+        # Users with buffered or in-flight exp have to stay cached until it's committed, otherwise reloading them
+        # would read their old exp back and the next exp gain would overwrite what's still buffered.
+        return user_id not in self.exp.owners
+
     async def __aenter__(self) -> Pool:
         return self
 
@@ -45,22 +89,27 @@ class Pool:
         return await self.wrapped.close()
 
     async def execute(self, query: str, *args: Any):
+        self.queries += 1
         async with self.acquire() as conn:
             return await conn.execute(query, *args)
 
     async def executemany(self, query: str, args: Iterable[Sequence[Any]], **kwargs: Any):
+        self.queries += 1
         async with self.acquire() as conn:
             return await conn.executemany(query, args, **kwargs)
 
     async def fetch(self, query: str, *args) -> List[asyncpg.Record]:
+        self.queries += 1
         async with self.acquire() as conn:
             return await conn.fetch(query, *args)
 
     async def fetchrow(self, query: str, *args) -> Optional[asyncpg.Record]:
+        self.queries += 1
         async with self.acquire() as conn:
             return await conn.fetchrow(query, *args)
 
     async def fetchval(self, query: str, *args) -> Any:
+        self.queries += 1
         async with self.acquire() as conn:
             return await conn.fetchval(query, *args)
 
@@ -94,70 +143,228 @@ class Pool:
 
     async def add_user(self, user_id: int, pokemon_id: int) -> User:
         async with self.acquire() as conn:
-            record = await conn.fetchrow('SELECT * from users WHERE id = $1', user_id)
+            record = await self.statements.fetchrow('users.get', user_id, connection=conn)
             if not record:
                 entry = self.create_pokemon(pokemon_id, user_id, 1, chance(8192))
 
                 entry.is_starter = True
                 await entry.create(self)
 
-                await conn.execute('INSERT INTO users(id, pokemons) VALUES($1, $2)', user_id, [str(entry.id)])
-                record = await conn.fetchrow('SELECT * from users WHERE id = $1', user_id)
+                await self.statements.execute('users.insert', user_id, connection=conn)
+                record = await self.statements.fetchrow('users.get', user_id, connection=conn)
 
             assert record
 
-            pokemons = await conn.fetch('SELECT * from pokemons WHERE owner_id = $1', user_id)
+            self.missing_users.pop(user_id)
+            self.loads.invalidate(('user', user_id))
+
+            pokemons = await self.statements.fetch('pokemons.by_owner', user_id, connection=conn)
             return User(record, pokemons, self)
 
-    async def get_user(self, user_id: int) -> Optional[User]:
+    async def _load_user(self, record: asyncpg.Record) -> User:
+        # `record` is a row of either `users.get_with_pokemons` or `context.hydrate`
+        data: asyncpg.Record = record['user']
+
+        user_id = data['id']
         if user_id in self.users:
+            # Someone else loaded the same user while we were waiting on the database
             return self.users[user_id]
 
-        async with self.acquire() as conn:
-            record = await conn.fetchrow('SELECT * FROM users WHERE id = $1', user_id)
-            if not record:
-                return None
+        start = time.perf_counter()
+        user = User(data, record['pokemons'], self, total=record['total'], counts=record['counts'])
+        self.users[user_id] = user
 
-            pokemons = await conn.fetch('SELECT * from pokemons WHERE owner_id = $1', user_id)
-            user = User(record, pokemons, self)
+        self.hydration_stats['build'].record(time.perf_counter() - start)
 
-            self.users[user_id] = user
+        if user.needs_reindex():
+            start = time.perf_counter()
             await user.reindex()
 
-            return user
+            self.hydration_stats['reindex'].record(time.perf_counter() - start)
 
-    async def fill_user_cache(self) -> None:
-        records = await self.fetch('SELECT * FROM users')
-        for record in records:
-            if record['id'] in self.users:
+        return user
+
+    async def get_user(self, user_id: int) -> Optional[User]:
+        if user_id in self.users:
+            return self.users[user_id]
+
+        if self.missing_users.get(user_id):
+            return None
+
+        return await self.loads.do(('user', user_id), lambda: self._fetch_user(user_id))
+
+    async def _fetch_user(self, user_id: int) -> Optional[User]:
+        record = await self.statements.fetchrow('users.get_with_pokemons', user_id, User.LAZY_THRESHOLD)
+        if not record or record['user'] is None:
+            self._mark_user_missing(user_id)
+            return None
+
+        return await self._load_user(record)
+
+    def _mark_user_missing(self, user_id: int) -> None:
+        # `add_user` invalidates the load when the user gets created while it runs, what it read is stale by then
+        if self.loads.is_current(('user', user_id)):
+            self.missing_users[user_id] = True
+
+    async def hydrate(self, guild_id: int, user_id: int) -> Tuple[Guild, Optional[User]]:
+        # Resolves everything a command needs, without touching the database if both are cached
+        # and with a single round trip otherwise.
+        start = time.perf_counter()
+        guild, user = self.guilds.get(guild_id), self.users.get(user_id)
+
+        if user is None and not self.missing_users.get(user_id):
+            # Shared with `get_user`, whoever joins a load started by `get_user` resolves the guild below instead
+            user = await self.loads.do(('user', user_id), lambda: self._hydrate_user(guild_id, user_id, start))
+            guild = self.guilds.get(guild_id)
+
+        if guild is None:
+            guild = await self.add_guild(guild_id)
+            self.hydration_stats['fetch'].record(time.perf_counter() - start)
+
+        self.hydration_stats['total'].record(time.perf_counter() - start)
+        return guild, user
+
+    async def _hydrate_user(self, guild_id: int, user_id: int, start: float) -> Optional[User]:
+        record = await self.statements.fetchrow('context.hydrate', guild_id, user_id, User.LAZY_THRESHOLD)
+        assert record
+
+        self.hydration_stats['fetch'].record(time.perf_counter() - start)
+
+        if guild_id not in self.guilds:
+            self.guilds[guild_id] = Guild(record['guild'], self)
+            self.missing_guilds.pop(guild_id)
+            self.loads.invalidate(('guild', guild_id))
+
+        if record['user'] is None:
+            self._mark_user_missing(user_id)
+            return None
+
+        return await self._load_user(record)
+
+    async def fill_user_cache(self, *, prefetch: int = 5000, progress_every: int = 50000) -> None:
+        start = time.perf_counter()
+        logger = self.bot.logger
+
+        async with self.acquire() as conn:
+            users = await conn.fetch('SELECT * FROM users ORDER BY id')
+            logger.info('Warming up the user cache with %s users.', len(users))
+
+            pokemons: Dict[int, List[asyncpg.Record]] = {record['id']: [] for record in users}
+            count = 0
+
+            # Cursors can only be used inside a transaction
+            async with conn.transaction(readonly=True):
+                # Users owning more than `User.LAZY_THRESHOLD` pokemons get a lazy collection holding only their
+                # selected pokemon, just like when they're loaded through `get_user` or `hydrate`
+                lazy: Dict[int, int] = {
+                    record['owner_id']: record['total'] for record in await conn.fetch(
+                        'SELECT owner_id, COUNT(*) FILTER (WHERE is_listed = FALSE) AS total FROM pokemons '
+                        'WHERE owner_id <> 0 GROUP BY owner_id HAVING COUNT(*) > $1',
+                        User.LAZY_THRESHOLD
+                    )
+                }
+                lazy_ids = list(lazy)
+
+                counts: Dict[int, List[Tuple[int, bool, int]]] = {user_id: [] for user_id in lazy}
+                if lazy:
+                    records = await conn.fetch(
+                        'SELECT owner_id, dex_id, is_shiny, COUNT(*) AS count FROM pokemons '
+                        'WHERE owner_id = ANY($1::BIGINT[]) GROUP BY owner_id, dex_id, is_shiny',
+                        lazy_ids
+                    )
+                    for record in records:
+                        counts[record['owner_id']].append((record['dex_id'], record['is_shiny'], record['count']))
+
+                    records = await conn.fetch(
+                        'SELECT pokemons.* FROM pokemons JOIN users ON users.id = pokemons.owner_id '
+                        'AND users.selected = pokemons.catch_id WHERE pokemons.owner_id = ANY($1::BIGINT[])',
+                        lazy_ids
+                    )
+                    for record in records:
+                        owned = pokemons.get(record['owner_id'])
+                        if owned is not None:
+                            owned.append(record)
+
+                query = (
+                    'SELECT * FROM pokemons WHERE owner_id <> 0 AND owner_id <> ALL($1::BIGINT[]) '
+                    'ORDER BY owner_id, catch_id'
+                )
+                async for record in conn.cursor(query, lazy_ids, prefetch=prefetch):
+                    owned = pokemons.get(record['owner_id'])
+                    if owned is not None:
+                        owned.append(record)
+
+                    count += 1
+                    if count % progress_every == 0:
+                        logger.info('Loaded %s pokemons (%.2fs).', count, time.perf_counter() - start)
+
+        for record in users:
+            user_id = record['id']
+            if user_id in self.users:
                 continue
 
-            pokemons = await self.fetch('SELECT * from pokemons WHERE owner_id = $1', record['id'])
-            user = User(record, pokemons, self)
+            if user_id in lazy:
+                user = User(record, pokemons[user_id], self, total=lazy[user_id], counts=counts[user_id])
+            else:
+                user = User(record, pokemons[user_id], self)
 
-            self.users[record['id']] = user
-            await user.reindex()
+            self.users[user_id] = user
+
+        logger.info(
+            'Loaded %s users (%s of them lazily) and %s pokemons into the cache in %.2fs.',
+            len(users), len(lazy), count, time.perf_counter() - start
+        )
 
     async def add_guild(self, guild_id: int) -> Guild:
-        async with self.acquire() as conn:
-            record = await conn.fetchrow('SELECT * from guilds WHERE id = $1', guild_id)
-            if not record:
-                await conn.execute('INSERT INTO guilds(id) VALUES($1)', guild_id)
+        if guild_id in self.guilds:
+            return self.guilds[guild_id]
 
-            record = await conn.fetchrow('SELECT * from guilds WHERE id = $1', guild_id)
-            assert record
+        return await self.loads.do(('guild.upsert', guild_id), lambda: self._upsert_guild(guild_id))
 
-            guild = Guild(record, self)
-            self.guilds[guild_id] = guild
+    async def _upsert_guild(self, guild_id: int) -> Guild:
+        record = await self.statements.fetchrow('guilds.upsert', guild_id)
+        assert record
 
-            return guild
+        guild = Guild(record, self)
+        self.guilds[guild_id] = guild
+
+        self.missing_guilds.pop(guild_id)
+        self.loads.invalidate(('guild', guild_id))
+        self.guild_list.clear()
+
+        return guild
+
+    async def add_guilds(self, guild_ids: Iterable[int]) -> List[Guild]:
+        guild_ids = list(guild_ids)
+
+        missing = [guild_id for guild_id in set(guild_ids) if guild_id not in self.guilds]
+        if missing:
+            records = await self.statements.fetch('guilds.upsert_many', missing)
+            for record in records:
+                self.guilds[record['id']] = Guild(record, self)
+                self.missing_guilds.pop(record['id'])
+                self.loads.invalidate(('guild', record['id']))
+
+            self.guild_list.clear()
+
+        return [self.guilds[guild_id] for guild_id in guild_ids if guild_id in self.guilds]
 
     async def get_guild(self, guild_id: int) -> Optional[Guild]:
         if guild_id in self.guilds:
             return self.guilds[guild_id]
 
-        record = await self.fetchrow('SELECT * FROM guilds WHERE id = $1', guild_id)
+        if self.missing_guilds.get(guild_id):
+            return None
+
+        return await self.loads.do(('guild', guild_id), lambda: self._fetch_guild(guild_id))
+
+    async def _fetch_guild(self, guild_id: int) -> Optional[Guild]:
+        record = await self.statements.fetchrow('guilds.get', guild_id)
         if not record:
+            # Same as `_mark_user_missing`, a guild added while this ran invalidated the load
+            if self.loads.is_current(('guild', guild_id)):
+                self.missing_guilds[guild_id] = True
+
             return None
 
         guild = Guild(record, self)
@@ -176,7 +383,7 @@ class Pool:
     
     async def get_market(self) -> Market:
         if self.market is None:
-            self.market = await Market.fetch(self)
+            self.market = await self.loads.do(('market',), lambda: Market.fetch(self))
 
         return self.market
 
@@ -190,7 +397,7 @@ class Pool:
         await self.execute('DELETE FROM items WHERE id = $1', id)
 
     async def get_item(self, id: int) -> Optional[ShopItem]:
-        record = await self.fetchrow('SELECT * FROM items WHERE id = $1', id)
+        record = await self.statements.fetchrow('items.get', id)
         if not record:
             return None
 
@@ -204,8 +411,11 @@ class Pool:
             
         return [ShopItem.from_record(self, record) for record in records]
 
-    @functools.lru_cache(maxsize=128)
     async def fetch_guilds(self) -> List[Guild]:
+        # Cached for `GUILD_LIST_TTL` seconds, or until a guild gets added
+        return await self.guild_list.do(None, self._fetch_guilds)
+
+    async def _fetch_guilds(self) -> List[Guild]:
         records = await self.fetch('SELECT * FROM guilds')
         return [Guild(record, self) for record in records]
 
@@ -218,7 +428,19 @@ async def connect(dns: str, bot: Pokecord):
             schema='pg_catalog'
         )
 
-    pool = await asyncpg.create_pool(dns, init=init)
+    # Migrations have to run before the pool is created since connections cache the statements they prepare
+    conn = await asyncpg.connect(dns)
+    try:
+        migrations = await migrate(conn, logger=bot.logger)
+    finally:
+        await conn.close()
+
+    if migrations:
+        bot.logger.info('Applied %s database migration(s).', len(migrations))
+    else:
+        bot.logger.info('Database schema is up to date.')
+
+    pool = await asyncpg.create_pool(dns, init=init, statement_cache_size=get_statement_cache_size())
     if not pool:
         raise RuntimeError('Could not connect to database')
 
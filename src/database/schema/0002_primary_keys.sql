@@ -0,0 +1,44 @@
+-- migrate: no-transaction
+
+-- add_guild and add_user used to SELECT before INSERTing, so racing messages could register the same id twice.
+-- The most recently written row wins.
+DELETE FROM guilds a USING guilds b WHERE a.id = b.id AND a.ctid < b.ctid;
+DELETE FROM guilds WHERE id IS NULL;
+
+DELETE FROM users a USING users b WHERE a.id = b.id AND a.ctid < b.ctid;
+
+DELETE FROM pokemons a USING pokemons b WHERE a.id = b.id AND a.ctid < b.ctid;
+-- Pokemons are owned by someone, give them an id instead of deleting them
+UPDATE pokemons SET id = uuid_generate_v4() WHERE id IS NULL;
+
+-- A CONCURRENTLY build that failed (e.g. on duplicates) leaves an invalid index behind, which `IF NOT EXISTS` would
+-- then keep skipping on every retry
+DO $$
+DECLARE
+    name TEXT;
+BEGIN
+    FOREACH name IN ARRAY ARRAY['users_id_idx', 'guilds_id_idx', 'pokemons_id_idx'] LOOP
+        IF EXISTS (SELECT 1 FROM pg_index WHERE indexrelid = to_regclass(name) AND NOT indisvalid) THEN
+            EXECUTE format('DROP INDEX %I', name);
+        END IF;
+    END LOOP;
+END $$;
+
+CREATE UNIQUE INDEX CONCURRENTLY IF NOT EXISTS users_id_idx ON users (id);
+CREATE UNIQUE INDEX CONCURRENTLY IF NOT EXISTS guilds_id_idx ON guilds (id);
+CREATE UNIQUE INDEX CONCURRENTLY IF NOT EXISTS pokemons_id_idx ON pokemons (id);
+
+DO $$
+BEGIN
+    IF NOT EXISTS (SELECT 1 FROM pg_constraint WHERE conname = 'users_pkey') THEN
+        ALTER TABLE users ADD CONSTRAINT users_pkey PRIMARY KEY USING INDEX users_id_idx;
+    END IF;
+
+    IF NOT EXISTS (SELECT 1 FROM pg_constraint WHERE conname = 'guilds_pkey') THEN
+        ALTER TABLE guilds ADD CONSTRAINT guilds_pkey PRIMARY KEY USING INDEX guilds_id_idx;
+    END IF;
+
+    IF NOT EXISTS (SELECT 1 FROM pg_constraint WHERE conname = 'pokemons_pkey') THEN
+        ALTER TABLE pokemons ADD CONSTRAINT pokemons_pkey PRIMARY KEY USING INDEX pokemons_id_idx;
+    END IF;
+END $$;
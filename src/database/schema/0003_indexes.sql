@@ -0,0 +1,17 @@
+-- migrate: no-transaction
+
+-- Drop what's left of a failed CONCURRENTLY build, `IF NOT EXISTS` would skip the invalid index on every retry
+DO $$
+DECLARE
+    name TEXT;
+BEGIN
+    FOREACH name IN ARRAY ARRAY['pokemons_owner_id_dex_id_idx', 'pokemons_dex_id_idx', 'market_pokemon_id_idx'] LOOP
+        IF EXISTS (SELECT 1 FROM pg_index WHERE indexrelid = to_regclass(name) AND NOT indisvalid) THEN
+            EXECUTE format('DROP INDEX %I', name);
+        END IF;
+    END LOOP;
+END $$;
+
+CREATE INDEX CONCURRENTLY IF NOT EXISTS pokemons_owner_id_dex_id_idx ON pokemons (owner_id, dex_id);
+CREATE INDEX CONCURRENTLY IF NOT EXISTS pokemons_dex_id_idx ON pokemons (dex_id);
+CREATE INDEX CONCURRENTLY IF NOT EXISTS market_pokemon_id_idx ON market (pokemon_id);
@@ -0,0 +1,3 @@
+-- Ownership lives in pokemons.owner_id, keeping a copy of it in an array on every user row meant
+-- rewriting the whole row on each catch, release, trade and market action.
+ALTER TABLE users DROP COLUMN IF EXISTS pokemons;
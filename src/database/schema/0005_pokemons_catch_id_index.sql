@@ -0,0 +1,16 @@
+-- migrate: no-transaction
+
+-- Drop what's left of a failed CONCURRENTLY build, `IF NOT EXISTS` would skip the invalid index on every retry
+DO $$
+DECLARE
+    name TEXT;
+BEGIN
+    FOREACH name IN ARRAY ARRAY['pokemons_owner_id_catch_id_idx'] LOOP
+        IF EXISTS (SELECT 1 FROM pg_index WHERE indexrelid = to_regclass(name) AND NOT indisvalid) THEN
+            EXECUTE format('DROP INDEX %I', name);
+        END IF;
+    END LOOP;
+END $$;
+
+-- Used to page through a user's pokemons in catch id order, see `PokemonCollection.iterate`
+CREATE INDEX CONCURRENTLY IF NOT EXISTS pokemons_owner_id_catch_id_idx ON pokemons (owner_id, catch_id);
@@ -0,0 +1,306 @@
+from __future__ import annotations
+
+from typing import TYPE_CHECKING, Any, Dict, Iterable, List, Optional, Sequence
+
+import time
+import asyncpg
+
+if TYPE_CHECKING:
+    from .pool import Pool
+
+__all__ = ('QUERIES', 'register', 'get_statement_cache_size', 'StatementStats', 'Statements')
+
+QUERIES: Dict[str, str] = {}
+
+# Room for the update statements `get_update_statement` registers on the fly and the few ad-hoc queries
+STATEMENT_CACHE_HEADROOM = 128
+
+def register(name: str, query: str) -> str:
+    if name in QUERIES and QUERIES[name] != query:
+        raise ValueError(f'Statement {name!r} is already registered with a different query')
+
+    QUERIES[name] = query
+    return query
+
+def get_statement_cache_size() -> int:
+    # asyncpg prepares a statement the first time a connection runs it and keeps it in a per-connection LRU cache
+    # (100 statements by default). Every registered statement has to fit, otherwise they keep evicting each other and
+    # get prepared over and over again.
+    return len(QUERIES) + STATEMENT_CACHE_HEADROOM
+
+register('users.get', 'SELECT * FROM users WHERE id = $1')
+register('users.insert', 'INSERT INTO users(id) VALUES($1)')
+register('users.delete', 'DELETE FROM users WHERE id = $1')
+register('users.add_credits', 'UPDATE users SET credits = credits + $1 WHERE id = $2')
+register('users.remove_credits', 'UPDATE users SET credits = credits - $1 WHERE id = $2')
+register('users.add_redeems', 'UPDATE users SET redeems = redeems + $1 WHERE id = $2')
+register('users.remove_redeems', 'UPDATE users SET redeems = redeems - $1 WHERE id = $2')
+register('users.set_detailed_view', 'UPDATE users SET detailed_pokemon_view = $1 WHERE id = $2')
+register('users.set_selected', 'UPDATE users SET selected = $1 WHERE id = $2')
+register('users.set_catch_id', 'UPDATE users SET catch_id = $1 WHERE id = $2')
+register('users.set_index', 'UPDATE users SET selected = $1, catch_id = $2 WHERE id = $3')
+register(
+    'users.settle_trade',
+    'UPDATE users SET credits = users.credits + data.credits, redeems = users.redeems + data.redeems, '
+    'selected = data.selected, catch_id = data.catch_id '
+    'FROM UNNEST($1::BIGINT[], $2::BIGINT[], $3::INT[], $4::BIGINT[], $5::BIGINT[]) '
+    'AS data(id, credits, redeems, selected, catch_id) '
+    'WHERE users.id = data.id AND users.credits + data.credits >= 0 AND users.redeems + data.redeems >= 0'
+)
+
+register('pokemons.get', 'SELECT * FROM pokemons WHERE id = $1')
+register('pokemons.by_owner', 'SELECT * FROM pokemons WHERE owner_id = $1')
+register(
+    'pokemons.unlisted_by_owner', 'SELECT * FROM pokemons WHERE owner_id = $1 AND is_listed = FALSE ORDER BY catch_id'
+)
+register('pokemons.delete_by_owner', 'DELETE FROM pokemons WHERE owner_id = $1')
+register('pokemons.set_owner', 'UPDATE pokemons SET owner_id = $1 WHERE id = $2')
+register('pokemons.move', 'UPDATE pokemons SET owner_id = $1, catch_id = $2 WHERE id = $3')
+register('pokemons.set_catch_id', 'UPDATE pokemons SET catch_id = $1 WHERE id = $2')
+register(
+    'pokemons.reindex',
+    'UPDATE pokemons SET catch_id = data.catch_id FROM UNNEST($1::UUID[], $2::BIGINT[]) AS data(id, catch_id) '
+    'WHERE pokemons.id = data.id'
+)
+register(
+    'pokemons.settle_trade',
+    'UPDATE pokemons SET owner_id = data.owner_id, catch_id = data.catch_id '
+    'FROM UNNEST($1::UUID[], $2::BIGINT[], $3::BIGINT[], $4::BIGINT[]) AS data(id, previous_owner_id, owner_id, catch_id) '
+    'WHERE pokemons.id = data.id AND pokemons.owner_id = data.previous_owner_id'
+)
+register('pokemons.by_catch_id', 'SELECT * FROM pokemons WHERE owner_id = $1 AND catch_id = $2 AND is_listed = FALSE')
+register(
+    'pokemons.by_species',
+    'SELECT * FROM pokemons WHERE owner_id = $1 AND dex_id = $2 AND is_listed = FALSE ORDER BY catch_id'
+)
+register(
+    'pokemons.by_nickname',
+    'SELECT * FROM pokemons WHERE owner_id = $1 AND nickname = $2 AND is_listed = FALSE ORDER BY catch_id'
+)
+# Keyset pagination over a user's pokemons, see `PokemonCollection.iterate`
+register(
+    'pokemons.page',
+    'SELECT * FROM pokemons WHERE owner_id = $1 AND catch_id > $2 AND is_listed = FALSE ORDER BY catch_id LIMIT $3'
+)
+# Renumbers a user's pokemons from 1 without sending them back and forth, returns the ones that got a new catch id
+register(
+    'pokemons.compact',
+    '''
+    WITH numbered AS (
+        SELECT id, row_number() OVER (ORDER BY catch_id) AS catch_id
+        FROM pokemons WHERE owner_id = $1 AND is_listed = FALSE
+    )
+    UPDATE pokemons SET catch_id = numbered.catch_id FROM numbered
+    WHERE pokemons.id = numbered.id AND pokemons.catch_id <> numbered.catch_id
+    RETURNING pokemons.id, pokemons.catch_id
+    '''
+)
+register('pokemons.set_favourite', 'UPDATE pokemons SET is_favourite = $1 WHERE id = $2')
+register(
+    'pokemons.flush_exp',
+    'UPDATE pokemons SET exp = data.exp FROM UNNEST($1::UUID[], $2::INT[]) AS data(id, exp) WHERE pokemons.id = data.id'
+)
+
+register('guilds.get', 'SELECT * FROM guilds WHERE id = $1')
+register('guilds.insert', 'INSERT INTO guilds(id) VALUES($1)')
+# Both of these return the rows of the given guilds, creating the ones that don't exist yet
+register(
+    'guilds.upsert',
+    'WITH inserted AS (INSERT INTO guilds(id) VALUES($1) ON CONFLICT (id) DO NOTHING RETURNING *) '
+    'SELECT * FROM inserted UNION ALL SELECT * FROM guilds WHERE id = $1'
+)
+register(
+    'guilds.upsert_many',
+    'WITH inserted AS (INSERT INTO guilds(id) SELECT UNNEST($1::BIGINT[]) ON CONFLICT (id) DO NOTHING RETURNING *) '
+    'SELECT * FROM inserted UNION ALL SELECT * FROM guilds WHERE id = ANY($1::BIGINT[])'
+)
+register('guilds.set_prefix', 'UPDATE guilds SET prefix = $1 WHERE id = $2')
+register('guilds.set_spawn_channels', 'UPDATE guilds SET spawn_channels = $1 WHERE id = $2')
+register('guilds.set_exp_channels', 'UPDATE guilds SET exp_channels = $1 WHERE id = $2')
+
+# Whole rows are returned as composite values, which asyncpg decodes into records just like top-level rows.
+# This is what allows loading a user along with all of their pokemons (and their guild) in a single round trip.
+#
+# Users owning more than the given amount of pokemons only get their selected pokemon back, along with `total` (how many unlisted
+# pokemons they own) and `counts`, anonymous (dex_id, is_shiny, count) records which asyncpg decodes into tuples.
+# See `User.LAZY_THRESHOLD`.
+register(
+    'users.get_with_pokemons',
+    '''
+    WITH owned AS (
+        SELECT COUNT(*) AS owned, COUNT(*) FILTER (WHERE is_listed = FALSE) AS total FROM pokemons WHERE owner_id = $1
+    )
+    SELECT (SELECT users FROM users WHERE id = $1) AS "user", (SELECT total FROM owned) AS total,
+    ARRAY(
+        SELECT pokemons FROM pokemons WHERE owner_id = $1 AND (
+            (SELECT owned FROM owned) <= $2 OR catch_id = (SELECT selected FROM users WHERE id = $1)
+        )
+        ORDER BY catch_id
+    ) AS pokemons,
+    CASE WHEN (SELECT owned FROM owned) > $2 THEN ARRAY(
+        SELECT ROW(dex_id, is_shiny, COUNT(*)) FROM pokemons WHERE owner_id = $1 GROUP BY dex_id, is_shiny
+    ) END AS counts
+    '''
+)
+register(
+    'context.hydrate',
+    '''
+    WITH inserted AS (
+        INSERT INTO guilds(id) VALUES($1) ON CONFLICT (id) DO NOTHING RETURNING guilds AS guild
+    ), owned AS (
+        SELECT COUNT(*) AS owned, COUNT(*) FILTER (WHERE is_listed = FALSE) AS total FROM pokemons WHERE owner_id = $2
+    )
+    SELECT COALESCE((SELECT guild FROM inserted), (SELECT guilds FROM guilds WHERE id = $1)) AS guild,
+    (SELECT users FROM users WHERE id = $2) AS "user", (SELECT total FROM owned) AS total,
+    ARRAY(
+        SELECT pokemons FROM pokemons WHERE owner_id = $2 AND (
+            (SELECT owned FROM owned) <= $3 OR catch_id = (SELECT selected FROM users WHERE id = $2)
+        )
+        ORDER BY catch_id
+    ) AS pokemons,
+    CASE WHEN (SELECT owned FROM owned) > $3 THEN ARRAY(
+        SELECT ROW(dex_id, is_shiny, COUNT(*)) FROM pokemons WHERE owner_id = $2 GROUP BY dex_id, is_shiny
+    ) END AS counts
+    '''
+)
+
+register('items.get', 'SELECT * FROM items WHERE id = $1')
+register(
+    'items.edit',
+    'UPDATE items SET name = COALESCE($1, name), description = COALESCE($2, description), '
+    'kind = COALESCE($3, kind), price = COALESCE($4, price) WHERE id = $5'
+)
+
+# Listings always come with a snapshot of the pokemon that's being sold, see `MarketPokemon`
+register(
+    'market.all',
+    'SELECT market.*, pokemons.dex_id, pokemons.level, pokemons.ivs, pokemons.is_shiny, pokemons.nickname, '
+    'pokemons.nature '
+    'FROM market JOIN pokemons ON pokemons.id = market.pokemon_id'
+)
+register(
+    'market.get',
+    'SELECT market.*, pokemons.dex_id, pokemons.level, pokemons.ivs, pokemons.is_shiny, pokemons.nickname, '
+    'pokemons.nature '
+    'FROM market JOIN pokemons ON pokemons.id = market.pokemon_id WHERE market.id = $1'
+)
+register('market.delete', 'DELETE FROM market WHERE id = $1')
+
+# The market statements below settle a whole operation in a single round trip. Each one starts by claiming a row
+# (the listing, or the pokemon being listed) so that concurrent attempts at the same operation block on that row
+# and then match nothing, while every later step only runs if the previous ones returned something.
+register(
+    'market.insert',
+    '''
+    WITH pokemon AS (
+        UPDATE pokemons SET nickname = $4, is_favourite = FALSE, is_listed = TRUE
+        WHERE id = $3 AND owner_id = $2 AND is_listed = FALSE
+        RETURNING id
+    ), owner AS (
+        UPDATE users SET selected = $5 FROM pokemon WHERE users.id = $2 RETURNING users.id
+    )
+    INSERT INTO market(price, owner_id, pokemon_id) SELECT $1::BIGINT, $2::BIGINT, pokemon.id FROM pokemon RETURNING id
+    '''
+)
+register(
+    'market.buy',
+    '''
+    WITH listing AS (
+        DELETE FROM market
+        WHERE id = $1 AND owner_id <> $2 AND price <= (SELECT credits FROM users WHERE id = $2)
+        RETURNING price, owner_id, pokemon_id
+    ), buyer AS (
+        UPDATE users SET credits = users.credits - listing.price, catch_id = users.catch_id + 1
+        FROM listing WHERE users.id = $2 AND users.credits >= listing.price
+        RETURNING users.catch_id
+    ), seller AS (
+        UPDATE users SET credits = users.credits + listing.price
+        FROM listing, buyer WHERE users.id = listing.owner_id
+        RETURNING users.id
+    )
+    UPDATE pokemons SET owner_id = $2, catch_id = buyer.catch_id, is_listed = FALSE
+    FROM listing, buyer WHERE pokemons.id = listing.pokemon_id
+    RETURNING pokemons.*
+    '''
+)
+register(
+    'market.cancel',
+    '''
+    WITH listing AS (
+        DELETE FROM market WHERE id = $1 AND owner_id = $2 RETURNING pokemon_id
+    ), owner AS (
+        UPDATE users SET catch_id = users.catch_id + 1 FROM listing WHERE users.id = $2 RETURNING users.catch_id
+    )
+    UPDATE pokemons SET catch_id = owner.catch_id, is_listed = FALSE
+    FROM listing, owner WHERE pokemons.id = listing.pokemon_id
+    RETURNING pokemons.*
+    '''
+)
+
+class StatementStats:
+    __slots__ = ('calls', 'total', 'max')
+
+    def __init__(self) -> None:
+        self.calls = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def __repr__(self) -> str:
+        return f'<StatementStats calls={self.calls} total={self.total:.4f} average={self.average:.6f} max={self.max:.6f}>'
+
+    @property
+    def average(self) -> float:
+        return self.total / self.calls if self.calls else 0.0
+
+    def record(self, elapsed: float) -> None:
+        self.calls += 1
+        self.total += elapsed
+
+        if elapsed > self.max:
+            self.max = elapsed
+
+class Statements:
+    def __init__(self, pool: Pool) -> None:
+        self.pool = pool
+        self.stats: Dict[str, StatementStats] = {name: StatementStats() for name in QUERIES}
+
+    def get_query(self, name: str) -> str:
+        try:
+            return QUERIES[name]
+        except KeyError:
+            raise ValueError(f'Statement {name!r} is not registered') from None
+
+    async def _run(self, method: str, name: str, args: Sequence[Any], connection: Optional[asyncpg.Connection]) -> Any:
+        query = self.get_query(name)
+        stats = self.stats.setdefault(name, StatementStats())
+
+        self.pool.queries += 1
+
+        start = time.perf_counter()
+        try:
+            if connection is not None:
+                return await getattr(connection, method)(query, *args)
+
+            async with self.pool.acquire() as conn:
+                return await getattr(conn, method)(query, *args)
+        finally:
+            stats.record(time.perf_counter() - start)
+
+    async def execute(self, name: str, *args: Any, connection: Optional[asyncpg.Connection] = None) -> str:
+        return await self._run('execute', name, args, connection)
+
+    async def executemany(
+        self, name: str, args: Iterable[Sequence[Any]], *, connection: Optional[asyncpg.Connection] = None
+    ) -> None:
+        await self._run('executemany', name, (args,), connection)
+
+    async def fetch(self, name: str, *args: Any, connection: Optional[asyncpg.Connection] = None) -> List[asyncpg.Record]:
+        return await self._run('fetch', name, args, connection)
+
+    async def fetchrow(
+        self, name: str, *args: Any, connection: Optional[asyncpg.Connection] = None
+    ) -> Optional[asyncpg.Record]:
+        return await self._run('fetchrow', name, args, connection)
+
+    async def fetchval(self, name: str, *args: Any, connection: Optional[asyncpg.Connection] = None) -> Any:
+        return await self._run('fetchval', name, args, connection)
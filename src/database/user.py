@@ -2,6 +2,11 @@ from __future__ import annotations
 
 from typing import (
     Any,
+    AsyncIterator,
+    Callable,
+    ClassVar,
+    Iterable,
+    Iterator,
     Optional,
     List,
     Dict,
@@ -10,85 +15,49 @@ from typing import (
 )
 
 from discord.ext import commands
+import collections
+import asyncio
 import discord
 import asyncpg
 import uuid
 
-from src.utils import get_health_stat, get_other_stat, PokedexEntry, Context
+from src.utils import ComputedStats, PokedexEntry, Context
 from .pokemons import EVs, IVs, Moves, Pokemon
+from .columns import PokemonColumns
 
 if TYPE_CHECKING:
     from src.bot import Nature
     from .pool import Pool
 
-class UserPokemonStats:
-    def __init__(self, pokemon: UserPokemon) -> None:
-        self.pokemon = pokemon
+def _is_same_value(old: Any, new: Any) -> bool:
+    # Array columns come back from asyncpg as lists while we pass tuples around
+    if isinstance(old, (list, tuple)) and isinstance(new, (list, tuple)):
+        return tuple(old) == tuple(new)
 
-    @property
-    def health(self) -> int:
-        return get_health_stat(
-            base=self.pokemon.dex.stats.hp,
-            iv=self.pokemon.ivs.hp,
-            ev=self.pokemon.evs.hp,
-            level=self.pokemon.level
-        )
-
-    @property
-    def attack(self) -> int:
-        return get_other_stat(
-            base=self.pokemon.dex.stats.atk,
-            iv=self.pokemon.ivs.atk,
-            ev=self.pokemon.evs.atk,
-            level=self.pokemon.level,
-            nature=self.pokemon.nature.atk
-        )
-
-    @property
-    def defense(self) -> int:
-        return get_other_stat(
-            base=self.pokemon.dex.stats.defense,
-            iv=self.pokemon.ivs.defense,
-            ev=self.pokemon.evs.defense,
-            level=self.pokemon.level,
-            nature=self.pokemon.nature.defense
-        )
-
-
-    @property
-    def spatk(self) -> int:
-        return get_other_stat(
-            base=self.pokemon.dex.stats.spatk,
-            iv=self.pokemon.ivs.spatk,
-            ev=self.pokemon.evs.spatk,
-            level=self.pokemon.level,
-            nature=self.pokemon.nature.spatk
-        )
-    
-    @property
-    def spdef(self) -> int:
-        return get_other_stat(
-            base=self.pokemon.dex.stats.spdef,
-            iv=self.pokemon.ivs.spdef,
-            ev=self.pokemon.evs.spdef,
-            level=self.pokemon.level,
-            nature=self.pokemon.nature.spdef
-        )
+    return old == new
 
-    @property
-    def speed(self) -> int:
-        return get_other_stat(
-            base=self.pokemon.dex.stats.speed,
-            iv=self.pokemon.ivs.speed,
-            ev=self.pokemon.evs.speed,
-            level=self.pokemon.level,
-            nature=self.pokemon.nature.speed
-        )
+_MISSING: Any = object()
 
 class UserPokemon(commands.Converter[Any]):
-    def __init__(self, user: User, data: Dict[str, Any]) -> None:
+    # Fields a `QueryPlan` can filter pokemons on
+    QUERY_FIELDS: ClassVar[Dict[str, Callable[[UserPokemon], Any]]] = {
+        'dex_id': lambda pokemon: pokemon.entry.dex_id,
+        'level': lambda pokemon: pokemon.entry.level,
+        'iv': lambda pokemon: pokemon.entry.iv_percentage,
+        'shiny': lambda pokemon: pokemon.entry.is_shiny,
+        'favourite': lambda pokemon: pokemon.entry.is_favourite,
+        'nickname': lambda pokemon: pokemon.entry.nickname,
+        'nature': lambda pokemon: pokemon.entry.nature,
+    }
+
+    def __init__(self, user: User, entry: Pokemon, *, listed: bool = False) -> None:
         self.user = user
-        self.data = data
+        self.entry = entry
+        self.listed = listed
+
+    @classmethod
+    def from_dict(cls, user: User, data: Dict[str, Any]) -> UserPokemon:
+        return cls(user, Pokemon.from_dict(data), listed=data.get('is_listed', False))
 
     def __repr__(self) -> str:
         return f'<UserPokemon id={str(self.id)!r} catch_id={self.catch_id} nickname={self.nickname!r}>'
@@ -97,19 +66,19 @@ class UserPokemon(commands.Converter[Any]):
     async def convert(cls, ctx: Context, argument: str) -> Any:
         user = ctx.pool.user
         if argument.lower() in ('l', 'latest'):
-            entry = user.pokemons.get(user.catch_id)
+            entry = await user.pokemons.fetch(user.catch_id)
             if not entry:
                 raise commands.BadArgument('Pokémon not found.')
 
             return entry
         if argument.isdigit():
-            entry = user.pokemons.get(int(argument))
+            entry = await user.pokemons.fetch(int(argument))
             if not entry:
                 raise commands.BadArgument('Pokémon not found.')
 
             return entry
 
-        pokemons = user.find(nickname=argument)
+        pokemons = await user.pokemons.fetch_by_nickname(argument)
         if not pokemons:
             raise commands.BadArgument('Pokémon not found.')
         
@@ -119,10 +88,6 @@ class UserPokemon(commands.Converter[Any]):
     def dex(self) -> PokedexEntry:
         return self.pool.bot.pokedex.get_pokemon(self.entry.dex_id) # type: ignore
     
-    @property
-    def entry(self) -> Pokemon:
-        return Pokemon.from_dict(self.data)
-
     @property
     def id(self) -> uuid.UUID:
         return self.entry.id
@@ -143,6 +108,10 @@ class UserPokemon(commands.Converter[Any]):
     def ivs(self) -> IVs:
         return self.entry.ivs
 
+    @property
+    def iv_percentage(self) -> float:
+        return self.entry.iv_percentage
+
     @property
     def evs(self) -> EVs:
         return self.entry.evs
@@ -156,8 +125,13 @@ class UserPokemon(commands.Converter[Any]):
         return self.user.bot.get_nature(self.entry.nature) # type: ignore
 
     @property
-    def stats(self):
-        return UserPokemonStats(self)
+    def stat_key(self) -> Tuple[int, IVs, EVs, int, str]:
+        entry = self.entry
+        return entry.dex_id, entry.ivs, entry.evs, entry.level, entry.nature
+
+    @property
+    def stats(self) -> ComputedStats:
+        return self.user.bot.stats.compute(*self.stat_key)
 
     @property
     def catch_id(self) -> int:
@@ -183,7 +157,7 @@ class UserPokemon(commands.Converter[Any]):
         return self.entry.is_favourite
 
     def is_listed(self) -> bool:
-        return self.data['is_listed']
+        return self.listed
     
     def exists(self) -> bool:
         return self.entry.catch_id in self.user.pokemons
@@ -198,10 +172,11 @@ class UserPokemon(commands.Converter[Any]):
             return self.catch_id
 
     async def save(self) -> None:
-        query = 'UPDATE users SET pokemons = ARRAY_APPEND(users.pokemons, CAST($1 as UUID)), catch_id = $2 WHERE id = $3'
-        await self.pool.execute(query, str(self.entry.id), self.entry.catch_id, self.user.id)
-    
+        # `pokemons.owner_id` is what ties a pokemon to its user, so only the user's catch id needs to be bumped
+        await self.pool.statements.execute('users.set_catch_id', self.entry.catch_id, self.user.id)
+
         self.user.pokemons[self.entry.catch_id] = self
+        self.user.data['catch_id'] = self.entry.catch_id
     
     async def edit(
         self,
@@ -221,42 +196,73 @@ class UserPokemon(commands.Converter[Any]):
         if not self.exists():
             raise ValueError(f'Pokemon {self.entry.nickname!r} does not exist')
 
+        changes: Dict[str, Any] = {}
         if nickname is not None:
-            self.data['nickname'] = nickname
+            changes['nickname'] = nickname
         if level is not None:
-            self.data['level'] = level
+            changes['level'] = level
         if exp is not None:
-            self.data['exp'] = exp
+            changes['exp'] = exp
         if nature is not None:
-            self.data['nature'] = nature
+            changes['nature'] = nature
         if moves is not None:
-            self.data['moves'] = moves
+            changes['moves'] = moves
         if ivs is not None:
-            self.data['ivs'] = ivs
+            changes['ivs'] = ivs
         if evs is not None:
-            self.data['evs'] = evs
+            changes['evs'] = evs
         if shiny is not None:
-            self.data['shiny'] = shiny
+            changes['is_shiny'] = shiny
         if catch_id is not None:
-            self.data['catch_id'] = catch_id
+            changes['catch_id'] = catch_id
         if owner_id is not None:
-            self.data['owner_id'] = owner_id
+            changes['owner_id'] = owner_id
         if dex_id is not None:
             if not self.has_nickname() and nickname is None:
                 dex = self.user.bot.pokedex.get_pokemon(dex_id)
                 if dex is None:
                     return self # TODO: Raise error or something
 
-                self.data['nickname'] = dex.default_name
+                changes['nickname'] = dex.default_name
 
-            self.data['dex_id'] = dex_id
-        
-        await self.entry.update(self.pool)
+            changes['dex_id'] = dex_id
+
+        entry = self.entry
+        dex_id, is_shiny = entry.dex_id, entry.is_shiny
+
+        for key, value in changes.items():
+            if not _is_same_value(getattr(entry, key), value):
+                setattr(entry, key, value)
+
+        if not entry.dirty:
+            return self
+
+        if 'exp' in entry.dirty:
+            # The write below supersedes any exp that is still waiting to be flushed
+            self.pool.exp.discard(self)
+
+        species_changed = 'dex_id' in entry.dirty or 'is_shiny' in entry.dirty
+        await entry.update(self.pool)
+
+        self.user.pokemons.invalidate()
+
+        if species_changed:
+            self.user.count_pokemon(dex_id, is_shiny, -1)
+            self.user.count_pokemon(entry.dex_id, entry.is_shiny)
 
         return self
 
     async def add_exp(self, exp: int) -> UserPokemon:
-        return await self.edit(exp=self.exp + exp)
+        if not self.exists():
+            raise ValueError(f'Pokemon {self.entry.nickname!r} does not exist')
+
+        self.entry.exp += exp
+        # The exp buffer takes care of persisting this, so it shouldn't piggyback on the next edit
+        self.entry.mark_clean('exp')
+
+        await self.pool.exp.add(self)
+
+        return self
 
     async def release(self, *, add_free: bool = True) -> None:
         if not self.exists():
@@ -265,16 +271,20 @@ class UserPokemon(commands.Converter[Any]):
         new_selected = self.get_new_catch_id()
 
         pokemon = self.user.pokemons.pop(self.catch_id)
-        query = 'UPDATE users SET pokemons = ARRAY_REMOVE(users.pokemons, $1), selected = $2 WHERE id = $3'
+        # A released pokemon may be handed out again by `get_free_pokemon`, its buffered exp must not follow it there
+        self.pool.exp.discard(pokemon)
 
-        await self.pool.execute(query, str(pokemon.entry.id), new_selected, self.user.id)
-        await self.pool.execute('UPDATE pokemons SET owner_id = 0 WHERE id = $1', str(pokemon.id))
+        await self.pool.statements.execute('users.set_selected', new_selected, self.user.id)
+        await self.pool.statements.execute('pokemons.set_owner', 0, str(pokemon.id))
 
         if add_free:
             self.pool.add_free_pokemon(pokemon)
-        
+
+        self.user.count_pokemon(pokemon.entry.dex_id, pokemon.entry.is_shiny, -1)
         self.user.data['selected'] = new_selected
 
+        await self.user.pokemons.fetch(new_selected)
+
     async def select(self) -> None:
         if not self.exists():
             raise ValueError(f'Pokemon {self.entry.nickname!r} does not exist')
@@ -283,9 +293,7 @@ class UserPokemon(commands.Converter[Any]):
             raise ValueError(f'{self.entry.nickname!r} is already selected.')
 
         entry = self.entry
-        await self.pool.execute(
-            'UPDATE users SET selected = $1 WHERE id = $2', entry.catch_id, self.user.id
-        )
+        await self.pool.statements.execute('users.set_selected', entry.catch_id, self.user.id)
 
         self.user.data['selected'] = entry.catch_id
 
@@ -293,33 +301,37 @@ class UserPokemon(commands.Converter[Any]):
         new_selected = self.get_new_catch_id()
 
         pokemon = self.user.pokemons.pop(self.catch_id)
-        query = 'UPDATE users SET pokemons = ARRAY_REMOVE(users.pokemons, $1), selected = $2 WHERE id = $3'
-        await self.pool.execute(query, str(pokemon.entry.id), new_selected, self.user.id)
-
-        await self.pool.execute(
-            'UPDATE pokemons SET owner_id = $1 WHERE id = $2', 
-            to.id, str(pokemon.id)
-        )
+        await self.pool.statements.execute('users.set_selected', new_selected, self.user.id)
 
         catch_id = to.catch_id + 1
-        await self.pool.execute(
-            'UPDATE users SET pokemons = ARRAY_APPEND(users.pokemons, CAST($1 as UUID)), catch_id = $2 WHERE id = $3', 
-            str(pokemon.id), catch_id, to.id
-        )
+        await self.pool.statements.execute('pokemons.move', to.id, catch_id, str(pokemon.id))
+        await self.pool.statements.execute('users.set_catch_id', catch_id, to.id)
+
+        self.user.count_pokemon(pokemon.entry.dex_id, pokemon.entry.is_shiny, -1)
+        to.count_pokemon(pokemon.entry.dex_id, pokemon.entry.is_shiny)
+
+        pokemon.user = to
+        pokemon.entry.owner_id = to.id
+        pokemon.entry.catch_id = catch_id
+        pokemon.entry.mark_clean('owner_id', 'catch_id')
 
         to.pokemons[catch_id] = pokemon
 
         to.data['catch_id'] = catch_id
         self.user.data['selected'] = new_selected
 
+        await self.user.pokemons.fetch(new_selected)
+
     async def set_favourite(self, value: bool) -> None:
-        await self.pool.execute('UPDATE pokemons SET is_favourite = $1 WHERE id = $2', value, self.id)
-        self.data['is_favourite'] = value
+        self.entry.is_favourite = value
+        await self.entry.update(self.pool)
+
+        self.user.pokemons.invalidate()
 
     def build_discord_embed_for(
         self, user: User, *, show_nickname: bool = True, show_favourite: bool = True, add_footer: bool = True
     ) -> Tuple[discord.Embed, discord.File]:
-        rounded = self.ivs.round()
+        rounded = self.iv_percentage
         total = self.pool.bot.get_needed_exp(self.level)
 
         title = ''
@@ -344,13 +356,14 @@ class UserPokemon(commands.Converter[Any]):
 
         embed.description += f'**Nature**: {self.nature.name}\n\n'
 
+        computed = self.stats
         stats = {
-            'HP': (self.stats.health, self.ivs.hp),
-            'Attack': (self.stats.attack, self.ivs.atk),
-            'Defense': (self.stats.defense, self.ivs.defense),
-            'Sp. Atk': (self.stats.spatk, self.ivs.spatk),
-            'Sp. Def': (self.stats.spdef, self.ivs.spdef),
-            'Speed': (self.stats.speed, self.ivs.speed)
+            'HP': (computed.health, self.ivs.hp),
+            'Attack': (computed.attack, self.ivs.atk),
+            'Defense': (computed.defense, self.ivs.defense),
+            'Sp. Atk': (computed.spatk, self.ivs.spatk),
+            'Sp. Def': (computed.spdef, self.ivs.spdef),
+            'Speed': (computed.speed, self.ivs.speed)
         }
 
         if user.has_detailed_pokemon_view():
@@ -375,19 +388,260 @@ class UserPokemon(commands.Converter[Any]):
         file = discord.File(image, filename='pokemon.png')
         return embed, file
 
+class PokemonCollection:
+    # The unlisted pokemons of a user, keyed and ordered by catch id.
+    # Collections of users with more than `User.LAZY_THRESHOLD` pokemons start out incomplete, only holding the
+    # selected pokemon, and page everything else in from the database on demand. Lookups only see what's loaded, so
+    # anything that needs a specific pokemon should `fetch` it, and anything that needs all of them has to `load` first.
+    PAGE_SIZE: ClassVar[int] = 500
+
+    def __init__(self, user: User, pokemons: Iterable[UserPokemon], *, total: Optional[int] = None) -> None:
+        self.user = user
+        self.loaded: Dict[int, UserPokemon] = {pokemon.catch_id: pokemon for pokemon in pokemons}
+
+        self.complete = total is None
+        # Amount of pokemons the user owns, loaded or not
+        self.total = len(self.loaded) if total is None else total
+
+        self._lock = asyncio.Lock()
+        # Built on demand and thrown away whenever a pokemon is added, removed or edited, see `get_columns`
+        self._columns: Optional[PokemonColumns] = None
+
+    def __repr__(self) -> str:
+        return f'<PokemonCollection total={self.total} loaded={len(self.loaded)} complete={self.complete}>'
+
+    def __len__(self) -> int:
+        return self.total
+
+    def __contains__(self, catch_id: int) -> bool:
+        return catch_id in self.loaded
+
+    def __iter__(self) -> Iterator[int]:
+        self._ensure_complete()
+        return iter(self.loaded)
+
+    def __getitem__(self, catch_id: int) -> UserPokemon:
+        return self.loaded[catch_id]
+
+    def __setitem__(self, catch_id: int, pokemon: UserPokemon) -> None:
+        if catch_id not in self.loaded:
+            self.total += 1
+
+        self.loaded[catch_id] = pokemon
+        self.invalidate()
+
+    def _ensure_complete(self) -> None:
+        if not self.complete:
+            raise RuntimeError(f'The pokemons of user {self.user.id} are not loaded, await load() first')
+
+    def _get_or_create(self, record: asyncpg.Record, *, store: bool = True) -> UserPokemon:
+        pokemon = self.loaded.get(record['catch_id'])
+        if pokemon is not None and pokemon.id == record['id']:
+            return pokemon
+
+        pokemon = UserPokemon.from_dict(self.user, record)
+        if store:
+            self.loaded[pokemon.catch_id] = pokemon
+
+        return pokemon
+
+    def get(self, catch_id: int, default: Any = None) -> Any:
+        return self.loaded.get(catch_id, default)
+
+    def pop(self, catch_id: int, default: Any = _MISSING) -> Any:
+        pokemon = self.loaded.pop(catch_id, _MISSING)
+        if pokemon is _MISSING:
+            if default is _MISSING:
+                raise KeyError(catch_id)
+
+            return default
+
+        self.total -= 1
+        self.invalidate()
+
+        return pokemon
+
+    def keys(self) -> Iterable[int]:
+        self._ensure_complete()
+        return self.loaded.keys()
+
+    def values(self) -> Iterable[UserPokemon]:
+        self._ensure_complete()
+        return self.loaded.values()
+
+    def items(self) -> Iterable[Tuple[int, UserPokemon]]:
+        self._ensure_complete()
+        return self.loaded.items()
+
+    def reset(self, pokemons: Iterable[UserPokemon]) -> None:
+        self.loaded = {pokemon.catch_id: pokemon for pokemon in sorted(pokemons, key=lambda pokemon: pokemon.catch_id)}
+        self.total = len(self.loaded)
+        self.complete = True
+
+        self.invalidate()
+
+    def renumber(self, catch_ids: Dict[uuid.UUID, int]) -> None:
+        # Applies catch ids that were already changed in the database, { pokemon id: new catch id }
+        pokemons = list(self.loaded.values())
+        for pokemon in pokemons:
+            catch_id = catch_ids.get(pokemon.id)
+            if catch_id is not None:
+                pokemon.entry.catch_id = catch_id
+                pokemon.entry.mark_clean('catch_id')
+
+        pokemons.sort(key=lambda pokemon: pokemon.catch_id)
+        self.loaded = {pokemon.catch_id: pokemon for pokemon in pokemons}
+
+        self.invalidate()
+
+    def invalidate(self) -> None:
+        self._columns = None
+
+    def get_columns(self) -> Optional[PokemonColumns]:
+        # Only available for complete collections, and only when NumPy is installed
+        if not self.complete or not PokemonColumns.available():
+            return None
+
+        if self._columns is None:
+            self._columns = PokemonColumns(list(self.loaded.values()))
+
+        return self._columns
+
+    async def fetch(self, catch_id: int) -> Optional[UserPokemon]:
+        pokemon = self.loaded.get(catch_id)
+        if pokemon is not None or self.complete:
+            return pokemon
+
+        record = await self.user.pool.statements.fetchrow('pokemons.by_catch_id', self.user.id, catch_id)
+        if record is None:
+            return None
+
+        return self._get_or_create(record)
+
+    async def _fetch_many(self, name: str, *args: Any) -> List[UserPokemon]:
+        records = await self.user.pool.statements.fetch(name, self.user.id, *args)
+        return [self._get_or_create(record) for record in records]
+
+    async def fetch_species(self, dex_id: int) -> List[UserPokemon]:
+        if self.complete:
+            return [pokemon for pokemon in self.loaded.values() if pokemon.entry.dex_id == dex_id]
+
+        return await self._fetch_many('pokemons.by_species', dex_id)
+
+    async def fetch_by_nickname(self, nickname: str) -> List[UserPokemon]:
+        if self.complete:
+            return [pokemon for pokemon in self.loaded.values() if pokemon.nickname == nickname]
+
+        return await self._fetch_many('pokemons.by_nickname', nickname)
+
+    async def load(self) -> None:
+        if self.complete:
+            return
+
+        async with self._lock:
+            if self.complete:
+                return
+
+            records = await self.user.pool.statements.fetch('pokemons.unlisted_by_owner', self.user.id)
+
+            # Already loaded pokemons are kept as they are, other things (like the exp buffer) hold on to them
+            loaded = {pokemon.id: pokemon for pokemon in self.loaded.values()}
+            pokemons = [loaded.pop(record['id'], None) or UserPokemon.from_dict(self.user, record) for record in records]
+            # Whatever is left got caught while the query was running
+            pokemons.extend(loaded.values())
+
+            self.reset(pokemons)
+
+    async def iterate(self, *, page_size: Optional[int] = None) -> AsyncIterator[UserPokemon]:
+        # Yields every pokemon in catch id order, a page at a time using keyset pagination for incomplete collections.
+        # Paged in pokemons are not kept around unless they were already loaded.
+        if self.complete:
+            for pokemon in list(self.loaded.values()):
+                yield pokemon
+
+            return
+
+        page_size = page_size or self.PAGE_SIZE
+        after = 0
+
+        while True:
+            records = await self.user.pool.statements.fetch('pokemons.page', self.user.id, after, page_size)
+            for record in records:
+                yield self._get_or_create(record, store=False)
+
+            if len(records) < page_size:
+                return
+
+            after = records[-1]['catch_id']
+
 class User:
-    def __init__(self, record: asyncpg.Record, pokemons: List[asyncpg.Record], pool: Pool) -> None:
+    # Rough per-object memory usage, measured with tracemalloc, used to estimate how much memory the user cache takes
+    BASE_SIZE: ClassVar[int] = 1024
+    POKEMON_SIZE: ClassVar[int] = 640
+    # Users owning more pokemons than this get a lazy `PokemonCollection`
+    LAZY_THRESHOLD: ClassVar[int] = 2000
+
+    def __init__(
+        self,
+        record: asyncpg.Record,
+        pokemons: List[asyncpg.Record],
+        pool: Pool,
+        *,
+        total: Optional[int] = None,
+        counts: Optional[List[Tuple[int, bool, int]]] = None
+    ) -> None:
         self.pool = pool
         self.data = dict(record)
 
-        self._update_pokemons(pokemons)
+        self._update_pokemons(pokemons, total=total, counts=counts)
 
-    def _update_pokemons(self, records: List[asyncpg.Record]) -> None:
+    def _update_pokemons(
+        self,
+        records: List[asyncpg.Record],
+        *,
+        total: Optional[int] = None,
+        counts: Optional[List[Tuple[int, bool, int]]] = None
+    ) -> None:
+        # `counts` are (dex_id, is_shiny, count) tuples, only given along with `total` when `records` are not all of
+        # the user's pokemons.
         records = sorted(records, key=lambda record: record['catch_id'])
-        self.pokemons = {
-            pokemon['catch_id']: UserPokemon(self, dict(pokemon)) 
-            for pokemon in records if not pokemon['is_listed']
-        }
+        self.pokemons = PokemonCollection(
+            self,
+            (UserPokemon(self, Pokemon.from_dict(record)) for record in records if not record['is_listed']),
+            total=total if counts is not None else None
+        )
+
+        # { dex_id: count }, listed pokemons are still counted since they're owned until someone buys them
+        self.catches: collections.Counter[int] = collections.Counter()
+        self.shiny_catches: collections.Counter[int] = collections.Counter()
+
+        if counts is None:
+            counts = [(record['dex_id'], record['is_shiny'], 1) for record in records]
+
+        for dex_id, is_shiny, count in counts:
+            self.count_pokemon(dex_id, is_shiny, count)
+
+    def get_estimated_size(self) -> int:
+        return self.BASE_SIZE + len(self.pokemons.loaded) * self.POKEMON_SIZE
+
+    def needs_reindex(self) -> bool:
+        # Catch ids are supposed to go from 1 to the amount of pokemons without any gaps
+        if not self.pokemons.complete:
+            # Gaps can't be found without loading everything, but these two are cheap to check
+            return self.catch_id != len(self.pokemons) or (bool(self.pokemons) and self.get_selected() is None)
+
+        return (
+            self.catch_id != len(self.pokemons)
+            or any(catch_id != index for index, catch_id in enumerate(self.pokemons, start=1))
+            or (bool(self.pokemons) and self.selected not in self.pokemons)
+        )
+
+    def count_pokemon(self, dex_id: int, is_shiny: bool, amount: int = 1) -> None:
+        counters = (self.catches, self.shiny_catches) if is_shiny else (self.catches,)
+        for counter in counters:
+            counter[dex_id] += amount
+            if counter[dex_id] <= 0:
+                del counter[dex_id]
 
     @property
     def bot(self):
@@ -419,7 +673,7 @@ class User:
     def find(self, **attrs: Any) -> List[UserPokemon]:
         pokemons = [
             pokemon for pokemon in self.pokemons.values() 
-            if all(pokemon.data[key] == value for key, value in attrs.items())
+            if all(getattr(pokemon.entry, key) == value for key, value in attrs.items())
         ]
 
         return pokemons
@@ -440,41 +694,54 @@ class User:
 
         return pokemons
 
+    def get_stats(self, pokemons: Optional[Iterable[UserPokemon]] = None) -> List[ComputedStats]:
+        if pokemons is None:
+            pokemons = self.pokemons.values()
+
+        return self.bot.stats.compute_many(pokemon.stat_key for pokemon in pokemons)
+
     def get_pokemons(self, dex_id: int) -> List[UserPokemon]:
         return [pokemon for pokemon in self.pokemons.values() if pokemon.dex.id == dex_id]
 
-    async def get_catch_count_for(self, dex_id: int) -> int:
-        record = await self.pool.fetchrow(
-            'SELECT COUNT(id) FROM pokemons WHERE owner_id = $1 AND dex_id = $2', self.id, dex_id
-        )
+    async def fetch_pokemons(self, dex_id: int) -> List[UserPokemon]:
+        return await self.pokemons.fetch_species(dex_id)
 
-        assert record
-        return record['count']
+    def get_catch_count_for(self, dex_id: int) -> int:
+        return self.catches[dex_id]
+
+    def get_shiny_count_for(self, dex_id: int) -> int:
+        return self.shiny_catches[dex_id]
+
+    def get_caught_species_count(self) -> int:
+        return len(self.catches)
+
+    def get_shiny_count(self) -> int:
+        return sum(self.shiny_catches.values())
 
     async def add_redeems(self, amount: int) -> None:
-        await self.pool.execute('UPDATE users SET redeems = redeems + $1 WHERE id = $2', amount, self.id)
+        await self.pool.statements.execute('users.add_redeems', amount, self.id)
         self.data['redeems'] += amount
 
     async def add_redeem(self) -> None:
         await self.add_redeems(1)
 
     async def remove_redeems(self, amount: int) -> None:
-        await self.pool.execute('UPDATE users SET redeems = redeems - $1 WHERE id = $2', amount, self.id)
+        await self.pool.statements.execute('users.remove_redeems', amount, self.id)
         self.data['redeems'] -= amount
 
     async def remove_redeem(self) -> None:
         await self.remove_redeems(1)
         
     async def add_credits(self, amount: int) -> None:
-        await self.pool.execute('UPDATE users SET credits = credits + $1 WHERE id = $2', amount, self.id)
+        await self.pool.statements.execute('users.add_credits', amount, self.id)
         self.data['credits'] += amount
 
     async def remove_credits(self, amount: int) ->  None:
-        await self.pool.execute('UPDATE users SET credits = credits - $1 WHERE id = $2', amount, self.id)
+        await self.pool.statements.execute('users.remove_credits', amount, self.id)
         self.data['credits'] -= amount
     
     async def set_detailed_view(self, value: bool) -> None:
-        await self.pool.execute('UPDATE users SET detailed_pokemon_view = $1 WHERE id = $2', value, self.id)
+        await self.pool.statements.execute('users.set_detailed_view', value, self.id)
         self.data['detailed_pokemon_view'] = value
             
     async def add_pokemon(
@@ -493,9 +760,21 @@ class User:
         pokemon = self.pool.get_free_pokemon(pokemon_id, is_shiny=is_shiny)
 
         if pokemon is not None:
-            await pokemon.edit(owner_id=self.id, catch_id=catch_id, level=level, exp=exp)
-            self.pokemons[catch_id] = pokemon
+            pokemon.user = self
 
+            entry = pokemon.entry
+            entry.owner_id = self.id
+            entry.catch_id = catch_id
+            entry.level = level
+            entry.exp = exp
+
+            # The write below supersedes any exp still buffered from the previous owner
+            self.pool.exp.discard(pokemon)
+
+            await entry.update(self.pool)
+            await pokemon.save()
+
+            self.count_pokemon(entry.dex_id, entry.is_shiny)
             return pokemon
 
         entry = self.pool.create_pokemon(pokemon_id, self.id, catch_id, is_shiny)
@@ -514,45 +793,91 @@ class User:
 
         await entry.create(self.pool)
 
-        pokemon = UserPokemon(self, entry.to_dict())
+        pokemon = UserPokemon(self, entry)
         await pokemon.save()
 
-        await self.pool.execute('UPDATE users SET catch_id = $1 WHERE id = $2', catch_id, self.id)
-        self.data['catch_id'] = catch_id
-
+        self.count_pokemon(entry.dex_id, entry.is_shiny)
         return pokemon
 
-    async def reindex(self) -> None:
-        index = 1
-        selected = 1
+    async def compact(self) -> None:
+        # Same as `reindex` except the database does the renumbering, so the pokemons don't need to be loaded
+        selected = self.get_selected()
 
-        data: List[Tuple[int, str]] = []
-        for pokemon in sorted(self.pokemons.values(), key=lambda poke: poke.catch_id):
-            if pokemon.is_selected():
-                selected = index
+        async with self.pool.acquire() as conn:
+            async with conn.transaction():
+                records = await self.pool.statements.fetch('pokemons.compact', self.id, connection=conn)
+                catch_ids = {record['id']: record['catch_id'] for record in records}
 
-            pokemon.data['catch_id'] = index
-            data.append((index, str(pokemon.id)))
+                selected_id = catch_ids.get(selected.id, selected.catch_id) if selected is not None else 1
+                await self.pool.statements.execute(
+                    'users.set_index', selected_id, len(self.pokemons), self.id, connection=conn
+                )
 
-            index += 1
+        self.pokemons.renumber(catch_ids)
 
-        self.data['catch_id'] = index - 1
-        self.data['selected'] = selected
+        self.data['catch_id'] = len(self.pokemons)
+        self.data['selected'] = selected_id
 
-        await self.pool.execute('UPDATE users SET selected = $1, catch_id = $2 WHERE id = $3', selected, index - 1, self.id)    
-        await self.pool.executemany('UPDATE pokemons SET catch_id = $1 WHERE id = $2', data)
+        await self.pokemons.fetch(selected_id)
 
-        records = await self.pool.fetch('SELECT * FROM pokemons WHERE owner_id = $1 AND is_listed = FALSE', self.id)
-        self._update_pokemons(records)
+    async def reindex(self, *, after: int = 0) -> None:
+        if not self.pokemons.complete:
+            return await self.compact()
+
+        # Only the pokemons with a catch id greater than `after` get renumbered, which is enough after
+        # releasing or trading away pokemons as long as the catch ids up to `after` are still contiguous.
+        pokemons = sorted(
+            (pokemon for pokemon in self.pokemons.values() if pokemon.catch_id > after),
+            key=lambda pokemon: pokemon.catch_id
+        )
+
+        kept = len(self.pokemons) - len(pokemons)
+        if kept != after:
+            return await self.reindex()
+
+        selected = self.get_selected()
+        changes: List[Tuple[UserPokemon, int]] = [
+            (pokemon, index) for index, pokemon in enumerate(pokemons, start=kept + 1) if pokemon.catch_id != index
+        ]
+
+        catch_id = len(self.pokemons)
+        if selected is not None:
+            selected_id = next((index for pokemon, index in changes if pokemon is selected), selected.catch_id)
+        else:
+            selected_id = 1
+
+        async with self.pool.acquire() as conn:
+            async with conn.transaction():
+                if changes:
+                    await self.pool.statements.execute(
+                        'pokemons.reindex',
+                        [str(pokemon.id) for pokemon, _ in changes],
+                        [index for _, index in changes],
+                        connection=conn
+                    )
+
+                await self.pool.statements.execute('users.set_index', selected_id, catch_id, self.id, connection=conn)
+
+        for pokemon, new in changes:
+            self.pokemons.pop(pokemon.catch_id, None)
+
+            pokemon.entry.catch_id = new
+            pokemon.entry.mark_clean('catch_id')
+
+        if changes:
+            self.pokemons.reset([*self.pokemons.values(), *pokemons])
+
+        self.data['catch_id'] = catch_id
+        self.data['selected'] = selected_id
 
     async def refetch(self):
-        record = await self.pool.fetchrow('SELECT * from users WHERE id = $1', self.id)
+        record = await self.pool.statements.fetchrow('users.get', self.id)
         assert record
 
         self.record = record
 
     async def delete(self) -> None:
-        await self.pool.execute('DELETE FROM users WHERE id = $1', self.id)
+        await self.pool.statements.execute('users.delete', self.id)
         self.pool.users.pop(self.id, None)
 
-        await self.pool.execute('DELETE FROM pokemons WHERE owner_id = $1', self.id)
\ No newline at end of file
+        await self.pool.statements.execute('pokemons.delete_by_owner', self.id)
\ No newline at end of file
@@ -3,4 +3,8 @@ from .utils import *
 from .pokedex import *
 from .math import *
 from .views import *
-from .ttldict import *
\ No newline at end of file
+from .ttldict import *
+from .orderbook import *
+from .query import *
+from .spawns import *
+from .singleflight import *
@@ -30,6 +30,9 @@ class Context(commands.Context['Pokecord']):
     def __init__(self, **kwargs: Any) -> None:
         super().__init__(**kwargs)
         self.count = 0
+        self.started_at = 0.0
+        # Id of the user pinned in the user cache for the duration of the command
+        self.pinned_user: Optional[int] = None
 
     pool: ContextPool
 
@@ -1,5 +1,6 @@
-from typing import List
+from typing import Callable, Iterable, List, NamedTuple, Sequence, Tuple
 
+import functools
 import random
 
 __all__ = (
@@ -9,9 +10,21 @@ __all__ = (
     'chance',
     'get_critical_multiplier',
     'get_damage',
-    'is_miss'
+    'is_miss',
+    'ComputedStats',
+    'StatEngine'
 )
 
+StatKey = Tuple[int, Tuple[int, ...], Tuple[int, ...], int, str]
+
+class ComputedStats(NamedTuple):
+    health: int
+    attack: int
+    defense: int
+    spatk: int
+    spdef: int
+    speed: int
+
 def sequence(a: int, b: int, n: int) -> List[int]:
     return [random.randint(a, b) for _ in range(n)]
 
@@ -37,4 +50,44 @@ def get_damage(level: int, power: int, attack: int, defense: int, type: int):
     return dmg
 
 def is_miss(acc: int) -> bool:
-    return False if acc == 100 else chance(acc)
\ No newline at end of file
+    return False if acc == 100 else chance(acc)
+
+# Computes all six stats of a pokemon in one pass, memoized on (dex_id, ivs, evs, level, nature).
+# `get_base` resolves a dex id into its base stats and `get_nature` resolves a nature name into its
+# (atk, defense, spatk, spdef, speed) multipliers.
+class StatEngine:
+    def __init__(
+        self,
+        get_base: Callable[[int], Sequence[int]],
+        get_nature: Callable[[str], Sequence[float]],
+        *,
+        maxsize: int = 8192
+    ) -> None:
+        self.get_base = get_base
+        self.get_nature = get_nature
+
+        self._compute = functools.lru_cache(maxsize=maxsize)(self._compute_uncached)
+
+    def _compute_uncached(
+        self, dex_id: int, ivs: Tuple[int, ...], evs: Tuple[int, ...], level: int, nature: str
+    ) -> ComputedStats:
+        base = self.get_base(dex_id)
+        multipliers = self.get_nature(nature)
+
+        return ComputedStats(
+            get_health_stat(base[0], ivs[0], evs[0], level),
+            *[get_other_stat(base[i], ivs[i], evs[i], level, multipliers[i - 1]) for i in range(1, 6)]
+        )
+
+    def compute(self, dex_id: int, ivs: Sequence[int], evs: Sequence[int], level: int, nature: str) -> ComputedStats:
+        return self._compute(dex_id, tuple(ivs), tuple(evs), level, nature)
+
+    def compute_many(self, keys: Iterable[StatKey]) -> List[ComputedStats]:
+        compute = self._compute
+        return [compute(*key) for key in keys]
+
+    def cache_info(self):
+        return self._compute.cache_info()
+
+    def clear(self) -> None:
+        self._compute.cache_clear()
@@ -0,0 +1,90 @@
+from typing import Dict, Iterator, List, Optional, Tuple
+
+import heapq
+
+__all__ = 'OrderBook',
+
+class OrderBook:
+    # A min-heap of (price, id) pairs. Removals are lazy, removed entries are only dropped once they reach the top
+    # of the heap or once they make up most of it, which keeps both `add` and `remove` at O(log n).
+    def __init__(self) -> None:
+        self._heap: List[Tuple[int, int]] = []
+        # { id: entry }, an entry that is in the heap but not in here (or not this exact tuple) was removed
+        self._entries: Dict[int, Tuple[int, int]] = {}
+
+    def __repr__(self) -> str:
+        return f'<OrderBook size={len(self)}>'
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def __contains__(self, id: int) -> bool:
+        return id in self._entries
+
+    def __iter__(self) -> Iterator[Tuple[int, int]]:
+        return self.iter()
+
+    def _is_live(self, entry: Tuple[int, int]) -> bool:
+        return self._entries.get(entry[1]) is entry
+
+    def _prune(self) -> None:
+        heap = self._heap
+        while heap and not self._is_live(heap[0]):
+            heapq.heappop(heap)
+
+        if len(heap) > 2 * len(self._entries) + 32:
+            self._heap = list(self._entries.values())
+            heapq.heapify(self._heap)
+
+    def add(self, id: int, price: int) -> None:
+        if id in self._entries:
+            raise ValueError(f'{id} is already in the order book')
+
+        entry = (price, id)
+        self._entries[id] = entry
+
+        heapq.heappush(self._heap, entry)
+
+    def remove(self, id: int) -> bool:
+        if self._entries.pop(id, None) is None:
+            return False
+
+        self._prune()
+        return True
+
+    def get_price(self, id: int) -> Optional[int]:
+        entry = self._entries.get(id)
+        return entry[0] if entry is not None else None
+
+    def iter(self, *, max_price: Optional[int] = None) -> Iterator[Tuple[int, int]]:
+        # Yields (price, id) pairs from cheapest to most expensive by walking the heap with a second, smaller heap
+        # of frontier nodes, so getting the k cheapest entries costs O(k log k) instead of sorting the whole book.
+        # The book must not be modified while this is being iterated.
+        heap = self._heap
+        if not heap:
+            return
+
+        frontier = [(heap[0], 0)]
+        while frontier:
+            entry, index = heapq.heappop(frontier)
+            if max_price is not None and entry[0] > max_price:
+                return
+
+            if self._is_live(entry):
+                yield entry
+
+            for child in (2 * index + 1, 2 * index + 2):
+                if child < len(heap):
+                    heapq.heappush(frontier, (heap[child], child))
+
+    def cheapest(self, amount: int = 1, *, max_price: Optional[int] = None) -> List[Tuple[int, int]]:
+        entries: List[Tuple[int, int]] = []
+        if amount <= 0:
+            return entries
+
+        for entry in self.iter(max_price=max_price):
+            entries.append(entry)
+            if len(entries) >= amount:
+                break
+
+        return entries
@@ -1,6 +1,6 @@
 from __future__ import annotations
 
-from typing import Any, Callable, Dict, NamedTuple, List, Optional
+from typing import Any, Callable, Dict, Mapping, NamedTuple, List, Optional
 from discord.ext import commands
 import pathlib
 import functools
@@ -11,6 +11,7 @@ import enum
 
 from . import utils
 from .context import Context
+from .spawns import Rarity, SpawnTable
 from src.consts import DATA
 
 __all__ = (
@@ -18,12 +19,6 @@ __all__ = (
     'Pokedex',
 )
 
-class Rarity(str, enum.Enum):
-    Common = 'common'
-    UltraBeast = 'ultra_beast'
-    Mythical = 'mythical'
-    Legendary = 'legendary'
-
 class EvolutionCondition(str, enum.Enum):
     Time = 'time'
     HeldItem = 'held_item'
@@ -94,6 +89,7 @@ class PokedexEntry(commands.Converter[Any]):
     catchable: bool
     is_form: bool
     enabled: bool
+    spawn_weight: float
     images: PokemonImages
 
     def __init__(self, **kwargs: Any) -> None:
@@ -127,6 +123,27 @@ class PokedexEntry(commands.Converter[Any]):
     def default_name(self) -> str:
         return self.names.en
 
+    @property
+    def spawn_rarity(self) -> Optional[Rarity]:
+        # Which spawn table bucket this entry belongs to, None if it can't spawn at all. Forms only ever spawn if
+        # they're legendary, mythical or ultra beasts, just like `Pokedex.commons` leaves them out. Event pokemons
+        # (forms or not) get a bucket of their own, which is empty unless an event weight is set, see `SpawnTable`.
+        if not (self.enabled and self.catchable):
+            return None
+
+        if self.rarity.event:
+            return Rarity.Event
+        elif self.rarity.ultra_beast:
+            return Rarity.UltraBeast
+        elif self.rarity.mythical:
+            return Rarity.Mythical
+        elif self.rarity.legendary:
+            return Rarity.Legendary
+        elif self.is_form:
+            return None
+
+        return Rarity.Common
+
     def get_rarity_name(self) -> str:
         if self.rarity.legendary:
             return 'Legendary'
@@ -160,6 +177,7 @@ class Pokedex:
     def __init__(self) -> None: 
         self.reader = PokedexReader(self.path)
         self.pokemons: Dict[int, PokedexEntry] = self.create_all_pokemons()
+        self.spawns = SpawnTable(self)
 
     def __iter__(self):
         return iter(self.pokemons.values())
@@ -193,10 +211,19 @@ class Pokedex:
         return self.find(lambda pokemon: not any([*pokemon.rarity, pokemon.is_form]))
 
     def random(self, *, rarity: Optional[Rarity] = None) -> PokedexEntry:
+        # With a rarity, this picks a pokemon that can actually spawn, see `SpawnTable`
         if rarity is None:
             return random.choice(self.entries)
 
-        return random.choice(self.with_rarity(rarity))
+        pokemon = self.spawns.sample(rarity)
+        if pokemon is None:
+            raise ValueError(f'No pokémon with rarity {rarity.value!r} can spawn')
+
+        return pokemon
+
+    def set_spawn_weights(self, weights: Mapping[int, float], *, event_weight: Optional[float] = None) -> None:
+        # Rebuilds the spawn tables with `weights` ({ dex_id: weight }) on top of the current ones, e.g. for events
+        self.spawns = self.spawns.with_weights(weights, event_weight=event_weight)
 
     def find(self, predicate: Callable[[PokedexEntry], bool]) -> List[PokedexEntry]:
         return utils.find(self, predicate)
@@ -206,6 +233,9 @@ class Pokedex:
         return {getattr(pokemon.names, language): pokemon for pokemon in pokemons}
 
     def with_rarity(self, rarity: Rarity) -> List[PokedexEntry]:
+        if rarity is Rarity.Common:
+            return self.commons
+
         return self.find(lambda pokemon: getattr(pokemon.rarity, rarity, False))
 
     def with_form(self, form: str) -> List[PokedexEntry]:
@@ -240,7 +270,8 @@ class Pokedex:
             rarity=self.create_rarity(row),
             is_form=row.get('is_form', False),
             catchable=row.get('catchable', False),
-            enabled=row.get('enabled', False)
+            enabled=row.get('enabled', False),
+            spawn_weight=row.get('spawn_weight', 1.0)
         )
 
     def create_stats(self, data: Dict[str, Any]) -> PokemonStats:
@@ -0,0 +1,158 @@
+from __future__ import annotations
+
+from typing import Any, Callable, Dict, FrozenSet, Iterable, List, Mapping, NamedTuple, Optional, TYPE_CHECKING
+
+import operator
+
+from .utils import IntegerOrdering, Order
+
+if TYPE_CHECKING:
+    from .pokedex import Pokedex, PokedexEntry
+
+__all__ = ('Fields', 'Predicate', 'QueryPlan')
+
+# { field name: function returning the value of that field for an item }
+Fields = Mapping[str, Callable[[Any], Any]]
+
+_ORDERINGS: Dict[Order, str] = {Order.EQ: 'eq', Order.GT: 'gt', Order.LT: 'lt'}
+
+_OPERATORS: Dict[str, Callable[[Any, Any], bool]] = {
+    'eq': operator.eq,
+    'gt': operator.gt,
+    'lt': operator.lt,
+    'in': lambda value, values: value in values,
+    # `bounds` is a (low, high) tuple, low inclusive and high exclusive
+    'range': lambda value, bounds: bounds[0] <= value < bounds[1],
+    'is': lambda value, expected: bool(value) is expected,
+    'casefold': lambda value, expected: value.casefold() == expected,
+}
+
+class Predicate(NamedTuple):
+    field: str
+    op: str
+    value: Any
+    # Rough relative cost of checking a single item, and the estimated fraction of items that pass
+    cost: float = 1.0
+    selectivity: float = 0.5
+
+    @property
+    def rank(self) -> float:
+        # Checking predicates by ascending cost / (1 - selectivity) minimizes the expected cost of rejecting an item
+        return self.cost / max(1.0 - self.selectivity, 1e-6)
+
+    def compile(self, fields: Fields) -> Callable[[Any], bool]:
+        get, op, value = fields[self.field], _OPERATORS[self.op], self.value
+        return lambda item: op(get(item), value)
+
+class QueryPlan:
+    # A set of filters compiled once and then checked against every item, from the cheapest and most selective
+    # predicate to the least. Everything that only depends on the species (name, rarity, type, region) is resolved
+    # against the pokedex up front and folded into a single `dex_id in {...}` predicate, which is also what indexes
+    # (`Market.by_species`, `PokemonColumns.dex_id`) can answer directly, see `dex_ids` and `without`.
+    def __init__(self, predicates: Iterable[Predicate], fields: Fields) -> None:
+        self.fields = fields
+        self.predicates: List[Predicate] = sorted(predicates, key=lambda predicate: predicate.rank)
+
+        self._checks = [predicate.compile(fields) for predicate in self.predicates]
+
+    def __repr__(self) -> str:
+        return f'<QueryPlan predicates={self.predicates!r}>'
+
+    def __bool__(self) -> bool:
+        return bool(self.predicates)
+
+    @classmethod
+    def from_flags(cls, flags: Any, pokedex: Pokedex, fields: Fields, *, name_field: str = 'species') -> QueryPlan:
+        # `flags` is any `FlagParser`, flags it doesn't define read as None. `name_field` is either 'species', to
+        # match `--name` against the species name, or 'nickname' to match it against the nickname instead.
+        # Raises ValueError if a range flag can't be parsed.
+        predicates: List[Predicate] = []
+
+        dex_ids = cls.get_species(flags, pokedex, match_name=name_field == 'species')
+        if dex_ids is not None:
+            predicates.append(
+                Predicate('dex_id', 'in', dex_ids, selectivity=len(dex_ids) / max(len(pokedex.entries), 1))
+            )
+
+        for name, field in (('level', 'level'), ('iv', 'iv'), ('price', 'price')):
+            value = getattr(flags, name)
+            if value is None or field not in fields:
+                continue
+
+            try:
+                ordering = IntegerOrdering.parse(str(value))
+            except ValueError:
+                raise ValueError(f'Invalid {name} argument') from None
+
+            op = _ORDERINGS[ordering.order]
+            if field == 'iv' and op == 'eq':
+                # IV percentages have two decimals, so a bare `--iv N` means N <= iv < N + 1 rather than exactly N
+                predicates.append(Predicate(field, 'range', (ordering.value, ordering.value + 1), selectivity=0.01))
+            else:
+                predicates.append(Predicate(field, op, ordering.value, selectivity=0.01 if op == 'eq' else 0.5))
+
+        if flags.shiny and 'shiny' in fields:
+            predicates.append(Predicate('shiny', 'is', True, selectivity=0.01))
+        if flags.favourite and 'favourite' in fields:
+            predicates.append(Predicate('favourite', 'is', True, selectivity=0.05))
+        if flags.nickname is not None and 'nickname' in fields:
+            predicates.append(Predicate('nickname', 'eq', flags.nickname, cost=2.0, selectivity=0.01))
+        if flags.name is not None and name_field == 'nickname':
+            predicates.append(Predicate('nickname', 'casefold', flags.name.casefold(), cost=3.0, selectivity=0.01))
+        if flags.nature is not None and 'nature' in fields:
+            predicates.append(Predicate('nature', 'casefold', flags.nature.casefold(), cost=3.0, selectivity=0.04))
+
+        return cls(predicates, fields)
+
+    @staticmethod
+    def get_species(flags: Any, pokedex: Pokedex, *, match_name: bool = True) -> Optional[FrozenSet[int]]:
+        checks: List[Callable[[PokedexEntry], bool]] = []
+
+        if match_name and flags.name is not None:
+            name = flags.name.casefold()
+            checks.append(lambda entry: entry.default_name.casefold() == name)
+        if flags.legendary:
+            checks.append(lambda entry: entry.rarity.legendary)
+        if flags.mythical:
+            checks.append(lambda entry: entry.rarity.mythical)
+        if flags.ultra_beast:
+            checks.append(lambda entry: entry.rarity.ultra_beast)
+        if flags.type is not None:
+            kind = flags.type.casefold()
+            checks.append(
+                lambda entry: entry.types.first.casefold() == kind or (entry.types.second or '').casefold() == kind
+            )
+        if flags.region is not None:
+            region = flags.region.casefold()
+            checks.append(lambda entry: entry.region.casefold() == region)
+
+        if not checks:
+            return None
+
+        return frozenset(entry.id for entry in pokedex.entries if all(check(entry) for check in checks))
+
+    @property
+    def dex_ids(self) -> Optional[FrozenSet[int]]:
+        predicate = self.get('dex_id')
+        return predicate.value if predicate is not None else None
+
+    def get(self, field: str) -> Optional[Predicate]:
+        return next((predicate for predicate in self.predicates if predicate.field == field), None)
+
+    def without(self, *fields: str) -> QueryPlan:
+        # The same plan minus the predicates on `fields`, for when an index already took care of them
+        return QueryPlan((predicate for predicate in self.predicates if predicate.field not in fields), self.fields)
+
+    def matches(self, item: Any) -> bool:
+        for check in self._checks:
+            if not check(item):
+                return False
+
+        return True
+
+    def filter(self, items: Iterable[Any]) -> List[Any]:
+        if not self._checks:
+            return list(items)
+
+        matches = self.matches
+        return [item for item in items if matches(item)]
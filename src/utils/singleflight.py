@@ -0,0 +1,105 @@
+from __future__ import annotations
+
+from typing import Any, Awaitable, Callable, Dict, Generic, NamedTuple, Optional, TypeVar
+
+import asyncio
+import datetime
+
+from .ttldict import TTLDict
+
+K = TypeVar('K')
+V = TypeVar('V')
+
+__all__ = ('SingleFlightStats', 'SingleFlight')
+
+_MISSING: Any = object()
+
+class SingleFlightStats(NamedTuple):
+    loads: int
+    shared: int
+    hits: int
+
+    @property
+    def saved_rate(self) -> float:
+        # Share of calls that didn't have to run a load of their own
+        total = self.loads + self.shared + self.hits
+        return (self.shared + self.hits) / total if total else 0.0
+
+class SingleFlight(Generic[K, V]):
+    # Deduplicates concurrent async loads: at most one load per key is in flight, and every caller asking for the same
+    # key while it runs awaits that same load instead of starting its own, getting the same result or exception.
+    # With a `ttl`, results are also kept for that long (in a TTLDict bounded to `maxsize`), without one only the
+    # in-flight load is shared and callers are expected to cache the result themselves.
+    # Loads run as their own task, so a caller getting cancelled doesn't cancel the load for everyone else.
+    def __init__(self, *, ttl: Optional[float] = None, maxsize: Optional[int] = None) -> None:
+        self.ttl = ttl
+        self.results: Optional[TTLDict[K, V]] = None
+        if ttl is not None:
+            self.results = TTLDict(expiry=datetime.timedelta(seconds=ttl), maxsize=maxsize)
+
+        self.__inflight: Dict[K, asyncio.Task[V]] = {}
+
+        self.loads = 0
+        self.shared = 0
+        self.hits = 0
+
+    def __repr__(self) -> str:
+        return f'<SingleFlight inflight={len(self.__inflight)} ttl={self.ttl}>'
+
+    def __contains__(self, key: K) -> bool:
+        return key in self.__inflight
+
+    @property
+    def stats(self) -> SingleFlightStats:
+        return SingleFlightStats(loads=self.loads, shared=self.shared, hits=self.hits)
+
+    def _done(self, key: K, task: asyncio.Task[V]) -> None:
+        # The load might have been invalidated (and maybe restarted) while it ran, its result is stale then
+        if self.__inflight.get(key) is not task:
+            return
+
+        del self.__inflight[key]
+        if task.cancelled():
+            return
+
+        # Retrieving the exception keeps asyncio from logging it when every caller got cancelled
+        if task.exception() is None and self.results is not None:
+            self.results[key] = task.result()
+
+    async def do(self, key: K, load: Callable[[], Awaitable[V]]) -> V:
+        if self.results is not None:
+            value = self.results.get(key, _MISSING)
+            if value is not _MISSING:
+                self.hits += 1
+                return value
+
+        task = self.__inflight.get(key)
+        if task is None:
+            self.loads += 1
+
+            task = asyncio.ensure_future(load())
+            task.add_done_callback(lambda task: self._done(key, task))
+
+            self.__inflight[key] = task
+        else:
+            self.shared += 1
+
+        return await asyncio.shield(task)
+
+    def is_current(self, key: K) -> bool:
+        # Whether the calling load is still the one registered for `key`, i.e. it hasn't been invalidated since it
+        # started. Only meaningful from inside a load, which runs as its own task.
+        task = self.__inflight.get(key)
+        return task is not None and task is asyncio.current_task()
+
+    def invalidate(self, key: K) -> None:
+        # Forgets the cached result for `key`. A load that's still running keeps going for the callers already waiting
+        # on it, but its result won't be cached and new callers start a fresh one.
+        self.__inflight.pop(key, None)
+        if self.results is not None:
+            self.results.pop(key)
+
+    def clear(self) -> None:
+        self.__inflight.clear()
+        if self.results is not None:
+            self.results.clear()
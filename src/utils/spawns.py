@@ -0,0 +1,169 @@
+from __future__ import annotations
+
+from typing import TYPE_CHECKING, Dict, Generic, Iterable, List, Mapping, Optional, Sequence, Tuple, TypeVar
+
+import enum
+import random
+
+if TYPE_CHECKING:
+    from .pokedex import PokedexEntry
+
+T = TypeVar('T')
+
+__all__ = ('AliasTable', 'SpawnTable')
+
+# Lives here rather than in `pokedex` (which re-exports it) since the spawn table needs it at runtime
+class Rarity(str, enum.Enum):
+    Common = 'common'
+    UltraBeast = 'ultra_beast'
+    Mythical = 'mythical'
+    Legendary = 'legendary'
+    Event = 'event'
+
+class AliasTable(Generic[T]):
+    # Weighted sampling in O(1) using Vose's alias method. Building the table is O(n), after which every sample is a
+    # single random column plus a biased coin flip between that column's item and its alias.
+    def __init__(self, items: Sequence[T], weights: Sequence[float], *, rng: Optional[random.Random] = None) -> None:
+        if len(items) != len(weights):
+            raise ValueError('items and weights must have the same length')
+        if not items:
+            raise ValueError('Cannot build an alias table without any items')
+        if any(weight < 0 for weight in weights):
+            raise ValueError('Weights cannot be negative')
+
+        total = sum(weights)
+        if total <= 0:
+            raise ValueError('At least one weight must be positive')
+
+        self.items: Tuple[T, ...] = tuple(items)
+        self.total = total
+        self.rng = rng or random.Random()
+
+        count = len(items)
+        scaled = [weight * count / total for weight in weights]
+
+        self._probabilities = [1.0] * count
+        self._aliases = list(range(count))
+
+        small = [index for index, weight in enumerate(scaled) if weight < 1.0]
+        large = [index for index, weight in enumerate(scaled) if weight >= 1.0]
+
+        while small and large:
+            less, more = small.pop(), large.pop()
+
+            self._probabilities[less] = scaled[less]
+            self._aliases[less] = more
+
+            scaled[more] = (scaled[more] + scaled[less]) - 1.0
+            (small if scaled[more] < 1.0 else large).append(more)
+
+        # Whatever is left is 1.0 give or take floating point error, those columns never use their alias
+        for index in small + large:
+            self._probabilities[index] = 1.0
+
+    def __repr__(self) -> str:
+        return f'<AliasTable size={len(self)} total={self.total}>'
+
+    def __len__(self) -> int:
+        return len(self.items)
+
+    def probability(self, index: int) -> float:
+        # The overall probability of sampling `items[index]`, mostly useful to check the table against its weights
+        count = len(self.items)
+        probability = self._probabilities[index]
+
+        for column, alias in enumerate(self._aliases):
+            if alias == index and column != index:
+                probability += 1.0 - self._probabilities[column]
+
+        return probability / count
+
+    def sample(self) -> T:
+        rng = self.rng
+        column = int(rng.random() * len(self.items))
+
+        if rng.random() < self._probabilities[column]:
+            return self.items[column]
+
+        return self.items[self._aliases[column]]
+
+class SpawnTable:
+    # Every pokemon that can spawn, bucketed by `PokedexEntry.spawn_rarity` with one alias table per bucket. Disabled
+    # and uncatchable entries never make it into a bucket, and neither do entries whose weight ends up being 0.
+    # The weight of an entry is its `spawn_weight` from the pokedex, replaced by `weights[entry.id]` when given and
+    # multiplied by `event_weight` for event pokemons, so an event can boost (or disable) a set of species by building
+    # a new table through `with_weights`.
+    # Event pokemons only spawn while an event is running: `event_weight` is 0 by default, which leaves their bucket
+    # empty. Otherwise common spawns draw from the event bucket in proportion to its total weight, so that an event
+    # pokemon with an (event) weight of 1 is as likely as any common pokemon with a weight of 1.
+    def __init__(
+        self,
+        entries: Iterable[PokedexEntry],
+        *,
+        weights: Optional[Mapping[int, float]] = None,
+        event_weight: float = 0.0,
+        rng: Optional[random.Random] = None
+    ) -> None:
+        self.entries: List[PokedexEntry] = list(entries)
+        self.weights: Dict[int, float] = dict(weights or {})
+        self.event_weight = event_weight
+        self.rng = rng or random.Random()
+
+        buckets: Dict[Rarity, Tuple[List[PokedexEntry], List[float]]] = {}
+        for entry in self.entries:
+            rarity = entry.spawn_rarity
+            if rarity is None:
+                continue
+
+            weight = self.get_weight(entry)
+            if weight <= 0:
+                continue
+
+            items, bucket_weights = buckets.setdefault(rarity, ([], []))
+            items.append(entry)
+            bucket_weights.append(weight)
+
+        self.tables: Dict[Rarity, AliasTable[PokedexEntry]] = {
+            rarity: AliasTable(items, bucket_weights, rng=self.rng) for rarity, (items, bucket_weights) in buckets.items()
+        }
+
+    def __repr__(self) -> str:
+        sizes = ' '.join(f'{rarity.value}={len(table)}' for rarity, table in self.tables.items())
+        return f'<SpawnTable {sizes}>'
+
+    def __contains__(self, rarity: Rarity) -> bool:
+        return rarity in self.tables
+
+    def get_weight(self, entry: PokedexEntry) -> float:
+        weight = self.weights.get(entry.id, entry.spawn_weight)
+        if entry.rarity.event:
+            weight *= self.event_weight
+
+        return weight
+
+    def with_weights(self, weights: Mapping[int, float], *, event_weight: Optional[float] = None) -> SpawnTable:
+        # A new table with `weights` layered on top of this one's
+        return SpawnTable(
+            self.entries,
+            weights={**self.weights, **weights},
+            event_weight=self.event_weight if event_weight is None else event_weight,
+            rng=self.rng
+        )
+
+    def get(self, rarity: Rarity) -> Optional[AliasTable[PokedexEntry]]:
+        return self.tables.get(rarity)
+
+    def sample(self, rarity: Rarity) -> Optional[PokedexEntry]:
+        # Returns None if nothing of that rarity can spawn
+        table = self.tables.get(rarity)
+
+        events = self.tables.get(Rarity.Event) if rarity is Rarity.Common else None
+        if events is not None:
+            total = events.total + (table.total if table is not None else 0.0)
+            if table is None or self.rng.random() * total < events.total:
+                table = events
+
+        if table is None:
+            return None
+
+        return table.sample()
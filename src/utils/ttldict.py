@@ -1,81 +1,204 @@
-from typing import Dict, ItemsView, KeysView, Mapping, Tuple, TypeVar, Any, ValuesView
+from __future__ import annotations
 
+from typing import (
+    Any, Callable, ClassVar, Generic, Iterator, List, NamedTuple, Optional, Tuple, TypeVar, Union, ItemsView, KeysView,
+    ValuesView
+)
+
+from discord.ext import tasks
+import collections
 import datetime
+import heapq
+import itertools
+import time
 
 K = TypeVar('K')
 V = TypeVar('V')
 
-__all__ = 'TTLDict',
+__all__ = ('TTLDictStats', 'TTLDict')
+
+_MISSING: Any = object()
+
+class TTLDictStats(NamedTuple):
+    size: int
+    hits: int
+    misses: int
+    expirations: int
+    evictions: int
 
-class TTLDict(Mapping[K, V]):
-    def __init__(self, expiry: datetime.timedelta) -> None:
+    @property
+    def hit_rate(self) -> float:
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+class TTLDict(Generic[K, V]):
+    # A dict whose entries expire `expiry` after they were set (or after their own TTL, see `set`), optionally bounded
+    # to `maxsize` entries with the least recently used ones getting evicted first.
+    # Deadlines live in a min-heap on a monotonic clock, so expiring entries costs O(log n) each and checking whether
+    # anything expired is O(1). Overwritten and deleted entries are dropped from the heap lazily. Expired entries are
+    # removed whenever the dict is accessed, and by `reaper` for dicts that can sit idle for a while.
+    REAPER_INTERVAL: ClassVar[float] = 60.0
+
+    def __init__(
+        self,
+        expiry: datetime.timedelta,
+        *,
+        maxsize: Optional[int] = None,
+        clock: Callable[[], float] = time.monotonic
+    ) -> None:
         self.__expiry = expiry
-        self.__storage: Dict[K, Tuple[V, datetime.datetime]] = {}
+        self.maxsize = maxsize
+        self.clock = clock
+
+        # { key: (value, deadline, sequence) }, ordered from least to most recently used
+        self.__storage: collections.OrderedDict[K, Tuple[V, float, int]] = collections.OrderedDict()
+        # (deadline, sequence, key), an entry is stale once the key has been set again or removed
+        self.__heap: List[Tuple[float, int, K]] = []
+        self.__sequence = itertools.count()
+
+        self.hits = 0
+        self.misses = 0
+        self.expirations = 0
+        self.evictions = 0
+
+    def __repr__(self) -> str:
+        return f'<TTLDict size={len(self)} expiry={self.expiry} maxsize={self.maxsize}>'
 
     @property
     def expiry(self) -> datetime.timedelta:
         return self.__expiry
 
     @property
-    def storage(self) -> Dict[K, Tuple[V, datetime.datetime]]:
-        return self.__storage.copy()
-
-    def _purge(self) -> None:
-        for key, (_, time) in self.storage.items():
-            if (time + self.expiry) <= datetime.datetime.utcnow():
-                self.__storage.pop(key)
+    def stats(self) -> TTLDictStats:
+        return TTLDictStats(
+            size=len(self.__storage),
+            hits=self.hits,
+            misses=self.misses,
+            expirations=self.expirations,
+            evictions=self.evictions
+        )
+
+    def purge(self) -> int:
+        # Removes every expired entry and returns how many there were
+        now = self.clock()
+        heap, storage = self.__heap, self.__storage
+        expired = 0
+
+        while heap and heap[0][0] <= now:
+            _, sequence, key = heapq.heappop(heap)
+
+            entry = storage.get(key)
+            if entry is not None and entry[2] == sequence:
+                del storage[key]
+                expired += 1
+
+        if len(heap) > 2 * len(storage) + 32:
+            self.__heap = [(deadline, sequence, key) for key, (_, deadline, sequence) in storage.items()]
+            heapq.heapify(self.__heap)
+
+        self.expirations += expired
+        return expired
+
+    def set(self, key: K, value: V, *, ttl: Optional[Union[float, datetime.timedelta]] = None) -> None:
+        # `ttl` overrides `expiry` for this entry, in seconds or as a timedelta
+        self.purge()
+
+        if ttl is None:
+            ttl = self.__expiry
+        if isinstance(ttl, datetime.timedelta):
+            ttl = ttl.total_seconds()
+
+        deadline = self.clock() + ttl
+        sequence = next(self.__sequence)
+
+        storage = self.__storage
+        storage[key] = (value, deadline, sequence)
+        storage.move_to_end(key)
+
+        heapq.heappush(self.__heap, (deadline, sequence, key))
+
+        if self.maxsize is not None:
+            while len(storage) > self.maxsize:
+                storage.popitem(last=False)
+                self.evictions += 1
 
     def __getitem__(self, key: K) -> V:
-        self._purge()
-        if key not in self.__storage:
+        value = self.get(key, _MISSING)
+        if value is _MISSING:
             raise KeyError(key)
 
-        return self.__storage[key][0]
+        return value
 
     def __setitem__(self, key: K, value: V) -> None:
-        self._purge()
-        self.__storage[key] = (value, datetime.datetime.utcnow())
+        self.set(key, value)
 
     def __delitem__(self, key: K) -> None:
-        self._purge()
-        if key not in self.__storage:
-            raise KeyError(key)
-
+        self.purge()
         del self.__storage[key]
 
     def __contains__(self, key: K) -> bool:
+        self.purge()
         return key in self.__storage
 
     def __len__(self) -> int:
+        self.purge()
         return len(self.__storage)
 
-    def __iter__(self):
-        return iter(self.__storage)
+    def __iter__(self) -> Iterator[K]:
+        self.purge()
+        return iter(list(self.__storage))
 
     def keys(self) -> KeysView[K]:
+        self.purge()
         return self.__storage.keys()
 
     def values(self) -> ValuesView[V]:
-        return ValuesView(self)
+        self.purge()
+        return ValuesView({key: value for key, (value, _, _) in self.__storage.items()})
 
     def items(self) -> ItemsView[K, V]:
-        return ItemsView(self)
+        self.purge()
+        return ItemsView({key: value for key, (value, _, _) in self.__storage.items()})
 
     def get(self, key: K, default: Any = None) -> Any:
-        try:
-            return self[key]
-        except KeyError:
+        self.purge()
+
+        entry = self.__storage.get(key)
+        if entry is None:
+            self.misses += 1
             return default
 
+        self.hits += 1
+        self.__storage.move_to_end(key)
+
+        return entry[0]
+
     def pop(self, key: K, default: Any = None) -> Any:
-        try:
-            del self[key]
-        except KeyError:
-            return default
+        self.purge()
+
+        entry = self.__storage.pop(key, None)
+        return entry[0] if entry is not None else default
 
     def setdefault(self, key: K, value: V) -> V:
-        if key in self:
-            return self[key]
-        else:
-            self[key] = value
-            return value
\ No newline at end of file
+        existing = self.get(key, _MISSING)
+        if existing is not _MISSING:
+            return existing
+
+        self.set(key, value)
+        return value
+
+    def clear(self) -> None:
+        self.__storage.clear()
+        self.__heap.clear()
+
+    def start_reaper(self, interval: Optional[float] = None) -> None:
+        if not self.reaper.is_running():
+            self.reaper.change_interval(seconds=interval or self.REAPER_INTERVAL)
+            self.reaper.start()
+
+    def stop_reaper(self) -> None:
+        self.reaper.cancel()
+
+    @tasks.loop(seconds=60)
+    async def reaper(self) -> None:
+        self.purge()
@@ -1,4 +1,6 @@
-from typing import Iterable, List, Any, TypeVar, Tuple, Callable
+from __future__ import annotations
+
+from typing import Iterable, List, Any, NamedTuple, TypeVar, Tuple, Callable
 import enum
 import itertools
 
@@ -6,6 +8,8 @@ __all__ = (
     'chunk',
     'find',
     'parse_integer_ordering',
+    'IntegerOrdering',
+    'Order',
     'print_with_color',
     'Colors'
 )
@@ -36,22 +40,31 @@ def chunk(n: int, iterable: Iterable[T]) -> Iterable[Tuple[T, ...]]:
 def find(items: Iterable[T], predicate: Callable[[T], bool]) -> List[T]:
     return [item for item in items if predicate(item)]
 
+class IntegerOrdering(NamedTuple):
+    order: Order
+    value: int
+
+    @classmethod
+    def parse(cls, inp: str) -> IntegerOrdering:
+        order = Order.EQ
+
+        if inp[:1] == '>':
+            inp = inp[1:]; order = Order.GT
+        elif inp[:1] == '<':
+            inp = inp[1:]; order = Order.LT
+
+        return cls(order, int(inp))
+
+    def matches(self, comp: float) -> bool:
+        if self.order is Order.EQ:
+            return comp == self.value
+        elif self.order is Order.GT:
+            return comp > self.value
+        else:
+            return comp < self.value
+
 def parse_integer_ordering(inp: str, comp: int) -> bool:
-    order = Order.EQ
-    parsed = 0
-
-    if inp[0] == '>':
-        inp = inp[1:]; order = Order.GT
-    elif inp[0] == '<':
-        inp = inp[1:]; order = Order.LT
-
-    parsed = int(inp)
-    if order is Order.EQ:
-        return comp == parsed
-    elif order is Order.GT:
-        return comp > parsed
-    else:
-        return comp < parsed
+    return IntegerOrdering.parse(inp).matches(comp)
 
 def print_with_color(text: str, *values: str, **kwargs: Any) -> None:
     print(text.format(**Colors.__members__, **kwargs), *values)
\ No newline at end of file
@@ -0,0 +1,89 @@
+from __future__ import annotations
+
+from typing import Any, Dict, List, Tuple
+
+import asyncio
+import types
+import uuid
+
+from src.database.exp import ExpBuffer
+from src.database.pool import Pool
+from src.database.user import User
+
+class FakeStatements:
+    def __init__(self) -> None:
+        self.executed: List[Tuple[str, Tuple[Any, ...]]] = []
+
+    async def execute(self, name: str, *args: Any, connection: Any = None) -> str:
+        self.executed.append((name, args))
+        return 'OK'
+
+    async def fetch(self, name: str, *args: Any, connection: Any = None) -> List[Any]:
+        return []
+
+    def flushed(self) -> Dict[str, int]:
+        # { pokemon id: exp } of everything written through `pokemons.flush_exp`
+        flushed: Dict[str, int] = {}
+        for name, args in self.executed:
+            if name == 'pokemons.flush_exp':
+                flushed.update(zip(*args))
+
+        return flushed
+
+class FakePool:
+    # Just enough of `Pool` for releasing and reusing pokemons, the free pokemon bookkeeping is the real one
+    add_free_pokemon = Pool.add_free_pokemon
+    get_free_pokemon = Pool.get_free_pokemon
+
+    def __init__(self) -> None:
+        self.statements = FakeStatements()
+        self.exp = ExpBuffer(self) # type: ignore
+        self.free: Dict[int, Tuple[List[Any], List[Any]]] = {}
+        pokedex = types.SimpleNamespace(get_pokemon=lambda id: types.SimpleNamespace(id=id))
+        self.bot = types.SimpleNamespace(pokedex=pokedex)
+
+def make_record(owner_id: int, catch_id: int, *, exp: int = 0) -> Dict[str, Any]:
+    return {
+        'id': uuid.uuid4(),
+        'catch_id': catch_id,
+        'dex_id': 1,
+        'owner_id': owner_id,
+        'nickname': 'Bulbasaur',
+        'level': 5,
+        'exp': exp,
+        'ivs': [1, 2, 3, 4, 5, 6],
+        'evs': [0, 0, 0, 0, 0, 0],
+        'moves': ['tackle', None, None, None],
+        'nature': 'Hardy',
+        'is_shiny': False,
+        'is_starter': False,
+        'is_favourite': False,
+        'is_listed': False,
+    }
+
+def make_user(pool: FakePool, user_id: int, count: int) -> User:
+    record = {
+        'id': user_id, 'credits': 0, 'catch_id': count, 'selected': 1, 'detailed_pokemon_view': False, 'redeems': 0
+    }
+    return User(record, [make_record(user_id, catch_id) for catch_id in range(1, count + 1)], pool) # type: ignore
+
+def test_released_exp_does_not_follow_a_reused_pokemon():
+    async def run() -> None:
+        pool = FakePool()
+        old, new = make_user(pool, 1, 2), make_user(pool, 2, 1)
+
+        pokemon = old.pokemons[2]
+        await pokemon.add_exp(500)
+        assert pokemon.id in pool.exp.pending
+
+        await pokemon.release()
+        assert pokemon.id not in pool.exp.pending
+        assert 1 not in pool.exp.owners
+
+        reused = await new.add_pokemon(1, level=1, exp=0)
+        assert reused is pokemon and reused.entry.exp == 0
+
+        await pool.exp.flush()
+        assert str(pokemon.id) not in pool.statements.flushed()
+
+    asyncio.run(run())
@@ -0,0 +1,127 @@
+from __future__ import annotations
+
+from typing import List
+
+import collections
+import random
+
+from src.utils.pokedex import PokedexEntry, PokemonRarity, Rarity
+from src.utils.spawns import AliasTable, SpawnTable
+
+SAMPLES = 200_000
+# 99.9th percentile of the chi-square distribution with 50 degrees of freedom
+CHI_SQUARE_CUTOFF = 86.66
+
+def make_entry(
+    id: int,
+    *,
+    legendary: bool = False,
+    mythical: bool = False,
+    ultra_beast: bool = False,
+    event: bool = False,
+    is_form: bool = False,
+    enabled: bool = True,
+    catchable: bool = True,
+    spawn_weight: float = 1.0
+) -> PokedexEntry:
+    return PokedexEntry(
+        id=id,
+        dex=id,
+        rarity=PokemonRarity(mythical, legendary, ultra_beast, event),
+        is_form=is_form,
+        enabled=enabled,
+        catchable=catchable,
+        spawn_weight=spawn_weight
+    )
+
+def make_weights() -> List[float]:
+    # 50 random weights, plus one that can never be sampled and one that dominates
+    rng = random.Random(1234)
+    return [rng.uniform(0.1, 10) for _ in range(50)] + [0.0, 25.0]
+
+def test_alias_table_probabilities():
+    weights = make_weights()
+    table = AliasTable(list(range(len(weights))), weights)
+    total = sum(weights)
+
+    for index, weight in enumerate(weights):
+        assert abs(table.probability(index) - weight / total) < 1e-9
+
+def test_alias_table_distribution():
+    weights = make_weights()
+    table = AliasTable(list(range(len(weights))), weights, rng=random.Random(1))
+    total = sum(weights)
+
+    counts = collections.Counter(table.sample() for _ in range(SAMPLES))
+    assert counts[weights.index(0.0)] == 0
+
+    expected = [SAMPLES * table.probability(index) for index in range(len(weights))]
+    chi_square = sum(
+        (counts[index] - expected[index]) ** 2 / expected[index] for index, weight in enumerate(weights) if weight
+    )
+
+    assert sum(1 for weight in weights if weight) - 1 == 50
+    assert chi_square < CHI_SQUARE_CUTOFF
+
+def test_alias_table_rejects_invalid_weights():
+    for items, weights in (([1, 2], [1.0]), ([], []), ([1], [-1.0]), ([1, 2], [0.0, 0.0])):
+        try:
+            AliasTable(items, weights)
+        except ValueError:
+            pass
+        else:
+            raise AssertionError(f'{weights!r} should have been rejected')
+
+def test_spawn_table_buckets():
+    entries = [make_entry(id) for id in range(1, 801)]
+    entries += [
+        make_entry(900, legendary=True),
+        make_entry(901, legendary=True, spawn_weight=3.0),
+        make_entry(902, mythical=True),
+        make_entry(903, ultra_beast=True, enabled=False),
+        make_entry(950, is_form=True),
+        make_entry(951, enabled=False),
+        make_entry(952, catchable=False),
+        make_entry(953, event=True),
+    ]
+    table = SpawnTable(entries, rng=random.Random(2))
+
+    assert Rarity.UltraBeast not in table
+    assert table.sample(Rarity.UltraBeast) is None
+
+    common = {entry.id for entry in table.tables[Rarity.Common].items}
+    assert len(common) == 800
+    assert not common & {950, 951, 952, 953}
+
+    # Event pokemons don't spawn unless an event weight is set
+    assert Rarity.Event not in table
+
+    legendary = table.tables[Rarity.Legendary]
+    assert abs(legendary.probability(1) - 0.75) < 1e-9
+
+def test_spawn_table_with_weights():
+    entries = [make_entry(id) for id in range(1, 801)] + [make_entry(953, event=True), make_entry(954, event=True)]
+    table = SpawnTable(entries, rng=random.Random(3)).with_weights({1: 100.0, 954: 0.0})
+
+    common = table.tables[Rarity.Common]
+    assert Rarity.Event not in table
+
+    index = next(index for index, entry in enumerate(common.items) if entry.id == 1)
+    assert abs(common.probability(index) - 100 / 899) < 1e-9
+
+def test_spawn_table_events():
+    entries = [make_entry(id) for id in range(1, 101)]
+    entries += [make_entry(953, event=True), make_entry(954, event=True, is_form=True), make_entry(955, event=True)]
+    table = SpawnTable(entries, rng=random.Random(4)).with_weights({955: 0.0}, event_weight=25.0)
+
+    events = table.tables[Rarity.Event]
+    assert {entry.id for entry in events.items} == {953, 954}
+    assert not {entry.id for entry in table.tables[Rarity.Common].items} & {953, 954, 955}
+
+    # Common spawns draw from the event bucket in proportion to its weight: 50 out of 150
+    samples = 30_000
+    drawn = sum(table.sample(Rarity.Common).id in (953, 954) for _ in range(samples))
+    assert abs(drawn / samples - 1 / 3) < 0.02
+
+    assert table.sample(Rarity.Event).id in (953, 954)
+    assert table.with_weights({}, event_weight=0.0).sample(Rarity.Event) is None